@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+
+import boxIndex as bi
+import geometryBackend as gb
+import isohypsen_init_cmd as init
+import isohypsen_layout_cmd as layout
+import polylineSimplify as ps
+import quadSubdivision as qs
+import syntheticTerrain as st
+
+"""
+Stage benchmarks on synthetic terrain
+
+Runs the stages of isohypsen_init and isohypsen_layout headless on geometryBackend.PolylineBackend and writes the
+timings to a JSON file, two result files can be compared to spot regressions between commits. The command modules
+use Python 2 syntax, run with Python 2.7 or IronPython:
+
+    python benchmark.py --features 9 --levels 20 --vertices 400 --out before.json
+    python benchmark.py --features 9 --levels 20 --vertices 400 --out after.json --compare before.json
+"""
+
+STAGES = ["sort", "rebuild", "trim", "projection", "split", "polylabel"]
+
+
+def git_commit():
+    try:
+        out = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Timer:
+
+    def __init__(self):
+        self.runs = dict((s, []) for s in STAGES)
+
+    def time(self, stage, func, *args):
+        start = timeit.default_timer()
+        result = func(*args)
+        self.runs[stage].append(timeit.default_timer() - start)
+        return result
+
+
+def run_once(terrain, heights, vertices, parcels, tolerance, timer):
+    """
+    run every stage once on the same input
+    :return: dict of item counts
+    """
+    backend = gb.PolylineBackend(tolerance)
+    rings = st.contours(terrain, heights, vertices)
+    curves = [gb.Polyline(r, z) for z, level in rings for r in level]
+    boundary_ring = st.boundary(terrain)
+
+    # isohypsen_init
+    stack = timer.time("sort", init.sort_z, curves, True, backend)
+    polylines = [[backend.vertices(c, tolerance, False) for c in level.objects()] for level in stack]
+    polylines = timer.time("rebuild", lambda: [ps.simplify_batch(p, tolerance) for p in polylines])
+
+    def trim():
+        return [init.level_regions(level, stack, polylines, boundary_ring, tolerance) for level in stack]
+    regions = timer.time("trim", trim)
+
+    # isohypsen_layout on the surfaces of the init stage
+    surfaces = [gb.PlanarSurface(f.outer, f.holes, level.z) for level, faces in zip(stack, regions) for f in faces]
+    surface = layout.sort_by_z(surfaces, backend)
+    kadaster = [gb.Polyline(p, 0.0) for p in parcels]
+    kadaster_index = bi.BoxIndex([backend.bbox(k) for k in kadaster])
+    box = backend.bbox(gb.Polyline(boundary_ring))
+    dist = (box[2] - box[0]) * 1.1
+
+    layouts = [layout.LevelLayout(i, level.z) for i, level in enumerate(surface)]
+
+    def projection():
+        return [[layout.project_kadaster(kadaster, kadaster_index, r, tolerance) for r in level.regions]
+                for level in surface]
+    projected = timer.time("projection", projection)
+
+    def split():
+        guides = [layout.guide_borders(i, surface, dist, tolerance, layouts[i]) for i in range(len(surface))]
+        count = 0
+        for i, level in enumerate(surface):
+            for crvs in projected[i]:
+                # the guides lie in the slot of the level, move the engraving there as layout_level does
+                backend.move(crvs, ((i + 1) * dist, 0, -level.z))
+                if crvs and guides[i]:
+                    crvs = layout.inside_crv_del(layout.ccx_split(crvs, guides[i]), guides[i], True)
+                count += len(crvs)
+        return count
+    engraving = timer.time("split", split)
+
+    labels = [label[1] for level_layout in layouts for label in level_layout.labels]
+    timer.time("polylabel", lambda: [qs.label_point_rings(r, layout.LABEL_TOLERANCE, layout.LABEL_BUDGET)
+                                     for r in labels])
+
+    return {"curves": len(curves), "vertices": sum(len(r) for z, level in rings for r in level),
+            "levels": len(stack), "surfaces": len(surfaces), "parcels": len(parcels), "engraving": engraving,
+            "labels": len(labels)}
+
+
+def summary(runs):
+    ordered = sorted(runs)
+    return {"min": ordered[0], "median": ordered[len(ordered) // 2], "runs": runs}
+
+
+def compare(result, baseline, threshold):
+    """
+    print the median of every stage against a baseline
+    :return: list of the stages slower than threshold times the baseline
+    """
+    slower = []
+    print("stage        baseline       current    ratio")
+    for stage in STAGES:
+        old = baseline["stages"].get(stage)
+        new = result["stages"].get(stage)
+        if not old or not new:
+            continue
+        ratio = new["median"] / old["median"] if old["median"] > 0 else float("inf")
+        print("%-10s %10.4fs %12.4fs %8.2f" % (stage, old["median"], new["median"], ratio))
+        if ratio > threshold:
+            slower.append(stage)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="time the isohypsen stages on synthetic terrain")
+    parser.add_argument("--features", type=int, default=9, help="number of hills, ridges and islands")
+    parser.add_argument("--levels", type=int, default=20, help="number of contour levels")
+    parser.add_argument("--vertices", type=int, default=200, help="vertices per contour ring")
+    parser.add_argument("--parcels", type=int, default=500, help="number of cadastre parcels")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="model tolerance")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the median is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="JSON file for the results")
+    parser.add_argument("--compare", help="JSON file of an earlier run")
+    parser.add_argument("--threshold", type=float, default=1.1, help="ratio above which a stage counts as slower")
+    args = parser.parse_args(argv)
+
+    terrain = st.features(args.features, seed=args.seed)
+    heights = st.levels(terrain, args.levels)
+    parcels = st.cadastre(st.extent(terrain), args.parcels, args.seed)
+
+    timer = Timer()
+    counts = None
+    for n in range(args.repeat):
+        counts = run_once(terrain, heights, args.vertices, parcels, args.tolerance, timer)
+
+    result = {"commit": git_commit(), "python": platform.python_implementation() + " " + platform.python_version(),
+              "numpy": qs.np is not None, "params": vars(args), "counts": counts,
+              "stages": dict((s, summary(timer.runs[s])) for s in STAGES)}
+    for stage in STAGES:
+        print("%-10s %10.4fs" % (stage, result["stages"][stage]["median"]))
+    if args.out:
+        f = open(args.out, "w")
+        try:
+            json.dump(result, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+    if args.compare:
+        f = open(args.compare)
+        try:
+            baseline = json.load(f)
+        finally:
+            f.close()
+        if compare(result, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
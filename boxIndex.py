@@ -0,0 +1,87 @@
+"""
+Uniform grid over 2d bounding boxes
+
+Answers which of a set of boxes overlap a query box without testing every pair. Boxes are tuples
+(min_x, min_y, max_x, max_y), items are the positions of the boxes in the list the index was built from.
+"""
+
+# boxes spanning more grid cells than this are kept in a list that every query checks
+MAX_BOX_CELLS = 1024
+
+
+class BoxIndex:
+
+    def __init__(self, boxes, cell_size=None):
+        """
+        bucket a list of boxes into a uniform grid
+        :param boxes: list of boxes (min_x, min_y, max_x, max_y)
+        :param cell_size: float, edge length of a grid cell, the average box extent if None
+        """
+        self.boxes = boxes
+        if cell_size is None:
+            extent = 0.0
+            for b in boxes:
+                extent += max(b[2] - b[0], b[3] - b[1])
+            cell_size = extent / len(boxes) if boxes else 1.0
+        if cell_size <= 0:
+            # points only, spread them over about as many cells as there are points
+            cell_size = max(bounds_extent(boxes) / max(len(boxes), 1) ** 0.5, 1e-9)
+        self.cell_size = cell_size
+
+        self.cells = {}
+        self.large = []
+        for n, b in enumerate(boxes):
+            i0, j0, i1, j1 = self.cell_range(b)
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > MAX_BOX_CELLS:
+                self.large.append(n)
+                continue
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    self.cells.setdefault((i, j), []).append(n)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def cell_range(self, box):
+        return (int(box[0] // self.cell_size), int(box[1] // self.cell_size),
+                int(box[2] // self.cell_size), int(box[3] // self.cell_size))
+
+    def query_cells(self, box):
+        i0, j0, i1, j1 = self.cell_range(box)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):
+            # a query larger than the occupied grid, visit the occupied cells only
+            for (i, j) in self.cells:
+                if i0 <= i <= i1 and j0 <= j <= j1:
+                    yield (i, j)
+            return
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                yield (i, j)
+
+    def query(self, box):
+        """
+        all boxes overlapping the query box
+        :param box: tuple (min_x, min_y, max_x, max_y)
+        :return: sorted list of items
+        """
+        found = set(n for n in self.large if overlaps(self.boxes[n], box))
+        for cell in self.query_cells(box):
+            for n in self.cells.get(cell, ()):
+                if n not in found and overlaps(self.boxes[n], box):
+                    found.add(n)
+        return sorted(found)
+
+
+def overlaps(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def bounds_extent(boxes):
+    if not boxes:
+        return 1.0
+    return max(max(b[2] for b in boxes) - min(b[0] for b in boxes),
+               max(b[3] for b in boxes) - min(b[1] for b in boxes))
+
+
+def point_box(x, y):
+    return (x, y, x, y)
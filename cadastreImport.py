@@ -0,0 +1,145 @@
+import io
+
+"""
+Streaming prefilter for cadastre DXF files
+
+Survey files hold hundreds of thousands of entities on layers that isohypsen_layers throws away anyway. The file is
+read as a stream of group code/value pairs and copied record by record: entities and layer table entries of
+cadastre layers (names starting with "0") that are not kept are dropped, the kept ones get their descriptive name,
+everything else passes unchanged. Only one record is held in memory at a time, the LAYER table is buffered to fix its
+entry count. Sub-entities (VERTEX, ATTRIB, SEQEND) follow the decision of the POLYLINE or INSERT they belong to.
+
+The file is decoded as latin-1, which maps every byte to one character, so the text of the entities comes out byte
+for byte whatever the code page of the file.
+"""
+
+ENCODING = "latin-1"
+SUB_ENTITIES = ("VERTEX", "ATTRIB", "SEQEND")
+
+
+def read_pairs(f):
+    """
+    group code/value pairs of a DXF file
+    :param f: text file
+    :return: generator of (code, value) strings, the code without blanks
+    """
+    while True:
+        code = f.readline()
+        if not code:
+            return
+        value = f.readline()
+        yield code.strip(), value.rstrip("\r\n")
+
+
+def read_records(f):
+    """
+    records of a DXF file, every record starts with a group code 0
+    :return: generator of lists of (code, value)
+    """
+    record = []
+    for code, value in read_pairs(f):
+        if code == "0" and record:
+            yield record
+            record = []
+        record.append((code, value))
+    if record:
+        yield record
+
+
+def field(record, code):
+    for c, value in record:
+        if c == code:
+            return value
+    return None
+
+
+def layer_name(name, keep):
+    """
+    new name of a layer
+    :param name: layer name in the file
+    :param keep: dict layer code: description of the kept cadastre layers
+    :return: the new name, the unchanged name of other layers or None for cadastre layers that are dropped
+    """
+    if not name or name[0] != "0" or name == "0":
+        return name
+    code = name.split(" ")[0]
+    if code not in keep:
+        return None
+    return code + " " + keep[code]
+
+
+def renamed(record, code, name):
+    return [(c, name if c == code else value) for c, value in record]
+
+
+def filter_dxf(path, out_path, keep, encoding=ENCODING):
+    """
+    copy a DXF file without the entities and layers of the cadastre layers that are not kept
+    :param path: DXF file
+    :param out_path: compact DXF file
+    :param keep: dict layer code: description, e.g. {"01211": "Buildings"}, kept layers are named "01211 Buildings"
+    :param encoding: encoding used to read and write the file
+    :return: tuple (number of kept entities, number of dropped entities)
+    """
+    kept = dropped = 0
+    section = None
+    layer_table = None  # buffered records of the LAYER table
+    keep_following = True  # decision for the sub-entities of the last POLYLINE or INSERT
+
+    f = io.open(path, "r", encoding=encoding, newline=None)
+    out = io.open(out_path, "w", encoding=encoding, newline="\n")
+    try:
+        for record in read_records(f):
+            kind = record[0][1]
+
+            if kind == "SECTION":
+                section = field(record, "2")
+            elif kind == "ENDSEC":
+                section = None
+            elif section == "TABLES" and kind == "TABLE" and field(record, "2") == "LAYER":
+                layer_table = [record]
+                continue
+            elif layer_table is not None:
+                if kind == "ENDTAB":
+                    write_layer_table(out, layer_table)
+                    layer_table = None
+                    continue
+                if kind == "LAYER":
+                    name = layer_name(field(record, "2"), keep)
+                    if name is not None:
+                        layer_table.append(renamed(record, "2", name))
+                    continue
+                layer_table.append(record)
+                continue
+            elif section == "ENTITIES":
+                layer = field(record, "8")
+                name = layer_name(layer, keep)
+                if kind in SUB_ENTITIES:
+                    if not keep_following:
+                        continue
+                else:
+                    keep_following = layer is None or name is not None
+                    if not keep_following:
+                        dropped += 1
+                        continue
+                    kept += 1
+                if name is not None and name != layer:
+                    record = renamed(record, "8", name)
+
+            for code, value in record:
+                out.write(u"%s\n%s\n" % (code, value))
+    finally:
+        f.close()
+        out.close()
+    return kept, dropped
+
+
+def write_layer_table(out, records):
+    """
+    write the buffered LAYER table with the number of remaining entries
+    """
+    count = len([r for r in records if r[0][1] == "LAYER"])
+    header = [(c, str(count) if c == "70" else value) for c, value in records[0]]
+    for record in [header] + records[1:] + [[("0", "ENDTAB")]]:
+        for code, value in record:
+            out.write(u"%s\n%s\n" % (code, value))
@@ -0,0 +1,216 @@
+import math
+
+"""
+Removal of coincident edges
+
+Shared borders, duplicated curves and kadaster lines that lie on top of each other would be cut or engraved twice.
+The polylines are processed in order, every segment is compared with the segments kept so far and loses the parts
+another segment already covers within the tolerance. The kept segments are hashed by their direction, quantized to
+ANGLE_STEP, and the grid cells they pass, so a segment is only compared with nearly parallel segments close to it.
+Overlaps shorter than about 2 * tolerance / ANGLE_STEP between segments that are not exactly parallel can be missed.
+
+What is left of a polyline is joined into runs again, a ring that loses a part becomes one open polyline. Polylines
+are lists of [x, y] vertices, closed rings repeat their first vertex at the end.
+"""
+
+ANGLE_STEP = math.radians(2.0)
+ANGLE_BUCKETS = int(math.ceil(math.pi / ANGLE_STEP))
+
+
+class SegmentHash:
+
+    def __init__(self, cell_size, tolerance):
+        """
+        spatial hash of segments by direction and grid cell
+        :param cell_size: edge length of a grid cell
+        :param tolerance: float, distance within which segments coincide
+        """
+        self.cell_size = cell_size
+        self.tolerance = tolerance
+        self.cells = {}  # (angle bucket, i, j): list of segments
+        self.segments = []
+
+    def angle_bucket(self, a, b):
+        angle = math.atan2(b[1] - a[1], b[0] - a[0]) % math.pi
+        return int(angle / ANGLE_STEP) % ANGLE_BUCKETS
+
+    def cell_range(self, a, b):
+        t = self.tolerance
+        s = self.cell_size
+        return (int(math.floor((min(a[0], b[0]) - t) / s)), int(math.floor((min(a[1], b[1]) - t) / s)),
+                int(math.floor((max(a[0], b[0]) + t) / s)), int(math.floor((max(a[1], b[1]) + t) / s)))
+
+    def add(self, a, b):
+        n = len(self.segments)
+        self.segments.append((a, b))
+        bucket = self.angle_bucket(a, b)
+        i0, j0, i1, j1 = self.cell_range(a, b)
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                self.cells.setdefault((bucket, i, j), []).append(n)
+
+    def candidates(self, a, b):
+        """
+        kept segments in the same or a neighbouring direction whose cells overlap those of a-b
+        :return: set of segment indices
+        """
+        bucket = self.angle_bucket(a, b)
+        i0, j0, i1, j1 = self.cell_range(a, b)
+        found = set()
+        for db in (-1, 0, 1):
+            nb = (bucket + db) % ANGLE_BUCKETS
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    found.update(self.cells.get((nb, i, j), ()))
+        return found
+
+
+def overlap(a, b, c, d, tolerance):
+    """
+    part of the segment a-b that the segment c-d covers within tolerance
+    :return: tuple (t0, t1) of parameters on a-b or None
+    """
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return None
+    length = math.sqrt(length_sq)
+    tc = ((c[0] - a[0]) * dx + (c[1] - a[1]) * dy) / length_sq
+    td = ((d[0] - a[0]) * dx + (d[1] - a[1]) * dy) / length_sq
+    # signed distances of c and d from the line through a-b
+    hc = (dx * (c[1] - a[1]) - dy * (c[0] - a[0])) / length
+    hd = (dx * (d[1] - a[1]) - dy * (d[0] - a[0])) / length
+    if tc > td:
+        tc, td, hc, hd = td, tc, hd, hc
+    t0 = max(0.0, tc)
+    t1 = min(1.0, td)
+    if (t1 - t0) * length <= tolerance:
+        return None
+    # c-d has to stay within tolerance along the whole overlap
+    for t in (t0, t1):
+        if abs(hc + (hd - hc) * (t - tc) / (td - tc)) > tolerance:
+            return None
+    return t0, t1
+
+
+def uncovered(intervals, length, tolerance):
+    """
+    parts of the parameter range 0..1 outside the covered intervals, slivers shorter than tolerance are dropped
+    :param intervals: list of (t0, t1)
+    :param length: length of the segment
+    :return: list of (t0, t1)
+    """
+    result = []
+    t = 0.0
+    for t0, t1 in sorted(intervals):
+        if (t0 - t) * length > tolerance:
+            result.append((t, t0))
+        t = max(t, t1)
+    if (1.0 - t) * length > tolerance:
+        result.append((t, 1.0))
+    return result
+
+
+def point_at(a, b, t):
+    if t == 0.0:
+        return [a[0], a[1]]
+    if t == 1.0:
+        return [b[0], b[1]]
+    return [a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1])]
+
+
+def remove_coincident(polylines, tolerance, cell_size=None):
+    """
+    drop the parts of the polylines that lie on top of parts of earlier polylines or of themselves
+    :param polylines: list of polylines, earlier polylines win
+    :param tolerance: float, distance within which two segments coincide
+    :param cell_size: edge length of the hash cells, default is the mean segment length
+    :return: list with None for every unchanged polyline and the list of remaining polylines for the others
+    """
+    if cell_size is None:
+        lengths = [math.hypot(p[k + 1][0] - p[k][0], p[k + 1][1] - p[k][1])
+                   for p in polylines for k in range(len(p) - 1)]
+        cell_size = max(sum(lengths) / max(len(lengths), 1), 10.0 * tolerance)
+    kept = SegmentHash(cell_size, tolerance)
+
+    result = []
+    for points in polylines:
+        runs = []
+        run = None
+        changed = False
+        for k in range(len(points) - 1):
+            a = points[k]
+            b = points[k + 1]
+            length = math.hypot(b[0] - a[0], b[1] - a[1])
+            if length == 0:
+                continue
+            covered = []
+            for n in kept.candidates(a, b):
+                part = overlap(a, b, kept.segments[n][0], kept.segments[n][1], tolerance)
+                if part is not None:
+                    covered.append(part)
+            pieces = uncovered(covered, length, tolerance) if covered else [(0.0, 1.0)]
+            if pieces != [(0.0, 1.0)]:
+                changed = True
+            for t0, t1 in pieces:
+                p0 = point_at(a, b, t0)
+                p1 = point_at(a, b, t1)
+                if run is not None and t0 == 0.0 and run[-1] == p0:
+                    run.append(p1)
+                else:
+                    run = [p0, p1]
+                    runs.append(run)
+                kept.add(p0, p1)
+            if not pieces or pieces[-1][1] != 1.0:
+                run = None
+        result.append(join_runs(runs) if changed else None)
+    return result
+
+
+def join_runs(runs):
+    """
+    join runs whose ends meet where no third run ends
+    :param runs: list of polylines
+    :return: list of polylines
+    """
+    ends = {}
+    for n, run in enumerate(runs):
+        ends.setdefault(tuple(run[0]), []).append(n)
+        ends.setdefault(tuple(run[-1]), []).append(n)
+
+    def follow(point, n):
+        """
+        the only other run that ends at point
+        """
+        others = ends.get(tuple(point), [])
+        if len(others) != 2:
+            return None
+        m = others[1] if others[0] == n else others[0]
+        return None if m == n else m
+
+    used = [False] * len(runs)
+    result = []
+    for n in range(len(runs)):
+        if used[n]:
+            continue
+        used[n] = True
+        chain = list(runs[n])
+        # forward from the end, then backward from the start
+        for forward in (True, False):
+            current = n
+            while True:
+                point = chain[-1] if forward else chain[0]
+                m = follow(point, current)
+                if m is None or used[m]:
+                    break
+                used[m] = True
+                if forward:
+                    other = runs[m] if runs[m][0] == point else runs[m][::-1]
+                    chain.extend(other[1:])
+                else:
+                    other = runs[m] if runs[m][-1] == point else runs[m][::-1]
+                    chain[:0] = other[:-1]
+                current = m
+        result.append(chain)
+    return result
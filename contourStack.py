@@ -0,0 +1,157 @@
+import geometryBackend as gb
+
+"""
+Contour objects grouped into levels by their Z value
+
+Shared by isohypsen_init (open contour curves) and isohypsen_layout (contour surfaces). The objects are bucketed by
+quantized Z in one pass, geometric properties of every region are computed on first use and cached for the rest
+of the run.
+"""
+
+
+class Region:
+
+    def __init__(self, obj, backend):
+        """
+        one contour object with cached properties
+        :param obj: curve or surface, a document id or backend geometry
+        :param backend: geometryBackend backend that evaluates the object
+        """
+        self.obj = obj
+        self.backend = backend
+        self.surface = backend.is_surface(obj)
+        self._area = None
+        self._centroid = None
+        self._bbox = None
+        self._geometry = None
+        self._border = None
+        self._largest_border = None
+        if self.surface:
+            self.z = self.centroid()[2]
+        else:
+            self.z = backend.mid_point(obj)[2]
+
+    def area(self):
+        """
+        area of a surface or closed curve, 0 for open curves
+        """
+        if self._area is None:
+            self._area = self.backend.area(self.obj)
+        return self._area
+
+    def centroid(self):
+        """
+        area centroid of a surface or closed curve, midpoint of an open curve
+        """
+        if self._centroid is None:
+            self._centroid = self.backend.centroid(self.obj)
+        return self._centroid
+
+    def bbox(self):
+        """
+        2d bounding box
+        :return: tuple (min_x, min_y, max_x, max_y)
+        """
+        if self._bbox is None:
+            self._bbox = self.backend.bbox(self.obj)
+        return self._bbox
+
+    def geometry(self):
+        """
+        surface geometry of the region, read from the document once
+        """
+        if self._geometry is None:
+            self._geometry = self.backend.surface(self.obj)
+        return self._geometry
+
+    def border(self, tolerance):
+        """
+        joined border curves of a surface, computed once, every call returns fresh copies
+        :param tolerance: join tolerance
+        :return: list of curves
+        """
+        if self._border is None:
+            self._border = self.backend.border(self.geometry(), tolerance)
+        return [self.backend.duplicate(c) for c in self._border]
+
+    def largest_border(self, tolerance):
+        """
+        index of the border curve that encloses the largest area
+        :param tolerance: join tolerance
+        :return: int
+        """
+        if self._largest_border is None:
+            areas = [self.backend.area(c) for c in self.border(tolerance)]
+            self._largest_border = areas.index(max(areas)) if areas else 0
+        return self._largest_border
+
+
+class Level:
+
+    def __init__(self, index, z, regions):
+        """
+        all regions at the same height
+        :param index: position in the stack
+        :param z: quantized height
+        :param regions: list of Region
+        """
+        self.index = index
+        self.z = z
+        self.regions = regions
+
+    def __len__(self):
+        return len(self.regions)
+
+    def objects(self):
+        return [r.obj for r in self.regions]
+
+
+class ContourStack:
+
+    def __init__(self, objects, quantum=None, descending=True, backend=None):
+        """
+        bucket objects into levels by quantized Z
+        :param objects: curves or surfaces, document ids or backend geometry
+        :param quantum: float, Z values closer than this share a level, None groups by exact Z
+        :param descending: True = top level first, False = bottom level first
+        :param backend: geometryBackend backend, the Rhino backend inside Rhino
+        """
+        self.descending = descending
+        self.backend = backend or gb.default_backend()
+        buckets = {}
+        for o in objects:
+            region = Region(o, self.backend)
+            key = region.z if quantum is None else int(round(region.z / quantum))
+            buckets.setdefault(key, []).append(region)
+
+        self.levels = []
+        for key in sorted(buckets, reverse=descending):
+            z = key if quantum is None else key * quantum
+            self.levels.append(Level(len(self.levels), z, buckets[key]))
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __getitem__(self, i):
+        return self.levels[i]
+
+    def __iter__(self):
+        return iter(self.levels)
+
+    def above(self, level):
+        """
+        next higher level or None
+        """
+        i = level.index - 1 if self.descending else level.index + 1
+        if 0 <= i < len(self.levels):
+            return self.levels[i]
+        return None
+
+    def below(self, level):
+        """
+        next lower level or None
+        """
+        i = level.index + 1 if self.descending else level.index - 1
+        if 0 <= i < len(self.levels):
+            return self.levels[i]
+        return None
@@ -0,0 +1,480 @@
+import math
+
+import boxIndex as bi
+import planarRegions as pr
+
+try:
+    import Rhino
+    import rhinoscriptsyntax as rs
+    import scriptcontext as sc
+    from Rhino.Geometry import Curve, Plane, Point3d, PolylineCurve, Transform, Vector3d
+    from Rhino.Geometry.Intersect import Intersection
+except ImportError:  # headless, only the polyline backend is available
+    Rhino = rs = sc = None
+
+"""
+Geometry backends for the isohypsen pipeline
+
+The pipeline only needs a handful of operations: bounding box, area/centroid, border, move, rotation,
+discretization, closest point, point in curve, intersection, split and the projection onto horizontal contour
+surfaces.
+RhinoBackend runs them on RhinoCommon geometry or document ids, PolylineBackend on plain polylines and planar
+regions, so layout, sorting and labelling can run without Rhino, e.g. on a build server or in worker processes.
+
+Points are returned as indexable [x, y, z] triples, bounding boxes as 2d tuples (min_x, min_y, max_x, max_y).
+"""
+
+
+def default_backend():
+    """
+    RhinoBackend inside Rhino, PolylineBackend everywhere else
+    """
+    if rs is not None:
+        return RhinoBackend()
+    return PolylineBackend()
+
+
+class RhinoBackend:
+
+    def tolerance(self):
+        return sc.doc.ModelAbsoluteTolerance
+
+    def curve(self, obj):
+        return rs.coercecurve(obj)
+
+    def surface(self, obj):
+        return rs.coercebrep(obj)
+
+    def is_surface(self, obj):
+        return rs.IsSurface(obj) or rs.IsPolysurface(obj)
+
+    def bbox(self, obj):
+        bbox = rs.coercegeometry(obj).GetBoundingBox(True)
+        return (bbox.Min.X, bbox.Min.Y, bbox.Max.X, bbox.Max.Y)
+
+    def area(self, obj):
+        """
+        area of a surface or closed curve, 0 for open curves
+        """
+        if self.is_surface(obj):
+            return rs.SurfaceArea(obj)[0]
+        if rs.IsCurveClosed(obj):
+            return rs.CurveArea(obj)[0]
+        return 0.0
+
+    def centroid(self, obj):
+        """
+        area centroid of a surface or closed curve, midpoint of an open curve
+        """
+        if self.is_surface(obj):
+            return rs.SurfaceAreaCentroid(obj)[0]
+        if rs.IsCurveClosed(obj):
+            return rs.CurveAreaCentroid(obj)[0]
+        return self.mid_point(obj)
+
+    def mid_point(self, crv):
+        return rs.CurveMidPoint(crv)
+
+    def length(self, crv):
+        return rs.coercecurve(crv).GetLength()
+
+    def border(self, srf, tolerance):
+        """
+        joined border curves of a surface, geometry counterpart of rs.DuplicateSurfaceBorder
+        """
+        edges = rs.coercebrep(srf).DuplicateNakedEdgeCurves(True, True)
+        return list(Curve.JoinCurves(edges, tolerance))
+
+    def duplicate(self, crv):
+        return rs.coercecurve(crv).DuplicateCurve()
+
+    def fingerprint(self, obj):
+        """
+        the geometry as text, equal for equal geometry, e.g. to find the objects that were edited since the last run
+        :param obj: curve or surface, a document id or geometry
+        :return: string of the NURBS control points and knots of the curve or of the surfaces and edges of the brep
+        """
+        geometry = rs.coercegeometry(obj)
+        parts = []
+        if isinstance(geometry, Curve):
+            curves = [geometry.ToNurbsCurve()]
+        else:
+            brep = rs.coercebrep(obj)
+            for face in brep.Faces:
+                srf = face.UnderlyingSurface().ToNurbsSurface()
+                parts.append("%d,%d" % (srf.Degree(0), srf.Degree(1)))
+                parts.extend("%r,%r,%r,%r" % (p.Location.X, p.Location.Y, p.Location.Z, p.Weight) for p in srf.Points)
+            curves = [edge.ToNurbsCurve() for edge in brep.Edges]
+        for crv in curves:
+            parts.append(str(crv.Degree))
+            parts.extend("%r,%r,%r,%r" % (p.Location.X, p.Location.Y, p.Location.Z, p.Weight) for p in crv.Points)
+            parts.extend(repr(k) for k in crv.Knots)
+        return ";".join(parts)
+
+    def end_points(self, crv):
+        """
+        :return: tuple (start point, end point), equal for closed curves
+        """
+        crv = rs.coercecurve(crv)
+        start = crv.PointAtStart
+        end = crv.PointAtEnd
+        return [start.X, start.Y, start.Z], [end.X, end.Y, end.Z]
+
+    def reverse(self, crv):
+        rs.coercecurve(crv).Reverse()
+
+    def polyline(self, points, z=0.0):
+        """
+        new polyline curve through [x, y, z] vertices or 2d vertices at height z
+        """
+        return PolylineCurve([Point3d(p[0], p[1], p[2] if len(p) > 2 else z) for p in points])
+
+    def text_outlines(self, text, font, height):
+        """
+        outlines of a left aligned text with the start of the baseline at the origin, adds a text object to the
+        document, explodes it and deletes the pieces
+        :return: list of curves
+        """
+        text_id = rs.AddText(text, (0, 0, 0), height, font, 0, 1)
+        ids = rs.ExplodeText(text_id, True) or []
+        curves = [rs.coercecurve(i).DuplicateCurve() for i in ids if rs.IsCurve(i)]
+        rs.DeleteObjects(ids)
+        return curves
+
+    def move(self, crvs, vector):
+        translation = Vector3d(vector[0], vector[1], vector[2])
+        for c in crvs:
+            c.Translate(translation)
+
+    def rotate(self, crvs, angle, center):
+        """
+        rotate curves around a vertical axis
+        :param angle: float, radians counterclockwise
+        :param center: [x, y] of the axis
+        """
+        rotation = Transform.Rotation(angle, Vector3d.ZAxis, Point3d(center[0], center[1], 0))
+        for c in crvs:
+            c.Transform(rotation)
+
+    def vertices(self, crv, tolerance, closed=True, z=False):
+        """
+        discretize a curve into vertices
+        :param tolerance: float, maximum deviation of the polyline from the curve
+        :param closed: True = repeat the first vertex at the end, False = keep open curves open
+        :param z: True = keep the height, [x, y, z] vertices
+        :return: list of [x, y] vertices, [x, y, z] vertices if z is True
+        """
+        curve = rs.coercecurve(crv)
+        is_polyline, polyline = curve.TryGetPolyline()
+        if not is_polyline:
+            polyline_crv = curve.ToPolyline(0, 0, 0.1, 0, 0, tolerance, 0, 0, True)
+            is_polyline, polyline = polyline_crv.TryGetPolyline()
+        if z:
+            ring = [[pt.X, pt.Y, pt.Z] for pt in polyline]
+        else:
+            ring = [[pt.X, pt.Y] for pt in polyline]
+        if closed and ring[0] != ring[-1]:
+            ring.append(ring[0])
+        return ring
+
+    def closest_point(self, crv, pt):
+        param = rs.CurveClosestPoint(crv, pt)
+        return rs.EvaluateCurve(crv, param)
+
+    def point_in_curve(self, pt, crv):
+        return rs.PointInPlanarClosedCurve(pt, crv) != 0
+
+    def intersect(self, a, b, tolerance):
+        """
+        parameters on curve a where it crosses curve b
+        """
+        events = Intersection.CurveCurve(a, b, tolerance, tolerance)
+        if not events:
+            return []
+        return [e.ParameterA for e in events if e.IsPoint]
+
+    def split(self, crv, params):
+        """
+        split a curve at a list of parameters
+        :return: list of curves, the curve itself if nothing was split
+        """
+        pieces = crv.Split(sorted(params)) if params else None
+        if pieces:
+            return list(pieces)
+        return [crv]
+
+    def horizontal_z(self, srf, tolerance):
+        """
+        height of a single faced, planar and horizontal surface
+        :return: float or None
+        """
+        brep = rs.coercebrep(srf)
+        if brep.Faces.Count != 1:
+            return None
+        is_planar, plane = brep.Faces[0].TryGetPlane(tolerance)
+        if not is_planar or abs(abs(plane.Normal.Z) - 1.0) > 1e-9:
+            return None
+        return plane.OriginZ
+
+    def flatten(self, crv, z):
+        """
+        copy of a curve projected onto the horizontal plane at z
+        :return: curve or None
+        """
+        c = rs.coercecurve(crv).DuplicateCurve()
+        if c.Transform(Transform.PlanarProjection(Plane(Point3d(0, 0, z), Vector3d.ZAxis))):
+            return c
+        return None
+
+    def project(self, crvs, srf, tolerance):
+        """
+        general projection onto a surface in -Z
+        """
+        return list(Curve.ProjectToBrep(crvs, [rs.coercebrep(srf)], Vector3d(0, 0, -1), tolerance))
+
+
+class Polyline:
+
+    def __init__(self, points, z=0.0):
+        """
+        polyline geometry for the headless backend
+        :param points: list of [x, y, z] or [x, y] vertices, 2d vertices get the height z
+        :param z: height of 2d vertices
+        """
+        self.points = [[p[0], p[1], p[2] if len(p) > 2 else z] for p in points]
+        self._index = None
+
+    def closed(self):
+        return len(self.points) > 2 and self.points[0] == self.points[-1]
+
+    def segment_index(self):
+        """
+        boxIndex.BoxIndex over the segments, built on first use
+        """
+        if self._index is None:
+            self._index = bi.BoxIndex([pr.segment_box(self.points[k], self.points[k + 1])
+                                       for k in range(len(self.points) - 1)])
+        return self._index
+
+
+class PlanarSurface:
+
+    def __init__(self, outer, holes=None, z=0.0):
+        """
+        horizontal planar region for the headless backend
+        :param outer: vertex ring of the outline
+        :param holes: list of vertex rings
+        :param z: height of the region
+        """
+        self.outer = [[v[0], v[1]] for v in outer]
+        self.holes = [[[v[0], v[1]] for v in h] for h in holes or []]
+        self.z = z
+
+
+class PolylineBackend:
+
+    def __init__(self, tolerance=0.001):
+        self.model_tolerance = tolerance
+
+    def tolerance(self):
+        return self.model_tolerance
+
+    def curve(self, obj):
+        return obj
+
+    def surface(self, obj):
+        return obj
+
+    def is_surface(self, obj):
+        return isinstance(obj, PlanarSurface)
+
+    def bbox(self, obj):
+        if self.is_surface(obj):
+            return pr.ring_box(obj.outer)
+        return pr.ring_box(obj.points)
+
+    def area(self, obj):
+        if self.is_surface(obj):
+            return abs(pr.ring_area(obj.outer)) - sum(abs(pr.ring_area(h)) for h in obj.holes)
+        if obj.closed():
+            return abs(pr.ring_area(obj.points))
+        return 0.0
+
+    def centroid(self, obj):
+        if self.is_surface(obj):
+            rings = [(obj.outer, 1.0)] + [(h, -1.0) for h in obj.holes]
+            z = obj.z
+        elif obj.closed():
+            rings = [(obj.points, 1.0)]
+            z = obj.points[0][2]
+        else:
+            return self.mid_point(obj)
+        area = cx = cy = 0.0
+        for ring, sign in rings:
+            # orient every ring so the outline adds and the holes subtract
+            a = pr.ring_area(ring)
+            orientation = sign if a >= 0 else -sign
+            for k in range(len(ring) - 1):
+                cross = (ring[k][0] * ring[k + 1][1] - ring[k + 1][0] * ring[k][1]) * orientation
+                area += cross
+                cx += (ring[k][0] + ring[k + 1][0]) * cross
+                cy += (ring[k][1] + ring[k + 1][1]) * cross
+        if area == 0:
+            box = self.bbox(obj)
+            return [(box[0] + box[2]) / 2.0, (box[1] + box[3]) / 2.0, z]
+        return [cx / (3.0 * area), cy / (3.0 * area), z]
+
+    def mid_point(self, crv):
+        return self.point_at_length(crv, self.length(crv) / 2.0)
+
+    def point_at_length(self, crv, length):
+        pts = crv.points
+        for k in range(len(pts) - 1):
+            a = pts[k]
+            b = pts[k + 1]
+            segment = math.sqrt((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2 + (b[2] - a[2]) ** 2)
+            if segment >= length and segment > 0:
+                t = length / segment
+                return [a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1]), a[2] + t * (b[2] - a[2])]
+            length -= segment
+        return list(pts[-1])
+
+    def length(self, crv):
+        pts = crv.points
+        total = 0.0
+        for k in range(len(pts) - 1):
+            a = pts[k]
+            b = pts[k + 1]
+            total += math.sqrt((b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2 + (b[2] - a[2]) ** 2)
+        return total
+
+    def border(self, srf, tolerance):
+        return [Polyline(srf.outer, srf.z)] + [Polyline(h, srf.z) for h in srf.holes]
+
+    def duplicate(self, crv):
+        return Polyline(crv.points)
+
+    def fingerprint(self, obj):
+        if self.is_surface(obj):
+            return repr((obj.outer, obj.holes, obj.z))
+        return repr(obj.points)
+
+    def end_points(self, crv):
+        return list(crv.points[0]), list(crv.points[-1])
+
+    def reverse(self, crv):
+        crv.points.reverse()
+        crv._index = None
+
+    def polyline(self, points, z=0.0):
+        return Polyline(points, z)
+
+    def text_outlines(self, text, font, height):
+        """
+        stand-in outlines of a monospaced font whatever the font name, one rectangle per character that is not a
+        space, enough to run glyphCache and the labels without Rhino
+        :return: list of curves
+        """
+        width = 0.6 * height
+        advance = 0.7 * height
+        return [Polyline([[x, 0], [x + width, 0], [x + width, height], [x, height], [x, 0]])
+                for x in (n * advance for n, char in enumerate(text) if not char.isspace())]
+
+    def move(self, crvs, vector):
+        for c in crvs:
+            for p in c.points:
+                p[0] += vector[0]
+                p[1] += vector[1]
+                p[2] += vector[2]
+            c._index = None
+
+    def rotate(self, crvs, angle, center):
+        cos_a = math.cos(angle)
+        sin_a = math.sin(angle)
+        for c in crvs:
+            for p in c.points:
+                dx = p[0] - center[0]
+                dy = p[1] - center[1]
+                p[0] = center[0] + cos_a * dx - sin_a * dy
+                p[1] = center[1] + sin_a * dx + cos_a * dy
+            c._index = None
+
+    def vertices(self, crv, tolerance, closed=True, z=False):
+        ring = [list(p) if z else [p[0], p[1]] for p in crv.points]
+        if closed and ring[0] != ring[-1]:
+            ring.append(ring[0])
+        return ring
+
+    def closest_point(self, crv, pt):
+        best = None
+        best_dist = None
+        pts = crv.points
+        for k in range(len(pts) - 1):
+            a = pts[k]
+            b = pts[k + 1]
+            dx = b[0] - a[0]
+            dy = b[1] - a[1]
+            length_sq = dx * dx + dy * dy
+            t = 0.0
+            if length_sq > 0:
+                t = min(max(((pt[0] - a[0]) * dx + (pt[1] - a[1]) * dy) / length_sq, 0.0), 1.0)
+            c = [a[0] + t * dx, a[1] + t * dy, a[2] + t * (b[2] - a[2])]
+            d = (c[0] - pt[0]) ** 2 + (c[1] - pt[1]) ** 2
+            if best_dist is None or d < best_dist:
+                best = c
+                best_dist = d
+        return best
+
+    def point_in_curve(self, pt, crv):
+        return pr.point_in_ring(pt[0], pt[1], self.vertices(crv, 0, True))
+
+    def intersect(self, a, b, tolerance):
+        """
+        parameters on polyline a where it crosses polyline b, the integer part is the segment index
+        """
+        params = []
+        index = b.segment_index()
+        pa = a.points
+        pb = b.points
+        for k in range(len(pa) - 1):
+            for m in index.query(pr.segment_box(pa[k], pa[k + 1])):
+                hit = pr.intersect_segments(pa[k], pa[k + 1], pb[m], pb[m + 1])
+                if hit is not None:
+                    params.append(k + hit[0])
+        return params
+
+    def split(self, crv, params):
+        pts = crv.points
+        params = sorted(p for p in params if 0 < p < len(pts) - 1)
+        if not params:
+            return [crv]
+        pieces = []
+        current = [pts[0]]
+        k = 0
+        for param in params:
+            segment = min(int(param), len(pts) - 2)
+            while k < segment:
+                k += 1
+                current.append(pts[k])
+            t = param - segment
+            a = pts[segment]
+            b = pts[segment + 1]
+            x = [a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1]), a[2] + t * (b[2] - a[2])]
+            if x != current[-1]:
+                current.append(x)
+            if len(current) > 1:
+                pieces.append(Polyline(current))
+            current = [x]
+        for m in range(k + 1, len(pts)):
+            if pts[m] != current[-1]:
+                current.append(pts[m])
+        if len(current) > 1:
+            pieces.append(Polyline(current))
+        return pieces
+
+    def horizontal_z(self, srf, tolerance):
+        # planar surfaces are always horizontal, so the engraving is flattened and never needs project
+        return srf.z
+
+    def flatten(self, crv, z):
+        return Polyline([[p[0], p[1], z] for p in crv.points])
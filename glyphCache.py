@@ -0,0 +1,96 @@
+"""
+Cached glyph outlines for label and street name text
+
+Adding a text object and exploding it is one of the slowest operations per object, while the labels only use a
+handful of characters. Every character of a font is exploded once at REFERENCE_HEIGHT and a text is put together
+from copies of the cached outlines. The pen advance between two characters is measured once per pair, so the
+kerning follows the font metrics: the right edge of "ab" + REFERENCE_CHAR lies further right than the one of
+"b" + REFERENCE_CHAR by exactly the position of b behind a.
+
+The caches live for the session, one per font.
+"""
+
+REFERENCE_HEIGHT = 1.0
+REFERENCE_CHAR = "H"
+
+caches = {}
+
+
+class GlyphCache:
+
+    def __init__(self, font, backend):
+        """
+        outlines of one font at REFERENCE_HEIGHT
+        :param font: font name
+        :param backend: geometryBackend backend that explodes text and copies and moves curves
+        """
+        self.font = font
+        self.backend = backend
+        self.glyphs = {}
+        self.offsets = {}
+        self.edges = {}
+        self.explodes = 0
+
+    def outlines(self, text):
+        self.explodes += 1
+        return self.backend.text_outlines(text, self.font, REFERENCE_HEIGHT)
+
+    def glyph(self, char):
+        """
+        outlines of one character, the pen starts at the origin
+        """
+        if char not in self.glyphs:
+            self.glyphs[char] = [] if char.isspace() else self.outlines(char)
+        return self.glyphs[char]
+
+    def right_edge(self, text):
+        if text not in self.edges:
+            self.edges[text] = max(self.backend.bbox(c)[2] for c in self.outlines(text))
+        return self.edges[text]
+
+    def offset(self, a, b):
+        """
+        pen advance from character a to the following character b
+        """
+        pair = a + b
+        if pair not in self.offsets:
+            self.offsets[pair] = self.right_edge(pair + REFERENCE_CHAR) - self.right_edge(b + REFERENCE_CHAR)
+        return self.offsets[pair]
+
+    def text(self, text):
+        """
+        outlines of a text at REFERENCE_HEIGHT, left aligned, the baseline starts at the origin
+        :return: list of new curves
+        """
+        curves = []
+        pen = 0.0
+        for n, char in enumerate(text):
+            if n:
+                pen += self.offset(text[n - 1], char)
+            glyph = [self.backend.duplicate(c) for c in self.glyph(char)]
+            self.backend.move(glyph, (pen, 0, 0))
+            curves.extend(glyph)
+        return curves
+
+    def centered(self, text, point):
+        """
+        outlines of a text at REFERENCE_HEIGHT, horizontally centered on the point with the baseline through it,
+        like a text object with center justification
+        :return: list of new curves
+        """
+        curves = self.text(text)
+        if curves:
+            boxes = [self.backend.bbox(c) for c in curves]
+            center = (min(b[0] for b in boxes) + max(b[2] for b in boxes)) / 2.0
+            self.backend.move(curves, (point[0] - center, point[1], point[2] if len(point) > 2 else 0))
+        return curves
+
+
+def get(font, backend):
+    """
+    glyph cache of a font for the session
+    :return: GlyphCache
+    """
+    if font not in caches:
+        caches[font] = GlyphCache(font, backend)
+    return caches[font]
@@ -1,8 +1,41 @@
+import geometryBackend as gb
+import polylineClip as pc
+import profiler as pf
 import rhinoscriptsyntax as rs
+import scriptcontext
 import Rhino
 
 __commandname__ = "isohypsen_boundary"
 
+def clip_batch(curves, boundary, tolerance):
+    """
+    clip all curves against the boundary at once in the xy plane, every curve keeps its height. Curves that cross
+    the boundary are replaced by polylines within tolerance, curves inside are left as they are
+    :param curves: list of curve ids
+    :param boundary: closed boundary curve
+    :param tolerance: model tolerance
+    :return: tuple (number of clipped curves, number of deleted curves)
+    """
+    backend = gb.RhinoBackend()
+    ring = backend.vertices(boundary, tolerance)
+    polylines = [backend.vertices(c, tolerance, False, True) for c in curves]
+    with pf.span("clip"):
+        result = pc.clip_polylines(polylines, ring)
+    clipped = deleted = 0
+    for obj, pieces in zip(curves, result):
+        if pieces is None:
+            continue
+        attributes = rs.coercerhinoobject(obj).Attributes
+        for p in pieces:
+            scriptcontext.doc.Objects.AddCurve(backend.polyline(p), attributes)
+        pf.count("document writes", len(pieces))
+        rs.DeleteObject(obj)
+        if pieces:
+            clipped += 1
+        else:
+            deleted += 1
+    return clipped, deleted
+
 def check_z(curves, boundary):
 
     b_mid_pt = rs.CurveMidPoint(boundary)
@@ -46,6 +79,7 @@ class Coplanar:
     def ccx_split(self, curve, boundary):
         split_curves = []
         intersection = rs.CurveCurveIntersection(curve, boundary)
+        pf.count("curve intersections")
         if intersection:
             params = []
             for i in intersection:
@@ -94,14 +128,34 @@ def RunCommand( is_interactive ):
     boundary = rs.GetObject("select boundary", 4)
     
     if crv_to_split and boundary:
+        if not rs.IsCurveClosed(boundary):
+            print "ERROR - the boundary is not closed!"
+            return 1
+        # Enter takes the default, Esc cancels before anything is clipped
+        mode = rs.GetString("Mode", "Batch", ["Batch", "PerCurve"])
+        if mode is None:
+            return 0
+        pf.start()
         rs.EnableRedraw(False)
-        coplanar_curves = check_z(crv_to_split, boundary)
-        for c in coplanar_curves:
-            split_result = c.ccx_split(c.crv, c.boundary)
-            if split_result:
-                c.del_crvs(False)
-                c.reset_z()
+        if mode.upper() == "BATCH":
+            with pf.span("batch"):
+                clipped, deleted = clip_batch(crv_to_split, boundary, scriptcontext.doc.ModelAbsoluteTolerance)
+            pf.count("curves clipped", clipped)
+            pf.count("curves deleted", deleted)
+        else:
+            with pf.span("sort"):
+                coplanar_curves = check_z(crv_to_split, boundary)
+            for c in coplanar_curves:
+                with pf.span("split"):
+                    split_result = c.ccx_split(c.crv, c.boundary)
+                if split_result:
+                    with pf.span("trim"):
+                        c.del_crvs(False)
+                        c.reset_z()
         rs.EnableRedraw(True)
+        report = pf.finish()
+        if report:
+            print report
     else: 
         print "ERROR - no curves selected!"
     return 0
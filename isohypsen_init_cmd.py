@@ -1,80 +1,355 @@
-import rhinoscriptsyntax as rs
+import contourStack as cs
+import geometryBackend as gb
+import jobRunner as jr
+import marchingSquares as ms
+import planarRegions as pr
+import polylineSimplify as ps
+import profiler as pf
+import quadSubdivision as qs
+import tiledContours as tc
+import workerPool as wp
+
+try:
+    import rhinoscriptsyntax as rs
+    import scriptcontext as sc
+    from Rhino.Geometry import Brep, Point3d, PolylineCurve
+except ImportError:  # headless, the stack and the regions run on geometryBackend.PolylineBackend
+    rs = sc = Brep = Point3d = PolylineCurve = None
 
 __commandname__ = "isohypsen_init"
 
 
-def curves_rebuild(curves, reduction):
+def curves_simplify(curves, tolerance, method=ps.DOUGLAS_PEUCKER):
     """
-    Reduce the point count of a given set of curves
+    Reduce the point count of a given set of curves, the curves are replaced by polylines that stay within an
+    absolute tolerance, batches of curves are simplified in parallel, closed curves that would shrink below a
+    triangle are left as they are
     :param curves: list of curves
-    :param reduction: float between 0.1 and 0.9
+    :param tolerance: float in model units, e.g. the laser kerf, 0 keeps the curves
+    :param method: polylineSimplify.DOUGLAS_PEUCKER or polylineSimplify.VISVALINGAM_WHYATT
     """
-    if reduction < 1.0:
-        for c in curves:
-            p_reduction = rs.CurvePointCount(c) * reduction
-            rs.RebuildCurve(c, 3, p_reduction)
+    if tolerance <= 0:
+        return
+    polylines = [qs.curve_to_vertices(c, tolerance / 10.0, False) for c in curves]
+    heights = [rs.CurveStartPoint(c).Z for c in curves]
+
+    jobs = [(batch, tolerance, method) for batch in ps.batches(polylines, wp.cpu_count())]
+    simplified = [p for batch in wp.process_map(ps.simplify_batch, jobs) for p in batch]
+
+    for c, points, z in zip(curves, simplified, heights):
+        # a closed ring smaller than the tolerance collapses, keep the original curve instead of a degenerate one
+        if rs.IsCurveClosed(c) and len(points) < 4:
+            pf.count("rings kept")
+            continue
+        sc.doc.Objects.Replace(c, PolylineCurve([Point3d(v[0], v[1], z) for v in points]))
+        pf.count("document writes")
 
 
-def create_isohypsen_srf(curves, boundary, layer):
+def create_isohypsen_srf(curves, boundary, layer, document=None):
     """
-    creates contour surface from open contour lines and a boundary
-    :param curves: open contour lines
+    creates contour surface from open contour lines and a boundary, the regions of the levels are computed
+    directly in 2d on a worker pool in the background and added to the document level by level
+    :param curves: contourStack.ContourStack of open contour lines
     :param boundary: closed curve
     :param boundary: layer name
+    :param document: jobRunner.RhinoDocument or a stand-in that gets the progress and the cancel requests
+    :return: tuple (number of levels added, True if the run was cancelled)
+    """
+    tolerance = curves.backend.tolerance()
+    boundary_ring = qs.curve_to_vertices(boundary, tolerance, True, curves.backend)
+    polylines = stack_polylines(curves, tolerance)
+
+    def produce():
+        # runs on the background thread of the job runner, the breps are built there as well
+        for level, faces in iter_regions(curves, polylines, boundary_ring, tolerance):
+            yield level.index, face_breps(faces, level.regions[0].z, tolerance)
+
+    if document is None:
+        document = jr.RhinoDocument(__commandname__)
+    return jr.run(produce(), lambda batch: add_surfaces(batch, layer), document, len(curves))
+
+
+def create_grid_srf(path, interval, simplification, layer, cell_size=1.0, document=None):
+    """
+    creates contour surfaces straight from an elevation grid file, the contours never go through the document,
+    the levels are computed in the background and added to the document level by level, requires NumPy
+    :param path: ESRI ASCII grid (.asc), XYZ point grid (.xyz) or raster (.npy) too large for memory
+    :param interval: float, height difference between two levels
+    :param simplification: float, simplification tolerance of the contours, 0 keeps every vertex
+    :param layer: layer name
+    :param cell_size: float, distance between two samples of a .npy raster, which starts at the origin
+    :param document: jobRunner.RhinoDocument or a stand-in that gets the progress and the cancel requests
+    :return: tuple (number of levels added, True if the run was cancelled)
+    """
+    tolerance = sc.doc.ModelAbsoluteTolerance
+    total = None
+    if path.lower().endswith(".npy"):
+        levels = regions_from_raster(tc.open_raster(path), interval, 0.0, (0.0, 0.0), cell_size, simplification)
+    else:
+        with pf.span("import"):
+            if path.lower().endswith(".xyz"):
+                grid, origin, cell_size = ms.load_xyz(path)
+            else:
+                grid, origin, cell_size = ms.load_ascii_grid(path)
+        stack, boundary_ring, grid_tolerance = grid_stack(grid, interval, 0.0, origin, cell_size, simplification)
+        polylines = stack_polylines(stack, grid_tolerance)
+        levels = ((level.regions[0].z, faces)
+                  for level, faces in iter_regions(stack, polylines, boundary_ring, grid_tolerance))
+        total = len(stack)
+
+    def produce():
+        # runs on the background thread of the job runner, the breps are built there as well
+        for index, (z, faces) in enumerate(levels):
+            yield index, face_breps(faces, z, tolerance)
+
+    if document is None:
+        document = jr.RhinoDocument(__commandname__)
+    return jr.run(produce(), lambda batch: add_surfaces(batch, layer), document, total)
+
+
+def face_breps(faces, z, tolerance):
+    """
+    planar breps of the faces of one level
+    :param faces: list of planarRegions.Face
+    :param z: height of the level
+    :return: list of breps
+    """
+    pf.count("faces", len(faces))
+    breps = []
+    for face in faces:
+        loops = [ring_curve(face.outer, z)] + [ring_curve(h, z) for h in face.holes]
+        breps.extend(Brep.CreatePlanarBreps(loops, tolerance) or [])
+    return breps
+
+
+def add_surfaces(levels, layer):
+    """
+    add a batch of levels to the document
+    :param levels: list of tuples (level index, list of breps)
+    :param layer: layer name
+    """
+    for index, breps in levels:
+        with pf.span("write", index):
+            srf = [sc.doc.Objects.AddBrep(b) for b in breps]
+            pf.count("document writes", len(srf))
+            if srf:
+                rs.ObjectLayer(srf, layer)
+
+
+def stack_polylines(stack, tolerance):
+    """
+    discretized contours of a contour stack, one list per level
+    """
+    return [[qs.curve_to_vertices(c, tolerance, False, stack.backend) for c in level.objects()] for level in stack]
+
+
+def stack_regions(stack, boundary_ring, tolerance, workers=None):
+    """
+    planar regions of every level of a contour stack, the levels are computed on a worker pool
+    :param stack: contourStack.ContourStack of open contour lines
+    :param boundary_ring: vertex ring of the boundary
+    :param tolerance: model tolerance
+    :param workers: number of threads, defaults to the number of cores
+    :return: list of planarRegions.Face lists, one per level
+    """
+    polylines = stack_polylines(stack, tolerance)
+    jobs = [(level, stack, polylines, boundary_ring, tolerance) for level in stack]
+    with pf.span("trim"):
+        return wp.thread_map(level_regions, jobs, workers)
+
+
+def iter_regions(stack, polylines, boundary_ring, tolerance, workers=None):
+    """
+    planar regions of the levels in batches of workers levels in the order of the stack, see stack_regions
+    :param polylines: result of stack_polylines
+    :return: generator of tuples (contourStack.Level, list of planarRegions.Face)
+    """
+    batch = max(1, workers or wp.cpu_count())
+    levels = list(stack)
+    for start in range(0, len(levels), batch):
+        jobs = [(level, stack, polylines, boundary_ring, tolerance) for level in levels[start:start + batch]]
+        with pf.span("trim"):
+            regions = wp.thread_map(level_regions, jobs, workers)
+        for job, faces in zip(jobs, regions):
+            yield job[0], faces
+
+
+def regions_from_grid(grid, interval, base=0.0, origin=(0.0, 0.0), cell_size=1.0, simplification=0.0, workers=None):
+    """
+    contour surfaces straight from an elevation grid, the contours of marchingSquares go into the region stage
+    without a round trip through the document, requires NumPy
+    :param grid: 2d array of elevations, row 0 is the southern edge, NaN for missing values
+    :param interval: float, height difference between two levels
+    :param base: float, height of one of the levels
+    :param origin: tuple (x, y) of grid[0, 0]
+    :param cell_size: float, distance between two grid points
+    :param simplification: float, simplification tolerance of the contours, 0 keeps every vertex
+    :param workers: number of threads, defaults to the number of cores
+    :return: tuple (contourStack.ContourStack of the contours, list of planarRegions.Face lists, one per level)
+    """
+    stack, boundary_ring, tolerance = grid_stack(grid, interval, base, origin, cell_size, simplification)
+    return stack, stack_regions(stack, boundary_ring, tolerance, workers)
+
+
+def grid_stack(grid, interval, base=0.0, origin=(0.0, 0.0), cell_size=1.0, simplification=0.0):
+    """
+    contour lines of an elevation grid as a contour stack on the headless backend, see regions_from_grid
+    :return: tuple (contourStack.ContourStack of the contours, boundary ring, tolerance of the grid)
+    """
+    with pf.span("contours"):
+        lines = ms.contour_lines(grid, interval, base, origin, cell_size)
+    if simplification > 0:
+        with pf.span("rebuild"):
+            lines = [(z, ps.simplify_batch(level, simplification)) for z, level in lines]
+
+    tolerance = cell_size / 1000.0
+    backend = gb.PolylineBackend(tolerance)
+    with pf.span("sort"):
+        stack = sort_z([gb.Polyline(line, z) for z, level in lines for line in level], True, backend)
+    return stack, grid_boundary((len(grid), len(grid[0])), origin, cell_size), tolerance
+
+
+def regions_from_raster(raster, interval, base=0.0, origin=(0.0, 0.0), cell_size=1.0, simplification=0.0,
+                        tile=tc.TILE):
+    """
+    contour surfaces of a raster too large for memory, the raster is contoured tile by tile and the regions of a
+    level are built as soon as the level above is complete, requires NumPy
+    :param raster: 2d array of elevations, usually tiledContours.open_raster(), row 0 is the southern edge
+    :param interval: float, height difference between two levels
+    :param base: float, height of one of the levels
+    :param origin: tuple (x, y) of raster[0, 0]
+    :param cell_size: float, distance between two samples
+    :param simplification: float, simplification tolerance of the contours, 0 keeps every vertex
+    :param tile: cells per tile edge
+    :return: generator of (z, list of planarRegions.Face), bottom level first
+    """
+    tolerance = cell_size / 1000.0
+    boundary_ring = grid_boundary(raster.shape, origin, cell_size)
+    below = []
+    current = None
+    for z, lines in tc.iter_levels(raster, interval, base, origin, cell_size, tile):
+        if simplification > 0:
+            lines = ps.simplify_batch(lines, simplification)
+        if current is not None:
+            with pf.span("regions"):
+                yield current[0], level_faces(boundary_ring, current[1], lines, below, tolerance)
+            below = current[1]
+        current = (z, lines)
+    if current is not None:
+        with pf.span("regions"):
+            yield current[0], level_faces(boundary_ring, current[1], [], below, tolerance)
+
+
+def grid_boundary(shape, origin, cell_size):
+    """
+    boundary ring half a cell inside the grid, the contours that end on the edge of the grid cross it
+    :param shape: tuple (rows, columns)
+    :return: vertex ring
+    """
+    rows, columns = shape
+    min_x = origin[0] + cell_size / 2.0
+    min_y = origin[1] + cell_size / 2.0
+    max_x = origin[0] + (columns - 1.5) * cell_size
+    max_y = origin[1] + (rows - 1.5) * cell_size
+    return [[min_x, min_y], [max_x, min_y], [max_x, max_y], [min_x, max_y], [min_x, min_y]]
+
+
+def level_regions(level, stack, polylines, boundary_ring, tolerance):
+    """
+    planar regions of one level, the contours of the neighbouring levels decide which side lies above
+    :param level: contourStack.Level
+    :param stack: contourStack.ContourStack
+    :param polylines: discretized contours, one list per level
+    :param boundary_ring: vertex ring of the boundary
+    :param tolerance: model tolerance
+    :return: list of planarRegions.Face
     """
-    for i in range(0, len(curves)):
-        temp_str = ""
-        for j in range(0, len(curves[i])):
-            temp_str += " SelID " + str(curves[i][j])
-        surface = rs.AddPlanarSrf(boundary)
-        end = rs.CurveStartPoint(curves[i][0])
-        start = rs.CurveStartPoint(boundary)
-        end_pt = rs.CreatePoint(start[0], start[1], end[2])
-        translation = end_pt - start
-        rs.MoveObject(surface, translation)
-        rs.Command("_Trim " + str(temp_str) + " _Enter")
-        srf = rs.LastCreatedObjects()
-        rs.ObjectLayer(srf, layer)
+    with pf.span("regions", level.index):
+        above = stack.above(level)
+        below = stack.below(level)
+        return level_faces(boundary_ring, polylines[level.index], polylines[above.index] if above else [],
+                           polylines[below.index] if below else [], tolerance)
 
 
-def sort_z(obj, dir):
+def level_faces(boundary_ring, contours, higher, lower, tolerance):
+    """
+    planar regions of one level from its contours and the contours of its neighbours
+    :param boundary_ring: vertex ring of the boundary
+    :param contours: vertex lists of the level
+    :param higher: vertex lists of the level above
+    :param lower: vertex lists of the level below
+    :param tolerance: model tolerance
+    :return: list of planarRegions.Face
+    """
+    faces, separators = pr.build_regions(boundary_ring, contours, tolerance)
+    return pr.select_faces(faces, separators, [pr.interior_point(p) for p in higher],
+                           [pr.interior_point(p) for p in lower], tolerance)
+
+
+def ring_curve(ring, z):
+    return PolylineCurve([Point3d(v[0], v[1], z) for v in ring])
+
+
+def sort_z(obj, dir, backend=None):
     """
     sort curves by Z value 
     :param obj: list of curves distributed in Z
     :param obj: True = low to high, False = high to low
-    :return: list of curves sorted by their c value
-    """
-    unsorted_obj = []
-    unsorted_z = []
-    for o in obj:
-        centroid = rs.CurveMidPoint(o)
-        z_value = round(centroid.Z, 1)
-        unsorted_obj.append([z_value, o])
-        unsorted_z.append(z_value)
-    if dir:
-        sorted_z = sorted(set(unsorted_z), reverse=False)
-    else:
-        sorted_z = sorted(set(unsorted_z), reverse=True)
+    :param backend: geometryBackend backend, the Rhino backend inside Rhino
+    :return: contourStack.ContourStack, levels of curves sorted by their Z value rounded to 0.1
+    """
+    return cs.ContourStack(obj, 0.1, not dir, backend)
+
+
+def grid_command():
+    """
+    isohypsen_init for an elevation grid file instead of contour curves
+    """
+    if ms.np is None:
+        print "ERROR - contours from elevation grids need NumPy!"
+        return 1
+    path = rs.OpenFileName("select elevation grid", "Elevation grids (*.asc;*.xyz;*.npy)|*.asc;*.xyz;*.npy||")
+    if not path:
+        print "ERROR - no grid was selected!"
+        return 1
+    cell_size = 1.0
+    if path.lower().endswith(".npy"):
+        cell_size = rs.GetReal("Cell size:", 1.0, 0.0)
+    interval = rs.GetReal("Contour interval:", 1.0, 0.0)
+    tol = rs.GetReal("Simplification tolerance:", 0.1, 0.0)
+    if not cell_size or not interval or tol is None:
+        print "ERROR - no interval was given!"
+        return 1
+
+    layer_contours = "Iso Surfaces"
+    rs.AddLayer(layer_contours)
+    rs.LayerColor(layer_contours, rs.CreateColor(255,0,0))
 
-    sorted_obj = []
+    pf.start()
+    levels, cancelled = create_grid_srf(path, interval, tol, layer_contours, cell_size)
+    if cancelled:
+        print "cancelled after " + str(levels) + " levels"
+    else:
+        print str(levels) + " levels created"
+    report = pf.finish()
+    if report:
+        print report
+    return 0
 
-    for i in range(0, len(sorted_z)):
-        temp = []
-        for j in range(0, len(unsorted_z)):
-            if unsorted_obj[j][0] == sorted_z[i]:
-                temp.append(unsorted_obj[j][1])
-                del unsorted_obj[j][1]
-        sorted_obj.append(temp)
-    return sorted_obj
 
 # RunCommand is the called when the user enters the command name in Rhino.
 # The command name is defined by the filename minus "_cmd.py"
 def RunCommand( is_interactive ):
+    source = rs.GetString("Source", "Curves", ["Curves", "Grid"])
+    if source is None:
+        return 0
+    if source.upper() == "GRID":
+        return grid_command()
     crv = rs.GetObjects("select contour lines", 4)
     per = rs.GetObject("select boundary", 4)
-    red = rs.GetReal("Reduce point count to:", 0.5, 0.1, 1.0)  # 0.5 equals 50% of initial point count
+    tol = rs.GetReal("Simplification tolerance:", 0.1, 0.0)  # e.g. the laser kerf, 0 keeps the curves
     
-    if crv and per and red:
+    if crv and per and tol is not None:
 
         layer_contours = "Iso Surfaces"
         rs.AddLayer(layer_contours)
@@ -90,11 +365,20 @@ def RunCommand( is_interactive ):
         rs.ObjectLayer(dup_curves, layer_ocontours)
         old_layer = rs.ObjectLayer(crv[0])
 
-        curves_rebuild(crv, red)
-        outline = sort_z(crv, True)
-        create_isohypsen_srf(outline, per , layer_contours)
+        pf.start()
+        with pf.span("rebuild"):
+            curves_simplify(crv, tol)
+        with pf.span("sort"):
+            outline = sort_z(crv, True)
+        levels, cancelled = create_isohypsen_srf(outline, per , layer_contours)
+        wp.close_pool()
+        if cancelled:
+            print "cancelled after " + str(levels) + " of " + str(len(outline)) + " levels"
         
         rs.DeleteLayer(old_layer)
+        report = pf.finish()
+        if report:
+            print report
     
     else: 
         print "ERROR - no selection was made!"
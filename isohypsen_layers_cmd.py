@@ -1,50 +1,147 @@
+import os
+import tempfile
+
+import cadastreImport as ci
+import coincidentEdges as ce
+import geometryBackend as gb
+import glyphCache as gl
+import profiler as pf
 import rhinoscriptsyntax as rs
 import scriptcontext
+from Rhino.Geometry import Plane, Point3d, Transform, Vector3d
 
 
 __commandname__ = "isohypsen_layers"
 
+LAYERS_TO_KEEP = { "01211":"Buildings", "01221":"Streets", "01229":"Street_Names", "01311":"Building_Details", "01316":"Bridges", "01611":"Plot", "01241":"Stretch_Of_Water", "01334":"Train_Tracks"}
+
+# where lines of the kept layers lie on top of each other, the line of the first layer in this list stays
+COINCIDENT_PRIORITY = ["01211", "01316", "01334", "01241", "01221", "01611", "01311"]
+
+
+def remove_coincident(layer_names, tolerance):
+    """
+    delete the parts of curves that lie on top of curves of the same or an earlier layer, so no line is engraved twice
+    :param layer_names: layers in order of priority
+    :param tolerance: model tolerance
+    :return: number of curves that were replaced by what is left of them
+    """
+    backend = gb.RhinoBackend()
+    ids = [obj for name in layer_names for obj in rs.ObjectsByLayer(name) if rs.IsCurve(obj)]
+    polylines = [backend.vertices(obj, tolerance, False) for obj in ids]
+    changed = 0
+    for obj, runs in zip(ids, ce.remove_coincident(polylines, tolerance)):
+        if runs is None:
+            continue
+        attributes = rs.coercerhinoobject(obj).Attributes
+        z = backend.end_points(obj)[0][2]
+        for r in runs:
+            scriptcontext.doc.Objects.AddCurve(backend.polyline(r, z), attributes)
+        pf.count("document writes", len(runs))
+        rs.DeleteObject(obj)
+        changed += 1
+    return changed
+
+
+def explode_texts(texts, font):
+    """
+    replace text objects by their outlines, put together from cached glyphs instead of exploding every text object
+    :param texts: list of text objects
+    :param font: font of the outlines
+    """
+    glyphs = gl.get(font, gb.RhinoBackend())
+    for t in texts:
+        text = t.Geometry
+        plane = text.Plane
+        curves = glyphs.text(rs.TextObjectText(t.Id))
+        if curves:
+            # center the outlines on the text box, in the plane of the text
+            scale = text.TextHeight / gl.REFERENCE_HEIGHT
+            boxes = [c.GetBoundingBox(True) for c in curves]
+            cx = (min(b.Min.X for b in boxes) + max(b.Max.X for b in boxes)) / 2.0 * scale
+            cy = (min(b.Min.Y for b in boxes) + max(b.Max.Y for b in boxes)) / 2.0 * scale
+            center = text.GetBoundingBox(plane).Center
+            xform = (Transform.PlaneToPlane(Plane.WorldXY, plane) *
+                     Transform.Translation(Vector3d(center.X - cx, center.Y - cy, 0)) *
+                     Transform.Scale(Point3d.Origin, scale))
+            for c in curves:
+                c.Transform(xform)
+                scriptcontext.doc.Objects.AddCurve(c, t.Attributes)
+            pf.count("document writes", len(curves))
+        rs.DeleteObject(t.Id)
+
+
+def import_cadastre(path):
+    """
+    import only the kept layers of a cadastre DXF file, the file is filtered while it is read and the kept layers
+    arrive with their descriptive names
+    :param path: DXF file
+    :return: tuple (number of imported entities, number of dropped entities)
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    filtered = os.path.join(tempfile.gettempdir(), name + "_kept.dxf")
+    with pf.span("prefilter"):
+        kept, dropped = ci.filter_dxf(path, filtered, LAYERS_TO_KEEP)
+    pf.count("entities dropped while reading", dropped)
+    with pf.span("import"):
+        rs.Command('_-Import "' + filtered + '" _Enter', False)
+    os.remove(filtered)
+    return kept, dropped
+
+
 # RunCommand is the called when the user enters the command name in Rhino.
 # The command name is defined by the filname minus "_cmd.py"
 def RunCommand( is_interactive ):
     
+    pf.start()
+    path = rs.OpenFileName("Cadastre DXF to import, cancel to use the layers of the document",
+                           "DXF files (*.dxf)|*.dxf||")
     rs.EnableRedraw(False)
     
-    parent_layer = rs.AddLayer("CADASTRE_DATA")
+    if path:
+        imported, dropped = import_cadastre(path)
+        print("imported " + str(imported) + " entities, " + str(dropped) + " dropped while reading")
     
-    layers_to_keep = { "01211":"Buildings", "01221":"Streets", "01229":"Street_Names", "01311":"Building_Details", "01316":"Bridges", "01611":"Plot", "01241":"Stretch_Of_Water", "01334":"Train_Tracks"}
+    parent_layer = rs.AddLayer("CADASTRE_DATA")
     
     layers = rs.LayerNames()
+    kept = {}
     
     for l in layers:
         
         if l[0]=='0':
             
-            keep = False
-
-            for k, v in layers_to_keep.items():
-                if l == k:
-                    if not rs.IsLayerEmpty(l):
-                        name = l+" "+v
-                        rs.RenameLayer(l, name)
-                        rs.ParentLayer(name,parent_layer)
-                        keep = True
-            if keep == False:
+            # the code alone, or already "code description" after a filtered import
+            code = l.split(" ")[0]
+            if code in LAYERS_TO_KEEP and not rs.IsLayerEmpty(l):
+                name = code+" "+LAYERS_TO_KEEP[code]
+                if l != name:
+                    rs.RenameLayer(l, name)
+                rs.ParentLayer(name,parent_layer)
+                kept[code] = name
+            else:
+                pf.count("layers purged")
                 removed = rs.PurgeLayer(l)
                 if not removed:
                     objects = rs.ObjectsByLayer(l, False)
                     print(l, " ", objects)
                 
+    with pf.span("coincident"):
+        names = [kept[k] for k in COINCIDENT_PRIORITY if k in kept]
+        pf.count("coincident curves", remove_coincident(names, scriptcontext.doc.ModelAbsoluteTolerance))
+
     font = ["SLF-RHN Architect", "RhSS"]
     
     text =scriptcontext.doc.Objects.FindByLayer("01229 Street_Names")
     
     if text:
-        for t in text:
-            rs.TextObjectFont(t, font[0])
-            rs.ExplodeText(t, True)
-            rs.DeleteObject(t)
+        pf.count("street names exploded", len(text))
+        with pf.span("street names"):
+            explode_texts(text, font[0])
     
     rs.EnableRedraw(True)
+    report = pf.finish()
+    if report:
+        print(report)
 
     return 0
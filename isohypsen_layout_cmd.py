@@ -1,191 +1,744 @@
+import math
+
+import boxIndex as bi
+import coincidentEdges as ce
+import contourStack as cs
+import geometryBackend as gb
+import glyphCache as gl
+import jobRunner as jr
+import labelCache as lc
+import levelGraph as lg
+import outputSink as sk
+import planarRegions as pr
+import profiler as pf
 import quadSubdivision as qs
-import rhinoscriptsyntax as rs
-from Rhino.Geometry import *
-from System.Drawing import Color
+import segmentIndex as si
+import sheetNesting as sn
+import toolpathOrder as tp
+import workerPool as wp
 
-__commandname__ = "isohypsen_layout"
+try:
+    import rhinoscriptsyntax as rs
+    import scriptcontext as sc
+except ImportError:  # headless, compute_layout runs on geometryBackend.PolylineBackend
+    rs = sc = None
 
+__commandname__ = "isohypsen_layout"
 
-def layout_curves(surface_unsorted, perimeter, kadaster):
+# layers to structure the output
+CUT_LAYER = "Cutting"
+ENGRAVE_LAYER = "Engraving"
+GUIDES_LAYER = "Guides"
+LABELS_LAYER = "Labels"
+
+# LevelLayout attribute, layer and color of the curve output, engraving first so no piece is cut loose before
+OUTPUT_LAYERS = [("engraving", ENGRAVE_LAYER, (0, 0, 0)),
+                 ("cutting", CUT_LAYER, (255, 0, 0)),
+                 ("guides", GUIDES_LAYER, (127, 255, 0))]
+LABEL_COLOR = (0, 0, 0)
+
+LABEL_TOLERANCE = 5.0
+# polylabel stops at 1% of the shorter side of a polygon, after 2000 cells or 0.2 s, whatever comes first
+LABEL_BUDGET = qs.Budget(relative=0.01, cells=2000, seconds=0.2)
+
+# sheet nesting, default laser bed and the gaps between two pieces and between a piece and the sheet edge
+SHEET_SIZE = (600.0, 400.0)
+SHEET_SPACING = 2.0
+SHEET_MARGIN = 5.0
+FONT = ["SLF-RHN Architect", "RhSS"]
+
+# label points survive between runs of the command in the same session
+label_cache = None
+
+
+class LevelLayout:
+
+    def __init__(self, index, z):
+        """
+        geometry of one level, computed without touching the document and committed in level order
+        :param index: position of the level, 0 is the top level
+        :param z: height of the level
+        """
+        self.index = index
+        self.z = z
+        self.cutting = []
+        self.engraving = []
+        self.guides = []
+        self.labels = []  # [text, vertex rings, label point]
+        self.frame = None  # (min_x, min_y, max_x, max_y) of the sheet, None fits the output files to the geometry
+
+
+def layout_curves(surface_unsorted, perimeter, kadaster, workers=1, cache=None, sink=None, sheet=None,
+                  travel=None, state=None, document=None):
     """
     prepare cutting data by creating layers and distributing the curves/layers in X
-    
+
     :param surface_unsorted:
     :param perimeter:
     :param kadaster:
+    :param workers: number of levels computed in parallel, 1 computes them one after another
+    :param cache: labelCache.LabelCache, unchanged label polygons skip polylabel
+    :param sink: receives the levels one after another, e.g. outputSink.SvgSink, None adds them to the document
+    :param sheet: tuple (width, height), nest the pieces onto sheets of this size, None keeps one level per slot
+    :param travel: toolpathOrder.TravelReport, order the curves of every sheet for short rapid travel and add the
+                   travel to the report, None keeps the order
+    :param state: levelGraph.LayoutState of the last run, only the levels whose inputs changed are computed and
+                  replace their objects from the last run, needs the row arrangement and the document as sink
+    :param document: jobRunner.RhinoDocument or a stand-in that gets the progress and the cancel requests
+    :return: tuple (result of sink.close(), e.g. the list of written files, True if the run was cancelled)
+    """
+    if sink is None:
+        sink = DocumentSink()
+    if document is None:
+        document = jr.RhinoDocument(__commandname__)
+    backend = gb.RhinoBackend()
+    inputs = read_inputs(surface_unsorted, perimeter, kadaster, backend, state)
+
+    def produce(stopped):
+        # runs on the background thread of the job runner, nothing in here touches the document
+        layouts = compute_levels(inputs, workers, cache, stopped)
+        if sheet is not None:
+            # the sheets are only known once every level has been computed
+            layouts = nest_layouts(list(layouts), sheet, backend)[0]
+        for layout in layouts:
+            with pf.span("coincident", layout.index):
+                remove_coincident(layout, backend)
+            if travel is not None:
+                with pf.span("toolpath", layout.index):
+                    order_toolpaths(layout, backend, travel)
+            yield layout
+
+    def commit(layouts):
+        for layout in layouts:
+            with pf.span("write", layout.index):
+                sink.write(layout)
+
+    total = len(inputs[4]) if sheet is None else None
+    try:
+        cancelled = jr.run(produce, commit, document, total)[1]
+    finally:
+        # the label batches of all levels share one process pool
+        wp.close_pool()
+    if state is not None:
+        replaced = state.update(sink.ids)
+        pf.count("levels replaced", len(sink.ids))
+        if replaced:
+            rs.DeleteObjects(replaced)
+    with pf.span("write"):
+        return sink.close(), cancelled
+
+
+def compute_layout(surface_unsorted, perimeter, kadaster, workers=1, cache=None, backend=None, state=None):
+    """
+    compute the geometry of every level without touching the document
+
+    :param surface_unsorted: contour surfaces, document ids or backend geometry
+    :param perimeter: perimeter curve
+    :param kadaster: engraving curves
+    :param workers: number of levels computed in parallel, 1 computes them one after another
+    :param cache: labelCache.LabelCache, unchanged label polygons skip polylabel
+    :param backend: geometryBackend backend, the Rhino backend inside Rhino
+    :param state: levelGraph.LayoutState of the last run, only the levels whose inputs changed are computed
+    :return: list of LevelLayout, top level first
+    """
+    return list(iter_layout(surface_unsorted, perimeter, kadaster, workers, cache, backend, state))
+
+
+def iter_layout(surface_unsorted, perimeter, kadaster, workers=1, cache=None, backend=None, state=None):
+    """
+    compute the levels in batches of workers levels and yield them top level first, a consumer that writes and
+    drops every level keeps only one batch in memory
+    see compute_layout for the parameters
+    """
+    backend = backend or gb.default_backend()
+    return compute_levels(read_inputs(surface_unsorted, perimeter, kadaster, backend, state), workers, cache)
+
+
+def read_inputs(surface_unsorted, perimeter, kadaster, backend, state=None):
     """
-    surface = sort_by_z(surface_unsorted)
+    read everything the levels need from the document, the computation of the levels only sees geometry
+    see compute_layout for the parameters
+    :return: tuple (contour stack, (kadaster curves, boxIndex.BoxIndex), X offset, tolerance, indices of the levels
+             to compute)
+    """
+    with pf.span("sort"):
+        surface = sort_by_z(surface_unsorted, backend)
+    tolerance = backend.tolerance()
+    # the regions hold document ids, coerce them here so the level threads only see the cached geometry
+    with pf.span("read"):
+        for level in surface:
+            for region in level.regions:
+                region.geometry()
+                region.bbox()
+                region.border(tolerance)
     # calculate offset
-    bbox = rs.BoundingBox(perimeter)
-    dist = rs.Distance(bbox[0], bbox[1])
+    bbox = backend.bbox(perimeter)
+    dist = bbox[2] - bbox[0]
     dist = dist + ((dist / 100) * 10)
-    # create point start and end points to move lines back to Z0
-    start_pt = rs.CreatePoint(0, 0, 0)
-    end_pt = start_pt
-
-    # Create layers to structure the output
-    cut_layer = "Cutting"
-    rs.AddLayer(cut_layer)
-    engrave_layer = "Engraving"
-    rs.AddLayer(engrave_layer)
-    guides_layer = "Guides"
-    rs.AddLayer(guides_layer)
-    labels_layer = "Labels"
-    rs.AddLayer(labels_layer)
-
-    for i in range(0, len(surface)):
-
-        # calculate increasing X-offset to translate all the objects
-        end_pt.X = end_pt.X + (dist)
-        end_pt.Z = -surface[i][0]
-        translation = end_pt
-
-        for j in range(1, len(surface[i])):
-            projected_crvs = rs.ProjectCurveToSurface(kadaster, surface[i][j], (0, 0, -1))
-            border = rs.DuplicateSurfaceBorder(surface[i][j])
-            rs.MoveObject(projected_crvs, translation)
-
-            rs.MoveObject(border, translation)
-            rs.ObjectLayer(border, cut_layer)
-            rs.ObjectColor(border, Color.Red)
-            rs.ObjectPrintWidth(border, 0)
-
-            # for everything but the top layer
-            boundaries_to_trim = []
-            if i >= 1:
-                # duplicate and projected border from layer above
-                for ij in range(1, len(surface[i - 1])):
-                    top_border = rs.DuplicateSurfaceBorder(surface[i - 1][ij])
-                    end_pt.Z = -surface[i - 1][0]
-                    translation_a = end_pt
-                    rs.MoveObject(top_border, translation_a)
-                    boundaries_to_trim.append(top_border)
-
-                    if top_border:
-                        # add layer information and labels
-                        id = str(i + 1) + "." + str(ij) + "/" + str(i) + "." + str(ij)
-                        if len(top_border) >1:
-                            top_border = largest_polygon(top_border)
-                        label_point = qs.circle_of_inaccessibility(top_border[0], 5.0)
-
-                        font = ["SLF-RHN Architect", "RhSS"]
-                        label = rs.AddText(id, label_point, 1, font[0], 0, 2)
-                        exploded_label_crvs = rs.ExplodeText(label, True)
-                        rs.ObjectLayer(exploded_label_crvs, labels_layer)
-                        rs.ObjectColor(exploded_label_crvs, Color.Black)
-                        rs.ObjectPrintWidth(exploded_label_crvs, 0)
-
-                        rs.ObjectLayer(top_border, guides_layer)
-                        rs.ObjectColor(top_border, Color.Chartreuse)
-                        rs.ObjectPrintWidth(top_border, 0)
-
-                    if projected_crvs:
-                        rs.ObjectLayer(projected_crvs, engrave_layer)
-                        rs.ObjectColor(projected_crvs, Color.Black)
-                        rs.ObjectPrintWidth(projected_crvs, 0)
-
-
-            else:
-                rs.ObjectLayer(projected_crvs, engrave_layer)
-                rs.ObjectColor(projected_crvs, Color.Black)
-                rs.ObjectPrintWidth(projected_crvs, 0)
-
-            try:
-                if projected_crvs and label:
-                    c = ccx_split(projected_crvs, boundaries_to_trim, len(boundaries_to_trim))
-                    inside_crv_del(c, boundaries_to_trim, True)
-
-            except:
-                pass
-
-def largest_polygon(polygon):
-    polygon_area = {}
-    for p in polygon:
-            area = rs.CurveArea(p)
-            polygon_area[p] = area
-    polygon = max(polygon_area, key=polygon_area.get)
-    return [polygon]
-
-def ccx_split(curves, boundary, last):
-    """
-    split all curves that intersect with a set of boundaries
-    :param curves: curves to be split
-    :param boundary: boundaries to split the curves with
-    :param last: boundary list length for recursive function
-    :return: list of curves
+
+    kadaster_crvs = [backend.curve(k) for k in kadaster]
+    kadaster_index = bi.BoxIndex([backend.bbox(k) for k in kadaster_crvs])
+
+    levels = list(range(len(surface)))
+    if state is not None:
+        with pf.span("dependencies"):
+            levels = state.plan(lg.LevelGraph(surface, kadaster_crvs, kadaster_index, dist, tolerance, bbox))
+        pf.count("dirty levels", len(levels))
+    return surface, (kadaster_crvs, kadaster_index), dist, tolerance, levels
+
+
+def compute_levels(inputs, workers=1, cache=None, stopped=None):
     """
-    split_curves = []
-    for c in curves:
-        intersections = rs.CurveCurveIntersection(c, boundary[last - 1])
-        if intersections:
-            params = []
-            for i in intersections:
-                if i[0] == 1:
-                    params.append(rs.CurveClosestPoint(c, i[1]))
-            split_result = rs.SplitCurve(c, params)
-            split_curves.append(split_result)
+    generator of the levels, see iter_layout
+    :param inputs: result of read_inputs
+    :param workers: number of levels computed in parallel
+    :param cache: labelCache.LabelCache or None
+    :param stopped: function that returns True once the consumer gave up, checked before every batch of levels
+    """
+    surface, kadaster, dist, tolerance, levels = inputs
+
+    # every level only depends on itself and the level above
+    batch = max(1, workers)
+    for start in range(0, len(levels), batch):
+        if stopped is not None and stopped():
+            break
+        jobs = [(i, surface, kadaster, dist, tolerance) for i in levels[start:start + batch]]
+        layouts = wp.thread_map(layout_level, jobs, workers)
+        place_labels(layouts, workers, cache)
+        for layout in layouts:
+            yield layout
+
+    if cache is not None:
+        cache.save()
+
+
+def place_labels(layouts, workers=1, cache=None):
+    """
+    compute the label points of a batch of levels
+    :param layouts: list of LevelLayout
+    :param workers: number of processes
+    :param cache: labelCache.LabelCache or None
+    """
+    # polylabel only needs the vertex rings, this pure-geometry part runs in a process pool
+    labels = [label for layout in layouts for label in layout.labels]
+    pf.count("labels", len(labels))
+
+    def compute(rings_list):
+        return wp.process_map(qs.label_circle_rings, [(rings, LABEL_TOLERANCE, LABEL_BUDGET) for rings in rings_list],
+                              workers)
+
+    with pf.span("polylabel"):
+        if cache is not None:
+            points = cache.label_points([label[1] for label in labels], LABEL_TOLERANCE, compute, LABEL_BUDGET)
         else:
-            split_curves.append(c)
+            points = [circle[0] for circle in compute([label[1] for label in labels])]
+    for label, point in zip(labels, points):
+        label[2] = point
 
-    curve_list = []
-    for i in range(0, len(split_curves)):
-        if isinstance(split_curves[i], list):
-            for j in range(0, len(split_curves[i])):
-                curve_list.append(split_curves[i][j])
+
+def get_label_cache(model_path):
+    """
+    label cache of the session, stored next to the model once it has been saved
+    :param model_path: full path of the 3dm file
+    :return: labelCache.LabelCache
+    """
+    global label_cache
+    path = lc.model_cache_path(model_path)
+    if label_cache is None or label_cache.path != path:
+        label_cache = lc.LabelCache(path=path)
+    return label_cache
+
+
+def load_state(everything=False):
+    """
+    records of the last run, stored in the document so they are saved with the model
+    :param everything: True = recompute every level and replace the objects of the last run
+    :return: levelGraph.LayoutState
+    """
+    state = lg.loads(rs.GetDocumentData(lg.SECTION, lg.ENTRY), rs.IsObject)
+    if everything:
+        state.invalidate()
+    return state
+
+
+def save_state(state):
+    rs.SetDocumentData(lg.SECTION, lg.ENTRY, state.dumps())
+
+
+def layout_level(i, stack, kadaster, dist, tolerance):
+    """
+    project, split and translate the geometry of one level, does not touch the document
+    :param i: index of the level
+    :param stack: contourStack.ContourStack of the contour surfaces, top level first
+    :param kadaster: tuple (engraving curves, boxIndex.BoxIndex of the curves)
+    :param dist: X offset between two levels
+    :param tolerance: model tolerance
+    :return: LevelLayout
+    """
+    level = stack[i]
+    backend = stack.backend
+    layout = LevelLayout(i, level.z)
+
+    # for everything but the top layer, the guides are computed once per surface of the layer above
+    with pf.span("guides", i):
+        guides = guide_borders(i, stack, dist, tolerance, layout)
+
+    # increasing X-offset, move the level back to Z0
+    translation = ((i + 1) * dist, 0, -level.z)
+
+    for region in level.regions:
+        with pf.span("projection", i):
+            projected_crvs = project_kadaster(kadaster[0], kadaster[1], region, tolerance)
+        border = region.border(tolerance)
+        backend.move(projected_crvs, translation)
+        backend.move(border, translation)
+        layout.cutting.extend(border)
+
+        if projected_crvs and guides:
+            with pf.span("split", i):
+                c = ccx_split(projected_crvs, guides)
+                projected_crvs = inside_crv_del(c, guides, True)
+        layout.engraving.extend(projected_crvs)
+
+    return layout
+
+
+def project_kadaster(kadaster, index, region, tolerance):
+    """
+    project the engraving curves onto one contour surface, only curves whose bounding box overlaps the surface are
+    considered, horizontal planar surfaces are handled as a 2d clip instead of a general surface projection
+    :param kadaster: engraving curves
+    :param index: boxIndex.BoxIndex of the engraving curves
+    :param region: contourStack.Region of the surface
+    :param tolerance: model tolerance
+    :return: list of curves on the surface
+    """
+    backend = region.backend
+    candidates = [kadaster[k] for k in index.query(region.bbox())]
+    pf.count("projection candidates", len(candidates))
+    if not candidates:
+        return []
+
+    z = backend.horizontal_z(region.geometry(), tolerance)
+    if z is None:
+        return backend.project(candidates, region.geometry(), tolerance)
+
+    flat_crvs = []
+    for c in candidates:
+        c = backend.flatten(c, z)
+        if c is not None and backend.length(c) > tolerance:
+            flat_crvs.append(c)
+    if not flat_crvs:
+        return []
+
+    # split at the border and keep what lies inside the outer loop and outside the holes
+    border = region.border(tolerance)
+    pieces = ccx_split(flat_crvs, GuideBorders(border, tolerance, backend))
+    inside = si.SegmentIndex([backend.vertices(b, tolerance) for b in border])
+    projected_crvs = []
+    for p in pieces:
+        mid_pt = backend.mid_point(p)
+        if inside.inside(mid_pt[0], mid_pt[1]):
+            projected_crvs.append(p)
+    return projected_crvs
+
+
+def guide_borders(i, stack, dist, tolerance, layout):
+    """
+    duplicate and translate the borders of the layer above into the slot of level i and queue their labels,
+    runs exactly once per surface of the layer above
+    :param i: index of the level
+    :param stack: contourStack.ContourStack of the contour surfaces, top level first
+    :param dist: X offset between two levels
+    :param tolerance: model tolerance
+    :param layout: LevelLayout that receives the guides and labels
+    :return: GuideBorders or None for the top level
+    """
+    above = stack.above(stack[i])
+    if not above:
+        return None
+
+    backend = stack.backend
+    translation_a = ((i + 1) * dist, 0, -above.z)
+    boundaries = []
+    for ij, top in enumerate(above.regions, 1):
+        top_border = top.border(tolerance)
+        backend.move(top_border, translation_a)
+        if not top_border:
+            continue
+        boundaries.extend(top_border)
+
+        # add layer information and labels
+        layout.guides.extend(top_border)
+        id = str(i + 1) + "." + str(ij) + "/" + str(i) + "." + str(ij)
+        largest = top_border[top.largest_border(tolerance)]
+        rings = [qs.curve_to_vertices(largest, LABEL_TOLERANCE / 10.0, True, backend)]
+        layout.labels.append([id, rings, None])
+
+    if not boundaries:
+        return None
+    return GuideBorders(boundaries, tolerance, backend)
+
+
+class GuideBorders:
+
+    def __init__(self, curves, tolerance, backend):
+        """
+        translated guide borders of one level with the indices the split stage needs, built once per level
+        :param curves: closed border curves
+        :param tolerance: model tolerance
+        :param backend: geometryBackend backend that evaluates the curves
+        """
+        self.curves = curves
+        self.tolerance = tolerance
+        self.backend = backend
+        self.index = bi.BoxIndex([backend.bbox(c) for c in curves])
+        self.segment_indices = [None] * len(curves)
+
+    def __len__(self):
+        return len(self.curves)
+
+    def segment_index(self, b):
+        """
+        discretized boundary b, built on first use
+        :return: segmentIndex.SegmentIndex
+        """
+        if self.segment_indices[b] is None:
+            self.segment_indices[b] = si.SegmentIndex([self.backend.vertices(self.curves[b], self.tolerance)])
+        return self.segment_indices[b]
+
+
+class Piece:
+
+    def __init__(self, level, outline):
+        """
+        one part of a level that is cut out on its own, its holes, engraving, guides and labels move with it
+        :param level: index of the level
+        :param outline: vertex ring of the outer border
+        """
+        self.level = level
+        self.outline = outline
+        box = pr.ring_box(outline)
+        self.center = [(box[0] + box[2]) / 2.0, (box[1] + box[3]) / 2.0]
+        self.cutting = []
+        self.engraving = []
+        self.guides = []
+        self.labels = []
+        # placement: rotation around the center, then translation onto the sheet
+        self.sheet = None
+        self.angle = 0.0
+        self.translation = (0.0, 0.0)
+
+    def apply(self, backend):
+        """
+        move the geometry of the piece to its placement
+        """
+        curves = self.cutting + self.engraving + self.guides
+        if self.angle:
+            backend.rotate(curves, self.angle, self.center)
+        backend.move(curves, (self.translation[0], self.translation[1], 0))
+        for label in self.labels:
+            point = sn.rotate_point(label[2], self.angle, self.center)
+            point[0] += self.translation[0]
+            point[1] += self.translation[1]
+            label[2] = point
+
+
+def level_pieces(layout, backend, tolerance):
+    """
+    split a level into its pieces, a border inside an even number of other borders is the outline of a piece, the
+    others are holes of the smallest piece around them, every other curve and label belongs to the smallest piece
+    that contains it
+    :param layout: LevelLayout in its slot
+    :param backend: geometryBackend backend that evaluates the curves
+    :param tolerance: model tolerance
+    :return: list of Piece
+    """
+    rings = [backend.vertices(c, tolerance) for c in layout.cutting]
+    parents = pr.ring_parents(rings)
+    pieces = {}
+    for k in range(len(rings)):
+        depth = 0
+        parent = parents[k]
+        while parent is not None:
+            depth += 1
+            parent = parents[parent]
+        if depth % 2 == 0:
+            pieces[k] = Piece(layout.index, rings[k])
+    if not pieces:
+        return []
+    areas = dict((k, abs(pr.ring_area(rings[k]))) for k in pieces)
+    largest = max(pieces, key=lambda k: areas[k])
+    keys = sorted(pieces)
+    index = bi.BoxIndex([pr.ring_box(rings[k]) for k in keys])
+
+    def owner(x, y):
+        outlines = [keys[n] for n in index.query(bi.point_box(x, y)) if pr.point_in_ring(x, y, rings[keys[n]])]
+        if not outlines:
+            return pieces[largest]
+        return pieces[min(outlines, key=lambda k: areas[k])]
+
+    for k, c in enumerate(layout.cutting):
+        if k in pieces:
+            pieces[k].cutting.append(c)
         else:
-            curve_list.append(split_curves[i])
-    next = last - 1
-    
-    if next >= 0:
-        return ccx_split(curve_list, boundary, next)
+            # a hole, its parent is the outline of the piece
+            pieces[parents[k]].cutting.append(c)
+    for attribute in ("engraving", "guides"):
+        for c in getattr(layout, attribute):
+            mid_pt = backend.mid_point(c)
+            getattr(owner(mid_pt[0], mid_pt[1]), attribute).append(c)
+    for label in layout.labels:
+        owner(label[2][0], label[2][1]).labels.append(label)
+    return [pieces[k] for k in sorted(pieces)]
+
+
+def nest_layouts(layouts, sheet, backend, spacing=SHEET_SPACING, margin=SHEET_MARGIN, refine=False):
+    """
+    pack the pieces of all levels onto sheets instead of one row of level slots, pieces are turned by 90 degrees
+    where that packs better, the sheets lie side by side in X
+    :param layouts: list of LevelLayout
+    :param sheet: tuple (width, height) of a sheet
+    :param backend: geometryBackend backend that evaluates the curves
+    :param spacing: gap between two pieces
+    :param margin: gap between the pieces and the sheet edge
+    :param refine: first turn every piece to the angle of its smallest bounding box, costs one convex hull per piece
+    :return: tuple (list of LevelLayout, one per sheet, list of Piece with the placement of every piece)
+    """
+    tolerance = backend.tolerance()
+    with pf.span("nesting"):
+        pieces = [p for layout in layouts for p in level_pieces(layout, backend, tolerance)]
+        pf.count("nested pieces", len(pieces))
+        if refine:
+            for p in pieces:
+                p.angle = sn.min_area_angle(p.outline)
+        boxes = [sn.rotated_box(p.outline, p.angle, p.center) for p in pieces]
+        placements, count = sn.pack([(b[2] - b[0], b[3] - b[1]) for b in boxes], sheet[0], sheet[1], spacing,
+                                    margin)
+
+        gap = sheet[0] / 10.0
+        sheets = [LevelLayout(n, 0.0) for n in range(count)]
+        for n, s in enumerate(sheets):
+            s.frame = (n * (sheet[0] + gap), 0.0, n * (sheet[0] + gap) + sheet[0], sheet[1])
+
+        for p, box, placement in zip(pieces, boxes, placements):
+            if placement.rotated:
+                p.angle += math.pi / 2
+                box = sn.rotated_box(p.outline, p.angle, p.center)
+            target = sheets[placement.sheet]
+            p.sheet = placement.sheet
+            p.translation = (target.frame[0] + placement.x - box[0], target.frame[1] + placement.y - box[1])
+            p.apply(backend)
+            target.cutting.extend(p.cutting)
+            target.engraving.extend(p.engraving)
+            target.guides.extend(p.guides)
+            target.labels.extend(p.labels)
+    return sheets, pieces
+
+
+def remove_coincident(layout, backend):
+    """
+    drop the parts of the cutting, engraving and guide curves that lie on top of other curves, so no line is cut or
+    engraved twice, the cutting wins over the engraving and the guides, which run on the cutting border of the level
+    wherever the level above shares it, curves that lose a part are replaced by polylines of what is left
+    :param layout: LevelLayout
+    :param backend: geometryBackend backend that evaluates the curves
+    """
+    tolerance = backend.tolerance()
+    layers = [(attribute, getattr(layout, attribute)) for attribute in ("cutting", "engraving", "guides")]
+    polylines = [backend.vertices(c, tolerance, False) for attribute, curves in layers for c in curves]
+    remaining = iter(ce.remove_coincident(polylines, tolerance))
+    for attribute, curves in layers:
+        kept = []
+        for c in curves:
+            runs = next(remaining)
+            if runs is None:
+                kept.append(c)
+                continue
+            z = backend.end_points(c)[0][2]
+            pf.count("coincident curves")
+            kept.extend(backend.polyline(r, z) for r in runs)
+        setattr(layout, attribute, kept)
+
+
+def order_toolpaths(layout, backend, report=None):
+    """
+    order and orient the engraving and cutting curves of one sheet for short rapid travel, the engraving comes first
+    and starts at the corner of the sheet, the holes of a piece are cut before its outline
+    :param layout: LevelLayout
+    :param backend: geometryBackend backend that evaluates the curves
+    :param report: toolpathOrder.TravelReport that receives the travel before and after
+    """
+    tolerance = backend.tolerance()
+    layers = [(attribute, getattr(layout, attribute)) for attribute in ("engraving", "cutting")]
+    ends = dict((attribute, [backend.end_points(c) for c in curves]) for attribute, curves in layers)
+    if layout.frame is not None:
+        position = layout.frame[:2]
     else:
-        return curve_list
+        points = [e[0] for attribute, curves in layers for e in ends[attribute]]
+        if not points:
+            return
+        position = (min(p[0] for p in points), min(p[1] for p in points))
+
+    for attribute, curves in layers:
+        if not curves:
+            continue
+        starts = [e[0] for e in ends[attribute]]
+        stops = [e[1] for e in ends[attribute]]
+        parents = None
+        if attribute == "cutting":
+            # a closed curve waits for the closed curves inside it
+            closed = [pr.distance(a, b) <= tolerance for a, b in zip(starts, stops)]
+            parents = pr.ring_parents([backend.vertices(c, tolerance) if cl else None
+                                       for c, cl in zip(curves, closed)])
+        route, before, after = tp.order(starts, stops, parents, position)
+        ordered = []
+        for k, reverse in route:
+            if reverse:
+                backend.reverse(curves[k])
+            ordered.append(curves[k])
+        setattr(layout, attribute, ordered)
+        k, reverse = route[-1]
+        position = starts[k] if reverse else stops[k]
+        pf.count("toolpath curves", len(curves))
+        if report is not None:
+            report.add(before, after, len(curves))
+
+
+class DocumentSink:
+
+    def __init__(self):
+        """
+        output sink that adds the levels to the document, the layers are created up front
+        """
+        rs.AddLayer(CUT_LAYER)
+        rs.AddLayer(ENGRAVE_LAYER)
+        rs.AddLayer(GUIDES_LAYER)
+        rs.AddLayer(LABELS_LAYER)
+        self.ids = {}  # level index: ids of the objects added for the level
+
+    def write(self, layout):
+        self.ids[layout.index] = commit_level(layout)
+
+    def close(self):
+        return None
+
+
+def file_sink(path):
+    """
+    output sink that streams every level to its own sheet file, the format follows the file extension
+    :param path: base file name ending in .svg or .dxf
+    :return: outputSink.SvgSink or outputSink.DxfSink
+    """
+    backend = gb.RhinoBackend()
+    args = (path, OUTPUT_LAYERS, (LABELS_LAYER, LABEL_COLOR), backend, backend.tolerance())
+    if path.lower().endswith(".dxf"):
+        return sk.DxfSink(*args)
+    return sk.SvgSink(*args)
+
+
+def commit_level(layout):
+    """
+    add the geometry of one level to the document
+    :param layout: LevelLayout
+    :return: list of object ids
+    """
+    ids = []
+    for attribute, layer, color in OUTPUT_LAYERS:
+        ids.extend(add_to_layer(getattr(layout, attribute), layer, color))
+
+    # the labels are put together from cached glyph outlines instead of exploding a text object per label
+    glyphs = gl.get(FONT[0], gb.RhinoBackend())
+    for id, rings, label_point in layout.labels:
+        ids.extend(add_to_layer(glyphs.centered(id, label_point), LABELS_LAYER, LABEL_COLOR))
+    return ids
+
+
+def add_to_layer(curves, layer, color):
+    """
+    add curves to the document
+    :param curves: list of curve geometry
+    :param layer: layer name
+    :param color: object color, tuple (r, g, b)
+    :return: list of object ids
+    """
+    ids = [sc.doc.Objects.AddCurve(c) for c in curves]
+    pf.count("document writes", len(ids))
+    if ids:
+        rs.ObjectLayer(ids, layer)
+        rs.ObjectColor(ids, color)
+        rs.ObjectPrintWidth(ids, 0)
+    return ids
+
+
+def ccx_split(curves, boundary):
+    """
+    split all curves that intersect with a set of boundaries, a curve is only intersected with the boundaries
+    whose bounding box overlaps its own
+    :param curves: curves to be split
+    :param boundary: GuideBorders to split the curves with
+    :return: list of curves
+    """
+    tolerance = boundary.tolerance
+    backend = boundary.backend
+    curve_list = []
+    tests = 0
+    for c in curves:
+        params = []
+        for b in boundary.index.query(backend.bbox(c)):
+            params.extend(backend.intersect(c, boundary.curves[b], tolerance))
+            tests += 1
+        curve_list.extend(backend.split(c, params))
+    pf.count("intersection tests", tests)
+    pf.count("split pieces", len(curve_list))
+    return curve_list
 
 
 def inside_crv_del(split_curves, boundary, in_or_outside):
     """
-    delete all curves in- or outside of a list of given boundaries
-    :param split_curves: curves to be deleted
-    :param boundary: boundaries to split the curves with
-    :param in_or_outside: True = delete inside, False = delete outside
-    """
-    for crv in split_curves:
-        mid_pt = rs.CurveMidPoint(crv)
-        for bc in boundary:
-            inside = rs.PointInPlanarClosedCurve(mid_pt, bc)
-            # delete inside 
-            if inside == 1 and in_or_outside == True:
-                rs.DeleteObject(crv)
-                break
-            # delete outside 
-            if inside == 0 and in_or_outside == False:
-                rs.DeleteObject(crv)
-                break
-
-
-def sort_by_z(obj):
-    """
-    sorts curves by z-index
-
-    :param obj: list of curves to be sorted
-    :return:
-    """
-    unsorted_obj = []
-    unsorted_z = []
-    for o in obj:
-        centroid = rs.SurfaceAreaCentroid(o)
-        unsorted_obj.append([centroid[0].Z, o])
-        unsorted_z.append(centroid[0].Z)
-    sorted_z = sorted(set(unsorted_z), reverse=True)
-
-    sorted_obj = []
-    for i in range(0, len(sorted_z)):
-        sorted_obj.append([sorted_z[i]])
-        for j in range(0, len(unsorted_z)):
-            if unsorted_obj[j][0] == sorted_z[i]:
-                sorted_obj[i].append(unsorted_obj[j][1])
-                del unsorted_obj[j][1]
-    return sorted_obj
+    discard all curves in- or outside of a list of given boundaries, the midpoints of all curves are classified
+    against all boundaries in one pass, each boundary only tests the midpoints inside its bounding box
+    :param split_curves: curves to be discarded
+    :param boundary: GuideBorders to test the curves with
+    :param in_or_outside: True = discard inside, False = discard outside
+    :return: list of the remaining curves
+    """
+    mid_pts = [boundary.backend.mid_point(c) for c in split_curves]
+    points = bi.BoxIndex([bi.point_box(p[0], p[1]) for p in mid_pts])
+
+    inside_count = [0] * len(split_curves)
+    for b in range(len(boundary)):
+        candidates = points.query(boundary.index.boxes[b])
+        if not candidates:
+            continue
+        pf.count("inside tests", len(candidates))
+        rings = boundary.segment_index(b)
+        for n in candidates:
+            if rings.inside(mid_pts[n][0], mid_pts[n][1]):
+                inside_count[n] += 1
+
+    remaining = []
+    for crv, count in zip(split_curves, inside_count):
+        # discard inside
+        if in_or_outside == True and count > 0:
+            continue
+        # discard outside
+        if in_or_outside == False and count < len(boundary):
+            continue
+        remaining.append(crv)
+    return remaining
+
+
+def sort_by_z(obj, backend=None):
+    """
+    sorts surfaces by z-index
+
+    :param obj: list of surfaces to be sorted
+    :param backend: geometryBackend backend, the Rhino backend inside Rhino
+    :return: contourStack.ContourStack, top level first
+    """
+    backend = backend or gb.default_backend()
+    return cs.ContourStack(obj, backend.tolerance(), True, backend)
 
 
 def RunCommand( is_interactive ):
@@ -193,18 +746,66 @@ def RunCommand( is_interactive ):
     contours = rs.GetObjects("select contour surfaces", 8)
     kadaster = rs.GetObjects("select engraving data", 4)
     perimeter = rs.GetObject("select perimeter", 4)
+    output = rs.GetString("Output", "Document", ["Document", "SVG", "DXF"])
+    arrangement = rs.GetString("Arrangement", "Row", ["Row", "Sheets"])
+    sheet = None
+    if arrangement and arrangement.upper() == "SHEETS":
+        width = rs.GetReal("Sheet width", SHEET_SIZE[0], 0)
+        height = rs.GetReal("Sheet height", SHEET_SIZE[1], 0)
+        if not width or not height:
+            print "ERROR - no sheet size was given!"
+            return 1
+        sheet = (width, height)
+    sink = None
+    if output and output.upper() in ("SVG", "DXF"):
+        ext = output.lower()
+        path = rs.SaveFileName("Save sheets", output.upper() + " files (*." + ext + ")|*." + ext + "||")
+        if not path:
+            print "ERROR - no output file was selected!"
+            return 1
+        sink = file_sink(path)
+    state = None
+    if sheet is None and sink is None:
+        # the levels keep their slots, only the levels whose inputs changed have to be replaced
+        update = rs.GetString("Update", "Changed", ["Changed", "All"])
+        state = load_state(update is not None and update.upper() == "ALL")
     if contours and kadaster and perimeter:
         print "starting to generate layout..."
         print "processing..."
+        pf.start()
+
+        cache = get_label_cache(sc.doc.Path)
+        hits = cache.hits
+        misses = cache.misses
+
+        travel = tp.TravelReport()
 
         rs.EnableRedraw(False)
-        layout_curves(contours, perimeter, kadaster)
+        try:
+            files, cancelled = layout_curves(contours, perimeter, kadaster, wp.cpu_count(), cache, sink, sheet, travel,
+                                             state)
+        except ValueError as e:
+            rs.EnableRedraw(True)
+            print "ERROR - " + str(e)
+            return 1
         rs.EnableRedraw(True)
+        if state is not None:
+            save_state(state)
 
-        print "layout has been created!"
+        if cancelled:
+            print "layout was cancelled, the levels written so far are kept"
+        else:
+            print "layout has been created!"
+        if files:
+            print str(len(files)) + " sheets written, e.g. " + files[0]
+        print "rapid travel: %.0f instead of %.0f, %.0f%% saved" % (travel.after, travel.before, 100 * travel.saved())
+        print "label cache: " + str(cache.hits - hits) + " hits, " + str(cache.misses - misses) + " misses"
+        report = pf.finish()
+        if report:
+            print report
     else:
         print "ERROR - no selection was made!"
-    
+
     return 0
 
 
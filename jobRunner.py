@@ -0,0 +1,200 @@
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:  # Python 2 and IronPython
+    import Queue as queue
+
+try:
+    import Rhino
+    import scriptcontext as sc
+except ImportError:  # headless, runs report to a RecordingDocument
+    Rhino = sc = None
+
+"""
+Background job runner for the long running isohypsen commands
+
+The geometry is computed on a background thread, which may fan out to worker threads itself, and every finished
+level is streamed to the calling thread through a bounded queue, so at most QUEUE_SIZE levels wait in memory. Only
+the calling thread touches the document: it commits the levels in batches of up to BATCH_SIZE, all of them under
+one undo record, reports the progress after every batch and checks for a cancel request between levels. A cancel
+stops the background thread before its next level, the levels committed so far stay in the document.
+
+The document side goes through a small interface, RhinoDocument inside Rhino and RecordingDocument for headless runs
+and tests.
+"""
+
+QUEUE_SIZE = 4
+BATCH_SIZE = 4
+
+# seconds the calling thread waits for a level before it lets Rhino process its messages
+POLL_INTERVAL = 0.1
+
+# end of the results, put into the queue by the background thread
+DONE = object()
+
+# the three argument raise that keeps the traceback under Python 2 is a syntax error in Python 3
+if sys.version_info[0] < 3:
+    exec("def reraise(exc_type, exc_value, traceback):\n    raise exc_type, exc_value, traceback\n")
+else:
+    def reraise(exc_type, exc_value, traceback):
+        raise exc_value.with_traceback(traceback)
+
+
+class RhinoDocument:
+
+    def __init__(self, name):
+        """
+        undo record, progress meter and cancel test of the active Rhino document
+        :param name: name of the undo record and the progress meter
+        """
+        self.name = name
+        self.record = None
+        self.total = None
+
+    def begin(self, total):
+        """
+        :param total: number of expected levels or None if unknown
+        """
+        # inside a command the undo record of the command is already active
+        if not sc.doc.UndoRecordingIsActive:
+            self.record = sc.doc.BeginUndoRecord(self.name)
+        self.total = total
+        if total:
+            Rhino.UI.StatusBar.ShowProgressMeter(0, total, self.name, True, True)
+
+    def progress(self, done):
+        if self.total:
+            Rhino.UI.StatusBar.UpdateProgressMeter(done, True)
+        total = " of " + str(self.total) if self.total else ""
+        Rhino.RhinoApp.SetCommandPrompt(self.name + ": " + str(done) + total + " written, press Esc to cancel")
+
+    def idle(self):
+        """
+        let Rhino process its messages while the calling thread waits
+        """
+        Rhino.RhinoApp.Wait()
+
+    def cancel_requested(self):
+        return sc.escape_test(False)
+
+    def end(self):
+        if self.total:
+            Rhino.UI.StatusBar.HideProgressMeter()
+        if self.record:
+            sc.doc.EndUndoRecord(self.record)
+
+
+class RecordingDocument:
+
+    def __init__(self, cancel_after=None):
+        """
+        stand-in for RhinoDocument that records the calls, for headless runs and tests
+        :param cancel_after: request a cancel once this many levels are committed, None never cancels
+        """
+        self.cancel_after = cancel_after
+        self.events = []
+        self.done = 0
+
+    def begin(self, total):
+        self.events.append(("begin", total))
+
+    def progress(self, done):
+        self.done = done
+        self.events.append(("progress", done))
+
+    def idle(self):
+        pass
+
+    def cancel_requested(self):
+        return self.cancel_after is not None and self.done >= self.cancel_after
+
+    def end(self):
+        self.events.append(("end", self.done))
+
+
+def run(results, commit, document, total=None, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE):
+    """
+    consume results on a background thread and commit them on the calling thread
+    :param results: iterable of per level results, e.g. a generator that computes the levels, or a function that
+                    takes a function stopped() and returns the iterable, stopped() tells a producer that has to do
+                    a lot of work before its first result that the run is over
+    :param commit: function(list of results) that adds a batch of levels to the document
+    :param document: RhinoDocument or RecordingDocument
+    :param total: number of expected results for the progress, None if unknown
+    :param batch_size: maximum number of levels committed at once
+    :param queue_size: maximum number of finished levels waiting for their commit
+    :return: tuple (number of committed results, True if the run was cancelled)
+    """
+    pipe = queue.Queue(queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def put(item):
+        # a full queue must not block the thread once the run is over
+        while not stop.is_set():
+            try:
+                pipe.put(item, True, POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for result in (results(stop.is_set) if callable(results) else results):
+                if not put(result):
+                    return
+        except Exception:
+            errors.append(sys.exc_info())
+        put(DONE)
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    done = 0
+    cancelled = False
+    document.begin(total)
+    try:
+        finished = False
+        while not finished:
+            try:
+                item = pipe.get(True, POLL_INTERVAL)
+            except queue.Empty:
+                document.idle()
+                if document.cancel_requested():
+                    cancelled = True
+                    break
+                continue
+
+            # take whatever else is ready, up to a full batch
+            batch = []
+            while True:
+                if item is DONE:
+                    finished = True
+                    break
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    break
+                try:
+                    item = pipe.get(False)
+                except queue.Empty:
+                    break
+
+            if batch:
+                commit(batch)
+                done += len(batch)
+                document.progress(done)
+            if not finished and document.cancel_requested():
+                cancelled = True
+                break
+    finally:
+        stop.set()
+        document.end()
+        thread.join()
+    if errors:
+        # keep the traceback of the background thread
+        reraise(*errors[0])
+    return done, cancelled
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+"""
+Label point cache for isohypsen_layout
+
+Keys are a fingerprint of the discretized polygon plus the tolerance and the reproducible limits of the search
+budget. The polygon is moved to its bounding box corner before hashing, so a level that only moved along the layout
+row still hits the cache. Every point keeps the gap between the radius of its circle and the upper bound of the
+search. A search that stopped short of its tolerance under a time limit may depend on the machine and the load,
+its point is not settled: it counts as a miss and is computed again on the next run, the tighter of both is kept.
+Entries are evicted least recently used first and can be stored in a JSON file next to the model.
+"""
+
+CACHE_VERSION = 2
+
+# coordinates are rounded to this many decimals before hashing
+PRECISION = 6
+
+
+class LabelCache:
+
+    def __init__(self, capacity=4096, path=None):
+        """
+        create an in-memory LRU cache, optionally backed by a file
+        :param capacity: maximum number of entries kept
+        :param path: json file, loaded if it exists
+        """
+        self.capacity = capacity
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.isfile(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        look up a settled label point relative to the polygon origin
+        :param key: fingerprint
+        :return: [x, y] or None, also None for a point that is not settled
+        """
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries[key] = entry
+        if not entry[3]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[:2]
+
+    def put(self, key, point, gap=0.0, settled=True):
+        """
+        store a label point relative to the polygon origin, evicts the least recently used entry when full
+        :param gap: upper bound of the search minus the radius of the circle at the point
+        :param settled: False if the search stopped short of its tolerance under a time limit, an unsettled point
+                        only replaces an entry with a larger gap
+        :return: the stored entry [x, y, gap, settled]
+        """
+        entry = self.entries.pop(key, None)
+        if entry is None or settled or gap < entry[2]:
+            entry = [point[0], point[1], gap, settled]
+        self.entries[key] = entry
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return entry
+
+    def label_points(self, rings_list, tolerance, compute, budget=None):
+        """
+        label points for a list of polygons, only the cache misses are computed
+        :param rings_list: list of vertex ring lists, one per polygon
+        :param tolerance: polylabel tolerance
+        :param compute: function(missing rings_list) returning a list of tuples (3d point, radius, upper bound of
+                        the radius), see quadSubdivision.label_circle_rings
+        :param budget: quadSubdivision.Budget of the search or None
+        :return: list of 3d points
+        """
+        keys = []
+        points = []
+        missing = []
+        for n, rings in enumerate(rings_list):
+            key, origin = fingerprint(rings, tolerance, budget)
+            keys.append((key, origin))
+            point = self.get(key)
+            if point is None:
+                missing.append(n)
+                points.append(None)
+            else:
+                points.append([point[0] + origin[0], point[1] + origin[1], 0])
+
+        if missing:
+            computed = compute([rings_list[n] for n in missing])
+            for n, (point, radius, bound) in zip(missing, computed):
+                key, origin = keys[n]
+                gap = float(bound - radius)
+                settled = budget is None or budget.seconds is None
+                if not settled:
+                    # the time limit may have stopped the search before it reached its tolerance
+                    settled = gap <= target_tolerance(rings_list[n], tolerance, budget)
+                entry = self.put(key, [point[0] - origin[0], point[1] - origin[1]], gap, settled)
+                points[n] = [entry[0] + origin[0], entry[1] + origin[1], 0]
+        return points
+
+    def load(self, path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != CACHE_VERSION:
+            return
+        for key, entry in data["entries"]:
+            self.put(key, entry[:2], entry[2], entry[3])
+
+    def save(self, path=None):
+        """
+        write the cache in LRU order, does nothing without a path
+        """
+        path = path or self.path
+        if not path:
+            return
+        data = {"version": CACHE_VERSION, "entries": [[k, p] for k, p in self.entries.items()]}
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+
+def fingerprint(rings, tolerance, budget=None):
+    """
+    translation invariant hash of a discretized polygon, the tolerance and the budget
+    :param rings: list of vertex rings
+    :param tolerance: polylabel tolerance
+    :param budget: quadSubdivision.Budget or None
+    :return: tuple (hex digest, [origin x, origin y])
+    """
+    min_x = min(v[0] for ring in rings for v in ring)
+    min_y = min(v[1] for ring in rings for v in ring)
+    digest = hashlib.sha1()
+    digest.update(("%.*f;" % (PRECISION, tolerance)).encode("ascii"))
+    if budget is not None:
+        digest.update((budget.key() + ";").encode("ascii"))
+    for ring in rings:
+        coords = ["%.*f,%.*f" % (PRECISION, v[0] - min_x, PRECISION, v[1] - min_y) for v in ring]
+        digest.update((";".join(coords) + "|").encode("ascii"))
+    return digest.hexdigest(), [min_x, min_y]
+
+
+def target_tolerance(rings, tolerance, budget):
+    """
+    tolerance the budget aims for on a polygon, see quadSubdivision.Budget.tolerance
+    """
+    xs = [v[0] for ring in rings for v in ring]
+    ys = [v[1] for ring in rings for v in ring]
+    return budget.tolerance(tolerance, max(xs) - min(xs), max(ys) - min(ys))
+
+
+def model_cache_path(model_path):
+    """
+    cache file next to the model, None for unsaved models
+    :param model_path: full path of the 3dm file
+    """
+    if not model_path:
+        return None
+    return os.path.splitext(model_path)[0] + ".labels.json"
@@ -0,0 +1,154 @@
+import hashlib
+import json
+
+import boxIndex as bi
+
+"""
+Dependency graph of the levels of a layout for incremental re-layout
+
+The geometry of a level only depends on its own surfaces, the surfaces of the level above (guides, labels and the
+split of the engraving) and the kadaster curves around its surfaces, plus its slot in the row. Each of these inputs
+is a node with a content hash: the surfaces of every level and the kadaster curves bucketed into a grid of
+TILES x TILES tiles over the perimeter, so an edit of the kadaster only changes the tiles it touches. The record
+of a level keeps the hashes of its inputs and the ids of the objects it produced. A level whose inputs changed is
+dirty, since the level below lists the surfaces of its upper neighbour as input, a changed level makes its direct
+dependent dirty as well. Only dirty levels are computed and their objects replaced.
+"""
+
+TILES = 16
+
+# document data entry of the records
+SECTION = "isohypsen_layout"
+ENTRY = "levels"
+
+
+def digest(parts):
+    """
+    content hash of a list of strings
+    """
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class LevelGraph:
+
+    def __init__(self, stack, kadaster, index, dist, tolerance, bbox):
+        """
+        input hashes of every level
+        :param stack: contourStack.ContourStack of the contour surfaces, top level first
+        :param kadaster: engraving curves
+        :param index: boxIndex.BoxIndex of the engraving curves
+        :param dist: X offset between two levels
+        :param tolerance: model tolerance
+        :param bbox: (min_x, min_y, max_x, max_y) of the perimeter, anchors the kadaster tiles
+        """
+        backend = stack.backend
+        self.surfaces = [digest([backend.fingerprint(r.obj) for r in level.regions]) for level in stack]
+
+        # kadaster tiles by the center of the curve boxes, a tile covers the boxes of all its curves, the grid
+        # follows the perimeter and not the curves, so adding or moving a curve does not shift the other tiles
+        extent = max(bbox[2] - bbox[0], bbox[3] - bbox[1])
+        size = extent / TILES if extent > 0 else 1.0
+        tiles = {}
+        for k, b in enumerate(index.boxes):
+            key = (int(((b[0] + b[2]) / 2.0 - bbox[0]) // size), int(((b[1] + b[3]) / 2.0 - bbox[1]) // size))
+            tiles.setdefault(key, []).append(k)
+        keys = sorted(tiles)
+        tile_boxes = []
+        self.tiles = []
+        for key in keys:
+            members = tiles[key]
+            boxes = [index.boxes[k] for k in members]
+            tile_boxes.append((min(b[0] for b in boxes), min(b[1] for b in boxes),
+                               max(b[2] for b in boxes), max(b[3] for b in boxes)))
+            # the selection order of the curves does not change the layout
+            self.tiles.append(digest(sorted(digest([backend.fingerprint(kadaster[k])]) for k in members)))
+        tile_index = bi.BoxIndex(tile_boxes)
+
+        self.inputs = []
+        for level in stack:
+            i = level.index
+            nodes = {"slot": digest([str(i), repr(dist), repr(tolerance)]),
+                     "surfaces": self.surfaces[i],
+                     "above": self.surfaces[i - 1] if i > 0 else ""}
+            for region in level.regions:
+                for t in tile_index.query(region.bbox()):
+                    nodes["tile %d,%d" % keys[t]] = self.tiles[t]
+            self.inputs.append(nodes)
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def dirty(self, records, exists=None):
+        """
+        levels to recompute
+        :param records: LayoutState.records of the last run
+        :param exists: function that tells whether an object id is still in the document, None skips the check
+        :return: sorted list of level indices
+        """
+        result = []
+        for i, nodes in enumerate(self.inputs):
+            record = records.get(str(i))
+            if record is None or record["inputs"] != nodes:
+                result.append(i)
+            elif exists is not None and not all(exists(obj) for obj in record["ids"]):
+                # objects of the level were deleted by hand
+                result.append(i)
+        return result
+
+
+class LayoutState:
+
+    def __init__(self, records=None, exists=None):
+        """
+        inputs and objects of the levels of the last run
+        :param records: dict str(level index): {"inputs": {node: hash}, "ids": [object ids]}, None starts empty
+        :param exists: function that tells whether an object id is still in the document
+        """
+        self.records = records or {}
+        self.exists = exists
+        self.graph = None
+
+    def invalidate(self):
+        """
+        make every level dirty, the objects of the last run are still replaced
+        """
+        for record in self.records.values():
+            record["inputs"] = {}
+
+    def plan(self, graph):
+        """
+        compare the graph of this run with the records
+        :param graph: LevelGraph
+        :return: sorted list of the indices of the levels to compute
+        """
+        self.graph = graph
+        return graph.dirty(self.records, self.exists)
+
+    def update(self, written):
+        """
+        record the objects of the computed levels
+        :param written: dict level index: list of object ids
+        :return: list of ids of the objects they replace and of the objects of levels that no longer exist
+        """
+        replaced = []
+        for key in list(self.records):
+            i = int(key)
+            if i in written or i >= len(self.graph):
+                replaced.extend(self.records.pop(key)["ids"])
+        for i, ids in written.items():
+            self.records[str(i)] = {"inputs": self.graph.inputs[i], "ids": [str(obj) for obj in ids]}
+        return replaced
+
+    def dumps(self):
+        return json.dumps(self.records, sort_keys=True)
+
+
+def loads(text, exists=None):
+    """
+    LayoutState from the text of LayoutState.dumps, an empty state for missing or unreadable text
+    """
+    try:
+        records = json.loads(text) if text else {}
+    except ValueError:
+        records = {}
+    return LayoutState(records, exists)
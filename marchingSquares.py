@@ -0,0 +1,329 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:  # IronPython in Rhino 7 ships without NumPy
+    np = None
+
+"""
+Contour lines from elevation rasters, vectorized marching squares
+
+Every grid cell is paired with exactly the levels that cross it, so the work grows with the length of the contours
+and not with grid size times level count. Segments are oriented with the higher ground on the left, which makes
+every crossing point the end of one segment and the start of the next. The segments of all levels are stitched in
+bulk by pointer doubling over the successor array instead of walking them one by one. Requires NumPy.
+
+Grids are indexed [row, column], row 0 is the southern edge. A contour is a list of [x, y] vertices, closed
+contours repeat their first vertex at the end.
+"""
+
+# rows per band of the grid, bounds the memory of the cell classification
+BAND_ROWS = 256
+
+# cell edges
+BOTTOM = 0
+RIGHT = 1
+TOP = 2
+LEFT = 3
+
+
+def segment_table():
+    """
+    segments of every cell case, higher ground on the left
+    :return: int array [case, center above, segment, (from edge, to edge)], -1 for no segment
+    """
+    table = -np.ones((16, 2, 2, 2), dtype=np.int64)
+    single = {1: (BOTTOM, LEFT), 2: (RIGHT, BOTTOM), 3: (RIGHT, LEFT), 4: (TOP, RIGHT), 6: (TOP, BOTTOM),
+              7: (TOP, LEFT), 8: (LEFT, TOP), 9: (BOTTOM, TOP), 11: (RIGHT, TOP), 12: (LEFT, RIGHT),
+              13: (BOTTOM, RIGHT), 14: (LEFT, BOTTOM)}
+    for case, segment in single.items():
+        table[case, :, 0] = segment
+    # saddles, the value at the cell center decides which corners are connected
+    table[5, 1] = [(BOTTOM, RIGHT), (TOP, LEFT)]
+    table[5, 0] = [(BOTTOM, LEFT), (TOP, RIGHT)]
+    table[10, 1] = [(LEFT, BOTTOM), (RIGHT, TOP)]
+    table[10, 0] = [(RIGHT, BOTTOM), (LEFT, TOP)]
+    return table
+
+
+def level_range(grid, interval, base):
+    """
+    indices of the lowest and the highest level inside the grid
+    :return: tuple (first, last), first > last if no level crosses the grid
+    """
+    low = np.nanmin(grid)
+    high = np.nanmax(grid)
+    return int(math.floor((low - base) / interval)) + 1, int(math.floor((high - base) / interval))
+
+
+def block_segments(block, row0, col0, shape, interval, base, first, table, levels=None):
+    """
+    oriented segments of the cells of a block of the grid
+    :param block: 2d array, the samples grid[row0:row0 + h, col0:col0 + w]
+    :param row0: row of block[0, 0] in the grid
+    :param col0: column of block[0, 0] in the grid
+    :param shape: tuple (rows, columns) of the whole grid
+    :param first: index of the lowest level, the keys count the levels from there
+    :param table: segment_table()
+    :param levels: tuple (lowest, highest) level index to extract, None for all
+    :return: tuple of int arrays (start key, end key), a key combines level and grid edge
+    """
+    rows, columns = shape
+    horizontal = rows * (columns - 1)
+    edges = horizontal + (rows - 1) * columns
+    block_columns = block.shape[1] - 1
+
+    a = block[:-1, :-1].ravel()
+    b = block[:-1, 1:].ravel()
+    c = block[1:, 1:].ravel()
+    d = block[1:, :-1].ravel()
+    low = np.minimum(np.minimum(a, b), np.minimum(c, d))
+    high = np.maximum(np.maximum(a, b), np.maximum(c, d))
+
+    # the levels with low < level <= high cross the cell, cells with missing values are skipped
+    valid = np.isfinite(low) & np.isfinite(high)
+    k_low = np.where(valid, np.floor((low - base) / interval) + 1, 0).astype(np.int64)
+    k_high = np.where(valid, np.floor((high - base) / interval), -1).astype(np.int64)
+    if levels is not None:
+        k_low = np.maximum(k_low, levels[0])
+        k_high = np.minimum(k_high, levels[1])
+    counts = np.maximum(k_high - k_low + 1, 0)
+    cell = np.repeat(np.arange(len(low)), counts)
+    if not len(cell):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    offsets = np.cumsum(counts) - counts
+    k = k_low[cell] + np.arange(len(cell)) - np.repeat(offsets, counts)
+    level = base + k * interval
+
+    case = ((a[cell] >= level) * 1 + (b[cell] >= level) * 2 + (c[cell] >= level) * 4 +
+            (d[cell] >= level) * 8)
+    center = ((a[cell] + b[cell] + c[cell] + d[cell]) / 4.0 >= level).astype(np.int64)
+    segments = table[case, center]  # (pairs, 2, 2)
+
+    r = row0 + cell // block_columns
+    col = col0 + cell % block_columns
+    edge_ids = np.stack((r * (columns - 1) + col,
+                         horizontal + r * columns + col + 1,
+                         (r + 1) * (columns - 1) + col,
+                         horizontal + r * columns + col), axis=1)
+    key_base = (k - first) * edges
+
+    starts = []
+    ends = []
+    for s in (0, 1):
+        has = segments[:, s, 0] >= 0
+        rows_with = np.nonzero(has)[0]
+        starts.append(key_base[rows_with] + edge_ids[rows_with, segments[rows_with, s, 0]])
+        ends.append(key_base[rows_with] + edge_ids[rows_with, segments[rows_with, s, 1]])
+    return np.concatenate(starts), np.concatenate(ends)
+
+
+def stitch(start, end):
+    """
+    order the segments into chains
+    :param start: int array, start key of every segment
+    :param end: int array, end key of every segment
+    :return: tuple (order of the segments, chain id of every ordered segment, closed flag per chain id)
+    """
+    n = len(start)
+    index = np.arange(n)
+    steps = max(1, int(n).bit_length())
+
+    order = np.argsort(start, kind="mergesort")
+    sorted_start = start[order]
+    pos = np.minimum(np.searchsorted(sorted_start, end), n - 1)
+    following = np.where(sorted_start[pos] == end, order[pos], -1)
+
+    # find the cycles, every node learns the smallest index it can reach
+    jump = np.where(following < 0, index, following)
+    lowest = index.copy()
+    for _ in range(steps):
+        lowest = np.minimum(lowest, lowest[jump])
+        jump = jump[jump]
+    cyclic = following[jump] >= 0
+
+    # cut every cycle in front of its smallest segment
+    heads = np.nonzero(cyclic & (lowest == index))[0]
+    predecessor = np.full(n, -1, dtype=np.int64)
+    linked = following >= 0
+    predecessor[following[linked]] = index[linked]
+    following = following.copy()
+    following[predecessor[heads]] = -1
+
+    # list ranking, distance of every segment to the tail of its chain
+    jump = np.where(following < 0, index, following)
+    distance = (following >= 0).astype(np.int64)
+    for _ in range(steps):
+        distance = distance + distance[jump]
+        jump = jump[jump]
+
+    order = np.lexsort((-distance, jump))
+    return order, jump[order], cyclic
+
+
+def edge_points(keys, grid, interval, base, first, origin, cell_size):
+    """
+    crossing points of the keyed levels on the keyed grid edges
+    :return: float arrays (x, y, z)
+    """
+    rows, columns = grid.shape
+    horizontal = rows * (columns - 1)
+    edges = horizontal + (rows - 1) * columns
+    k = keys // edges + first
+    edge = keys % edges
+    level = base + k * interval
+
+    is_horizontal = edge < horizontal
+    vertical = edge - horizontal
+    r = np.where(is_horizontal, edge // (columns - 1), vertical // columns)
+    c = np.where(is_horizontal, edge % (columns - 1), vertical % columns)
+    v0 = grid[r, c]
+    v1 = np.where(is_horizontal, grid[r, np.minimum(c + 1, columns - 1)], grid[np.minimum(r + 1, rows - 1), c])
+    t = (level - v0) / (v1 - v0)
+    x = origin[0] + (c + np.where(is_horizontal, t, 0.0)) * cell_size
+    y = origin[1] + (r + np.where(is_horizontal, 0.0, t)) * cell_size
+    return x, y, level
+
+
+def contour_lines(grid, interval, base=0.0, origin=(0.0, 0.0), cell_size=1.0):
+    """
+    all contour lines of an elevation grid
+    :param grid: 2d array of elevations, NaN for missing values
+    :param interval: float, height difference between two levels
+    :param base: float, height of one of the levels
+    :param origin: tuple (x, y) of grid[0, 0]
+    :param cell_size: float, distance between two grid points
+    :return: list of (z, list of contours), one entry per level that crosses the grid, bottom level first
+    """
+    if np is None:
+        raise ImportError("marching squares requires NumPy")
+    grid = np.asarray(grid, dtype=float)
+    rows, columns = grid.shape
+    if rows < 2 or columns < 2 or not np.isfinite(grid).any():
+        return []
+    first, last = level_range(grid, interval, base)
+    if first > last:
+        return []
+
+    table = segment_table()
+    starts = []
+    ends = []
+    for row0 in range(0, rows - 1, BAND_ROWS):
+        band = grid[row0:min(row0 + BAND_ROWS, rows - 1) + 1]
+        s, e = block_segments(band, row0, 0, grid.shape, interval, base, first, table)
+        starts.append(s)
+        ends.append(e)
+    start = np.concatenate(starts)
+    end = np.concatenate(ends)
+    if not len(start):
+        return []
+
+    bounds, closed, keys, x, y, z = chain_vertices(start, end, grid, interval, base, first, origin, cell_size)
+
+    # a level through a grid point gives the same vertex on every edge that meets there, keep one of them
+    lengths = np.diff(bounds)
+    line_of = np.repeat(np.arange(len(lengths)), lengths)
+    keep = np.ones(len(x), dtype=bool)
+    keep[1:] = (x[1:] != x[:-1]) | (y[1:] != y[:-1]) | (line_of[1:] != line_of[:-1])
+    x = x[keep]
+    y = y[keep]
+    z = z[keep]
+    line_of = line_of[keep]
+    counts = np.bincount(line_of, minlength=len(lengths))
+    bounds = np.append(0, np.cumsum(counts))
+    points = np.column_stack((x, y)).tolist()
+
+    levels = {}
+    for n in range(len(lengths)):
+        # lines that collapsed into a point
+        if counts[n] < (4 if closed[n] else 2):
+            continue
+        line = points[bounds[n]:bounds[n + 1]]
+        if closed[n]:
+            line[-1] = line[0]
+        levels.setdefault(float(z[bounds[n]]), []).append(line)
+    return [(level, levels[level]) for level in sorted(levels)]
+
+
+def chain_vertices(start, end, grid, interval, base, first, origin, cell_size):
+    """
+    stitch segments into chains and place their vertices
+    :return: tuple (bounds, closed, keys, x, y, z), chain n owns the vertices bounds[n] to bounds[n + 1] - 1
+    """
+    order, chain, cyclic = stitch(start, end)
+    first_segment = np.append(0, np.nonzero(np.diff(chain))[0] + 1)
+    end_segment = np.append(first_segment[1:], len(order))
+    closed = cyclic[chain[first_segment]]
+
+    # a chain is the start points of its segments plus the end point of its last segment
+    keys = np.insert(start[order], end_segment, end[order][end_segment - 1])
+    x, y, z = edge_points(keys, grid, interval, base, first, origin, cell_size)
+    bounds = np.append(first_segment + np.arange(len(first_segment)), len(keys))
+    return bounds, closed, keys, x, y, z
+
+
+def line_points(xy, closed):
+    """
+    vertex list of one chain without repeated vertices
+    :param xy: float array (vertices, 2)
+    :param closed: True if the chain is a closed contour
+    :return: list of [x, y] vertices, None if the chain collapsed into a point
+    """
+    keep = np.ones(len(xy), dtype=bool)
+    keep[1:] = (xy[1:, 0] != xy[:-1, 0]) | (xy[1:, 1] != xy[:-1, 1])
+    xy = xy[keep]
+    if len(xy) < (4 if closed else 2):
+        return None
+    line = xy.tolist()
+    if closed:
+        line[-1] = line[0]
+    return line
+
+
+def load_ascii_grid(path):
+    """
+    read an ESRI ASCII grid
+    :param path: file name
+    :return: tuple (grid, origin, cell_size), the rows of the grid ordered south to north
+    """
+    header = {}
+    f = open(path)
+    try:
+        for _ in range(6):
+            position = f.tell()
+            line = f.readline().split()
+            if not line or not line[0][0].isalpha():
+                f.seek(position)
+                break
+            header[line[0].lower()] = float(line[1])
+        grid = np.loadtxt(f, dtype=float, ndmin=2)
+    finally:
+        f.close()
+    cell_size = header["cellsize"]
+    if "nodata_value" in header:
+        grid[grid == header["nodata_value"]] = np.nan
+    # the file starts with the northern row, the corner or the center of the south-west cell is given
+    grid = grid[::-1]
+    if "xllcenter" in header:
+        origin = (header["xllcenter"], header["yllcenter"])
+    else:
+        origin = (header["xllcorner"] + cell_size / 2.0, header["yllcorner"] + cell_size / 2.0)
+    return grid, origin, cell_size
+
+
+def load_xyz(path):
+    """
+    read a regular XYZ point grid, one "x y z" point per line in any order
+    :param path: file name
+    :return: tuple (grid, origin, cell_size), missing points are NaN
+    """
+    points = np.loadtxt(path, dtype=float, ndmin=2, usecols=(0, 1, 2))
+    xs = np.unique(points[:, 0])
+    ys = np.unique(points[:, 1])
+    cell_size = float(np.min(np.diff(xs))) if len(xs) > 1 else float(np.min(np.diff(ys)))
+    columns = np.rint((points[:, 0] - xs[0]) / cell_size).astype(np.int64)
+    rows = np.rint((points[:, 1] - ys[0]) / cell_size).astype(np.int64)
+    grid = np.full((rows.max() + 1, columns.max() + 1), np.nan)
+    grid[rows, columns] = points[:, 2]
+    return grid, (float(xs[0]), float(ys[0])), cell_size
@@ -0,0 +1,194 @@
+import os
+
+"""
+Streaming output sinks for the layout
+
+A sink receives the levels of the layout one after another and writes every level to its own sheet file as soon as
+it arrives, nothing of a level is kept once it has been written. Layers are given as a list of
+(LevelLayout attribute, layer name, (r, g, b)) entries, the labels go to their own layer as text.
+"""
+
+# stroke width of the vector lines, laser drivers treat it as a hairline
+STROKE_WIDTH = 0.01
+LABEL_HEIGHT = 1.0
+
+
+def sheet_path(path, index):
+    """
+    file of one sheet, the sheet number is appended to the file name
+    :param path: e.g. "C:/out/layout.svg"
+    :param index: position of the sheet
+    :return: e.g. "C:/out/layout_01.svg"
+    """
+    root, ext = os.path.splitext(path)
+    return root + "_" + str(index + 1).zfill(2) + ext
+
+
+def level_polylines(layout, layers, backend, tolerance):
+    """
+    discretize the curves of one level
+    :param layout: LevelLayout
+    :param layers: list of (attribute, layer name, color)
+    :param backend: geometryBackend backend that evaluates the curves
+    :param tolerance: float, maximum deviation of the polylines from the curves
+    :return: list of (layer name, color, list of [x, y] vertex lists)
+    """
+    result = []
+    for attribute, layer, color in layers:
+        polylines = [backend.vertices(c, tolerance, False) for c in getattr(layout, attribute)]
+        result.append((layer, color, polylines))
+    return result
+
+
+def polylines_box(entries, labels, frame=None):
+    """
+    2d bounding box of the discretized curves and the label points of one level
+    :param frame: sheet outline of a nested layout, returned as it is
+    :return: tuple (min_x, min_y, max_x, max_y)
+    """
+    if frame is not None:
+        return frame
+    xs = []
+    ys = []
+    for layer, color, polylines in entries:
+        for p in polylines:
+            xs.extend(v[0] for v in p)
+            ys.extend(v[1] for v in p)
+    for text, rings, point in labels:
+        xs.append(point[0])
+        ys.append(point[1])
+    if not xs:
+        return (0.0, 0.0, 0.0, 0.0)
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def hex_color(color):
+    return "#%02x%02x%02x" % tuple(color)
+
+
+class SvgSink:
+
+    def __init__(self, path, layers, label_layer, backend, tolerance):
+        """
+        one svg file per level, coordinates in model units with the sheet moved to the origin
+        :param path: base file name, see sheet_path
+        :param layers: list of (attribute, layer name, color)
+        :param label_layer: tuple (layer name, color) of the labels
+        :param backend: geometryBackend backend that evaluates the curves
+        :param tolerance: float, maximum deviation of the polylines from the curves
+        """
+        self.path = path
+        self.layers = layers
+        self.label_layer = label_layer
+        self.backend = backend
+        self.tolerance = tolerance
+        self.files = []
+
+    def write(self, layout):
+        """
+        write one level to its sheet file
+        :param layout: LevelLayout
+        """
+        entries = level_polylines(layout, self.layers, self.backend, self.tolerance)
+        min_x, min_y, max_x, max_y = polylines_box(entries, layout.labels, layout.frame)
+        width = max_x - min_x
+        height = max_y - min_y
+
+        path = sheet_path(self.path, layout.index)
+        f = open(path, "w")
+        try:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<svg xmlns="http://www.w3.org/2000/svg" width="%gmm" height="%gmm" viewBox="0 0 %g %g">\n' %
+                    (width, height, width, height))
+            # svg Y points down, flip the model around the top edge of the sheet
+            for layer, color, polylines in entries:
+                f.write('<g id="%s" fill="none" stroke="%s" stroke-width="%g">\n' %
+                        (layer, hex_color(color), STROKE_WIDTH))
+                for p in polylines:
+                    points = " ".join("%.4f,%.4f" % (v[0] - min_x, max_y - v[1]) for v in p)
+                    f.write('<polyline points="%s"/>\n' % points)
+                f.write('</g>\n')
+            layer, color = self.label_layer
+            f.write('<g id="%s" fill="%s" font-size="%g" text-anchor="middle">\n' %
+                    (layer, hex_color(color), LABEL_HEIGHT))
+            for text, rings, point in layout.labels:
+                f.write('<text x="%.4f" y="%.4f">%s</text>\n' % (point[0] - min_x, max_y - point[1], text))
+            f.write('</g>\n')
+            f.write('</svg>\n')
+        finally:
+            f.close()
+        self.files.append(path)
+
+    def close(self):
+        return self.files
+
+
+# AutoCAD color index of the most common layer colors, everything else maps to 7 (black/white)
+ACI = {(255, 0, 0): 1, (255, 255, 0): 2, (0, 255, 0): 3, (127, 255, 0): 3, (0, 255, 255): 4, (0, 0, 255): 5,
+       (255, 0, 255): 6}
+
+
+def aci_color(color):
+    return ACI.get(tuple(color), 7)
+
+
+class DxfSink:
+
+    def __init__(self, path, layers, label_layer, backend, tolerance):
+        """
+        one dxf file (R12, readable by every laser driver) per level, coordinates in model units
+        :param path: base file name, see sheet_path
+        :param layers: list of (attribute, layer name, color)
+        :param label_layer: tuple (layer name, color) of the labels
+        :param backend: geometryBackend backend that evaluates the curves
+        :param tolerance: float, maximum deviation of the polylines from the curves
+        """
+        self.path = path
+        self.layers = layers
+        self.label_layer = label_layer
+        self.backend = backend
+        self.tolerance = tolerance
+        self.files = []
+
+    def write(self, layout):
+        """
+        write one level to its sheet file
+        :param layout: LevelLayout
+        """
+        entries = level_polylines(layout, self.layers, self.backend, self.tolerance)
+        min_x, min_y, max_x, max_y = polylines_box(entries, layout.labels, layout.frame)
+        label_name = self.label_layer[0]
+
+        path = sheet_path(self.path, layout.index)
+        f = open(path, "w")
+        try:
+            f.write("0\nSECTION\n2\nTABLES\n0\nTABLE\n2\nLAYER\n70\n%d\n" % (len(entries) + 1))
+            for layer, color in [(e[0], e[1]) for e in entries] + [self.label_layer]:
+                f.write("0\nLAYER\n2\n%s\n70\n0\n62\n%d\n6\nCONTINUOUS\n" % (layer, aci_color(color)))
+            f.write("0\nENDTAB\n0\nENDSEC\n")
+
+            f.write("0\nSECTION\n2\nENTITIES\n")
+            for layer, color, polylines in entries:
+                for p in polylines:
+                    closed = 1 if len(p) > 2 and p[0] == p[-1] else 0
+                    if closed:
+                        p = p[:-1]
+                    f.write("0\nPOLYLINE\n8\n%s\n66\n1\n70\n%d\n" % (layer, closed))
+                    for v in p:
+                        f.write("0\nVERTEX\n8\n%s\n10\n%.4f\n20\n%.4f\n30\n0.0\n" %
+                                (layer, v[0] - min_x, v[1] - min_y))
+                    f.write("0\nSEQEND\n8\n%s\n" % layer)
+            for text, rings, point in layout.labels:
+                x = point[0] - min_x
+                y = point[1] - min_y
+                # horizontally centered on the label point like the text added to the document
+                f.write("0\nTEXT\n8\n%s\n10\n%.4f\n20\n%.4f\n30\n0.0\n40\n%g\n1\n%s\n" %
+                        (label_name, x, y, LABEL_HEIGHT, text))
+                f.write("72\n1\n11\n%.4f\n21\n%.4f\n31\n0.0\n" % (x, y))
+            f.write("0\nENDSEC\n0\nEOF\n")
+        finally:
+            f.close()
+        self.files.append(path)
+
+    def close(self):
+        return self.files
@@ -0,0 +1,416 @@
+import math
+
+import boxIndex as bi
+
+"""
+2d region construction for contour levels
+
+The boundary polygon is cut by the contour lines of one level. Contour lines of the same height never cross each
+other, so every clipped contour piece is either a chord that splits the face it lies in into two, or a closed loop
+that becomes a hole of its face and a new face of its own. The faces on both sides of a contour line lie on
+opposite sides of the terrain, the faces that hold the contours of the level above are the ones to keep.
+
+Rings are lists of [x, y] vertices with the first vertex repeated at the end.
+"""
+
+
+class Face:
+
+    def __init__(self, outer, holes=None):
+        """
+        planar face of the arrangement
+        :param outer: vertex ring of the outline
+        :param holes: list of vertex rings
+        """
+        self.outer = outer
+        self.holes = holes or []
+        self.bbox = ring_box(outer)
+
+    def contains(self, x, y):
+        if not bi.overlaps(self.bbox, bi.point_box(x, y)):
+            return False
+        if not point_in_ring(x, y, self.outer):
+            return False
+        for h in self.holes:
+            if point_in_ring(x, y, h):
+                return False
+        return True
+
+    def area(self):
+        return abs(ring_area(self.outer)) - sum(abs(ring_area(h)) for h in self.holes)
+
+
+class Boundary:
+
+    def __init__(self, ring, tolerance):
+        """
+        boundary polygon with an index over its edges
+        :param ring: vertex ring
+        :param tolerance: distance below which a point counts as lying on the boundary
+        """
+        self.ring = ring
+        self.tolerance = tolerance
+        self.segments = [(ring[k], ring[k + 1]) for k in range(len(ring) - 1)]
+        self.index = bi.BoxIndex([segment_box(a, b) for a, b in self.segments])
+
+    def intersections(self, p, q):
+        """
+        parameters along p-q where the segment crosses the boundary
+        :return: sorted list of floats between 0 and 1
+        """
+        params = []
+        for k in self.index.query(segment_box(p, q)):
+            hit = intersect_segments(p, q, self.segments[k][0], self.segments[k][1])
+            if hit is not None:
+                params.append(hit[0])
+        params.sort()
+        return params
+
+    def on_boundary(self, pt):
+        tol = self.tolerance
+        for k in self.index.query((pt[0] - tol, pt[1] - tol, pt[0] + tol, pt[1] + tol)):
+            a, b = self.segments[k]
+            if point_segment_distance(pt, a, b) <= tol:
+                return True
+        return False
+
+
+def build_regions(boundary_ring, contours, tolerance):
+    """
+    split a boundary polygon by the contour lines of one level
+    :param boundary_ring: vertex ring of the boundary
+    :param contours: list of contour polylines [[x, y], ...], open or closed
+    :param tolerance: model tolerance
+    :return: list of Face, list of separators as (polyline, closed) for every contour piece that was used
+    """
+    boundary = Boundary(boundary_ring, tolerance)
+    chords = []
+    loops = []
+    for c in contours:
+        closed = len(c) > 2 and distance(c[0], c[-1]) <= tolerance
+        for piece, piece_closed in clip_polyline(c, closed, boundary):
+            if piece_closed:
+                loops.append(piece)
+            elif boundary.on_boundary(piece[0]) and boundary.on_boundary(piece[-1]):
+                chords.append(piece)
+            # dangling pieces that end inside the boundary cannot split anything and are ignored
+
+    faces = [Face(boundary_ring)]
+    for chord in chords:
+        k = find_face(faces, interior_point(chord))
+        if k is None:
+            continue
+        faces[k:k + 1] = split_face(faces[k], chord)
+
+    # outer loops first, nested loops then fall into the face of their parent loop
+    loops.sort(key=lambda r: -abs(ring_area(r)))
+    for loop in loops:
+        k = find_face(faces, loop[0])
+        if k is None:
+            continue
+        faces[k].holes.append(loop)
+        faces.append(Face(loop))
+
+    separators = [(c, False) for c in chords] + [(l, True) for l in loops]
+    return faces, separators
+
+
+def select_faces(faces, separators, higher, lower, tolerance):
+    """
+    keep the faces above the level, the faces on both sides of a separator alternate between above and below
+    :param faces: list of Face
+    :param separators: contour pieces as returned by build_regions
+    :param higher: sample points of the contours of the level above
+    :param lower: sample points of the contours of the level below
+    :param tolerance: model tolerance, offset used to find the faces on both sides of a separator
+    :return: list of Face
+    """
+    # dual graph, two faces are neighbours if a contour piece separates them
+    neighbours = [[] for f in faces]
+    for polyline, closed in separators:
+        left, right = side_points(polyline, tolerance)
+        a = find_face(faces, left)
+        b = find_face(faces, right)
+        if a is not None and b is not None and a != b:
+            neighbours[a].append(b)
+            neighbours[b].append(a)
+
+    score = [0] * len(faces)
+    for pt in higher:
+        k = find_face(faces, pt)
+        if k is not None:
+            score[k] += 1
+    for pt in lower:
+        k = find_face(faces, pt)
+        if k is not None:
+            score[k] -= 1
+
+    # two-colour every connected component and keep the colour with the stronger evidence
+    colour = [None] * len(faces)
+    keep = []
+    for start in range(len(faces)):
+        if colour[start] is not None:
+            continue
+        colour[start] = 0
+        component = [start]
+        queue = [start]
+        while queue:
+            f = queue.pop()
+            for g in neighbours[f]:
+                if colour[g] is None:
+                    colour[g] = 1 - colour[f]
+                    component.append(g)
+                    queue.append(g)
+
+        evidence = sum(score[f] if colour[f] == 0 else -score[f] for f in component)
+        if evidence == 0:
+            # no neighbouring level to decide, keep the smaller side, hill tops are enclosed
+            area = sum(faces[f].area() if colour[f] == 0 else -faces[f].area() for f in component)
+            evidence = -area
+        keep_colour = 0 if evidence > 0 else 1
+        if len(component) == 1:
+            # nothing separates the face, keep it unless the level below lies inside
+            keep_colour = 0 if score[start] >= 0 else 1
+        keep.extend(f for f in component if colour[f] == keep_colour)
+
+    return [faces[f] for f in sorted(keep)]
+
+
+def clip_polyline(points, closed, boundary):
+    """
+    cut a polyline at the boundary and keep the pieces inside
+    :param points: polyline vertices
+    :param closed: True if the polyline is a closed loop
+    :param boundary: Boundary
+    :return: list of (piece, piece_closed)
+    """
+    pieces = [[points[0]]]
+    crossed = False
+    for k in range(len(points) - 1):
+        p = points[k]
+        q = points[k + 1]
+        for t in boundary.intersections(p, q):
+            x = [p[0] + t * (q[0] - p[0]), p[1] + t * (q[1] - p[1])]
+            if distance(x, pieces[-1][-1]) > 0:
+                pieces[-1].append(x)
+            pieces.append([x])
+            crossed = True
+        if distance(q, pieces[-1][-1]) > 0:
+            pieces[-1].append(q)
+
+    if closed and not crossed:
+        piece = pieces[0]
+        piece[-1] = piece[0]
+        if point_in_ring(piece[0][0], piece[0][1], boundary.ring):
+            return [(piece, True)]
+        return []
+
+    if closed and len(pieces) > 1:
+        # the run before the first and after the last crossing is one piece
+        pieces[0] = pieces.pop()[:-1] + pieces[0]
+
+    result = []
+    for piece in pieces:
+        if len(piece) < 2:
+            continue
+        pt = interior_point(piece)
+        if point_in_ring(pt[0], pt[1], boundary.ring):
+            result.append((piece, False))
+    return result
+
+
+def split_face(face, chord):
+    """
+    split a face along a chord whose end points lie on the outline of the face
+    :param face: Face
+    :param chord: polyline from outline to outline
+    :return: list of two Face
+    """
+    ring = face.outer[:-1]
+    n = len(ring)
+    ia, ta, pa = closest_edge(ring, chord[0])
+    ib, tb, pb = closest_edge(ring, chord[-1])
+    if (ia, ta) > (ib, tb):
+        chord = chord[::-1]
+        ia, ta, pa, ib, tb, pb = ib, tb, pb, ia, ta, pa
+    inner = chord[1:-1]
+
+    # from the chord start along the outline to the chord end and back along the chord
+    first = [pa] + [ring[k] for k in range(ia + 1, ib + 1)] + [pb] + inner[::-1] + [pa]
+    # from the chord end along the rest of the outline to the chord start and forward along the chord
+    second = [pb] + [ring[k % n] for k in range(ib + 1, ia + n + 1)] + [pa] + inner + [pb]
+
+    result = [Face(dedupe(first)), Face(dedupe(second))]
+    for h in face.holes:
+        if result[0].contains(h[0][0], h[0][1]):
+            result[0].holes.append(h)
+        else:
+            result[1].holes.append(h)
+    return result
+
+
+def find_face(faces, pt):
+    for k, f in enumerate(faces):
+        if f.contains(pt[0], pt[1]):
+            return k
+    return None
+
+
+def side_points(polyline, tolerance):
+    """
+    two points just left and right of the longest segment of a polyline
+    """
+    k = longest_segment(polyline)
+    a = polyline[k]
+    b = polyline[k + 1]
+    length = distance(a, b)
+    offset = min(tolerance, length / 4.0)
+    mx = (a[0] + b[0]) / 2.0
+    my = (a[1] + b[1]) / 2.0
+    nx = -(b[1] - a[1]) / length * offset
+    ny = (b[0] - a[0]) / length * offset
+    return [mx + nx, my + ny], [mx - nx, my - ny]
+
+
+def interior_point(polyline):
+    """
+    midpoint of the longest segment, away from the end points of the polyline
+    """
+    k = longest_segment(polyline)
+    a = polyline[k]
+    b = polyline[k + 1]
+    return [(a[0] + b[0]) / 2.0, (a[1] + b[1]) / 2.0]
+
+
+def longest_segment(polyline):
+    best = 0
+    best_length = -1.0
+    for k in range(len(polyline) - 1):
+        length = distance(polyline[k], polyline[k + 1])
+        if length > best_length:
+            best = k
+            best_length = length
+    return best
+
+
+def closest_edge(ring, pt):
+    """
+    edge of an open ring (last vertex not repeated) closest to a point
+    :return: tuple (edge index, parameter along the edge, closest point)
+    """
+    best = None
+    n = len(ring)
+    for k in range(n):
+        a = ring[k]
+        b = ring[(k + 1) % n]
+        dx = b[0] - a[0]
+        dy = b[1] - a[1]
+        length_sq = dx * dx + dy * dy
+        t = 0.0 if length_sq == 0 else ((pt[0] - a[0]) * dx + (pt[1] - a[1]) * dy) / length_sq
+        t = min(max(t, 0.0), 1.0)
+        c = [a[0] + t * dx, a[1] + t * dy]
+        d = distance(c, pt)
+        if best is None or d < best[0]:
+            best = (d, k, t, c)
+    return best[1], best[2], best[3]
+
+
+def intersect_segments(p, q, a, b):
+    """
+    proper or touching intersection of the segments p-q and a-b
+    :return: tuple (parameter along p-q, parameter along a-b) or None
+    """
+    rx = q[0] - p[0]
+    ry = q[1] - p[1]
+    sx = b[0] - a[0]
+    sy = b[1] - a[1]
+    denom = rx * sy - ry * sx
+    if denom == 0:
+        return None
+    wx = a[0] - p[0]
+    wy = a[1] - p[1]
+    t = (wx * sy - wy * sx) / denom
+    u = (wx * ry - wy * rx) / denom
+    if 0.0 <= t <= 1.0 and 0.0 <= u <= 1.0:
+        return t, u
+    return None
+
+
+def point_in_ring(x, y, ring):
+    """
+    even-odd point in polygon test
+    """
+    inside = False
+    for k in range(len(ring) - 1):
+        ax, ay = ring[k][0], ring[k][1]
+        bx, by = ring[k + 1][0], ring[k + 1][1]
+        if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+            inside = not inside
+    return inside
+
+
+def ring_parents(rings):
+    """
+    smallest ring around every ring, decided by its first vertex, rings of equal area are ordered by their index so
+    no ring ends up inside itself
+    :param rings: list of closed vertex rings, None for open curves
+    :return: list with the index of the parent ring or None for every ring
+    """
+    keys = [k for k in range(len(rings)) if rings[k] is not None]
+    boxes = dict((k, ring_box(rings[k])) for k in keys)
+    areas = dict((k, abs(ring_area(rings[k]))) for k in keys)
+    index = bi.BoxIndex([boxes[k] for k in keys])
+    parents = [None] * len(rings)
+    for k in keys:
+        x, y = rings[k][0][0], rings[k][0][1]
+        best = None
+        for n in index.query(bi.point_box(x, y)):
+            j = keys[n]
+            if (areas[j], j) <= (areas[k], k) or not point_in_ring(x, y, rings[j]):
+                continue
+            if best is None or (areas[j], j) < (areas[best], best):
+                best = j
+        parents[k] = best
+    return parents
+
+
+def point_segment_distance(pt, a, b):
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else ((pt[0] - a[0]) * dx + (pt[1] - a[1]) * dy) / length_sq
+    t = min(max(t, 0.0), 1.0)
+    return distance(pt, [a[0] + t * dx, a[1] + t * dy])
+
+
+def ring_area(ring):
+    """
+    signed area, positive for counter clockwise rings
+    """
+    area = 0.0
+    for k in range(len(ring) - 1):
+        area += ring[k][0] * ring[k + 1][1] - ring[k + 1][0] * ring[k][1]
+    return area / 2.0
+
+
+def ring_box(ring):
+    return (min(v[0] for v in ring), min(v[1] for v in ring), max(v[0] for v in ring), max(v[1] for v in ring))
+
+
+def segment_box(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1]))
+
+
+def distance(a, b):
+    return math.hypot(b[0] - a[0], b[1] - a[1])
+
+
+def dedupe(ring):
+    """
+    drop repeated consecutive vertices
+    """
+    result = [ring[0]]
+    for v in ring[1:]:
+        if v[0] != result[-1][0] or v[1] != result[-1][1]:
+            result.append(v)
+    return result
@@ -0,0 +1,262 @@
+import boxIndex as bi
+import planarRegions as pr
+
+try:
+    import numpy as np
+except ImportError:  # IronPython in Rhino 7 ships without NumPy
+    np = None
+
+"""
+Batch clipping of polylines against a boundary polygon
+
+All polylines are cut in one pass in the xy plane instead of one intersection and split call per curve. The edges
+of the boundary are bucketed into a uniform grid, segments whose bounding box misses the boundary are culled at
+once, the remaining segments are only paired with the edges in the cells they pass and every pair is tested in one
+vectorized step. The pieces between the crossings are classified by an even-odd test against the edges of the grid
+row of their interior point. Without NumPy the same steps run per segment on planarRegions.Boundary.
+
+Vertices keep all their coordinates, so curves keep their height; cut points get the height interpolated along the
+cut segment. Closed polylines repeat their first vertex at the end.
+"""
+
+
+class ClipBoundary:
+
+    def __init__(self, ring, cell_size=None):
+        """
+        boundary polygon prepared for clipping many polylines
+        :param ring: closed vertex ring
+        :param cell_size: edge length of the grid cells, the average extent of the boundary edges if None
+        """
+        self.ring = ring
+        self.box = pr.ring_box(ring)
+        boxes = [pr.segment_box(ring[k], ring[k + 1]) for k in range(len(ring) - 1)]
+        if cell_size is None:
+            cell_size = sum(max(b[2] - b[0], b[3] - b[1]) for b in boxes) / max(len(boxes), 1)
+        self.cell_size = max(cell_size, 1e-9)
+
+        if np is None:
+            self.boundary = pr.Boundary(ring, 0.0)
+            return
+
+        edges = np.array([(ring[k][0], ring[k][1], ring[k + 1][0], ring[k + 1][1]) for k in range(len(ring) - 1)],
+                         dtype=float).reshape(-1, 4)
+        self.ax, self.ay, self.bx, self.by = edges.T
+        self.columns = int((self.box[2] - self.box[0]) // self.cell_size) + 1
+        self.rows = int((self.box[3] - self.box[1]) // self.cell_size) + 1
+
+        i0, j0, i1, j1 = self.cell_range(np.minimum(self.ax, self.bx), np.minimum(self.ay, self.by),
+                                         np.maximum(self.ax, self.bx), np.maximum(self.ay, self.by))
+        edge, key = self.cells(i0, j0, i1, j1)
+        order = np.argsort(key, kind="mergesort")
+        self.cell_keys = key[order]
+        self.cell_edges = edge[order]
+
+        # edges by grid row for the point in polygon test
+        edge, row = expand(j0, j1 + 1)
+        order = np.argsort(row, kind="mergesort")
+        self.row_keys = row[order]
+        self.row_edges = edge[order]
+
+    def cell_range(self, min_x, min_y, max_x, max_y):
+        """
+        grid cells covered by boxes, clamped to the grid
+        :return: tuple of integer arrays (i0, j0, i1, j1)
+        """
+        def cell(v, low, count):
+            return np.clip(np.floor((v - low) / self.cell_size), 0, count - 1).astype(np.int64)
+        return (cell(min_x, self.box[0], self.columns), cell(min_y, self.box[1], self.rows),
+                cell(max_x, self.box[0], self.columns), cell(max_y, self.box[1], self.rows))
+
+    def cells(self, i0, j0, i1, j1):
+        """
+        every cell of every box
+        :return: tuple of arrays (box number, cell key)
+        """
+        box, i = expand(i0, i1 + 1)
+        cell, j = expand(j0[box], j1[box] + 1)
+        return box[cell], i[cell] * self.rows + j
+
+    def crossings(self, px, py, qx, qy):
+        """
+        points where segments p-q cross or touch the boundary
+        :param px, py, qx, qy: sequences of the segment end point coordinates
+        :return: tuple of lists (segment numbers, parameters along the segments)
+        """
+        if np is None:
+            segments = []
+            params = []
+            for n in range(len(px)):
+                p = (px[n], py[n])
+                q = (qx[n], qy[n])
+                if not bi.overlaps(pr.segment_box(p, q), self.box):
+                    continue
+                for t in self.boundary.intersections(p, q):
+                    segments.append(n)
+                    params.append(t)
+            return segments, params
+
+        px, py, qx, qy = [np.asarray(v, dtype=float) for v in (px, py, qx, qy)]
+        min_x = np.minimum(px, qx)
+        min_y = np.minimum(py, qy)
+        max_x = np.maximum(px, qx)
+        max_y = np.maximum(py, qy)
+        near = np.nonzero((max_x >= self.box[0]) & (min_x <= self.box[2]) &
+                          (max_y >= self.box[1]) & (min_y <= self.box[3]))[0]
+        i0, j0, i1, j1 = self.cell_range(min_x[near], min_y[near], max_x[near], max_y[near])
+        box, key = self.cells(i0, j0, i1, j1)
+        cell, pos = join(self.cell_keys, key)
+
+        # a segment meets an edge once per shared cell
+        count = len(self.ax)
+        pairs = np.unique(near[box[cell]] * count + self.cell_edges[pos])
+        s = pairs // count
+        e = pairs % count
+
+        rx = qx[s] - px[s]
+        ry = qy[s] - py[s]
+        sx = self.bx[e] - self.ax[e]
+        sy = self.by[e] - self.ay[e]
+        wx = self.ax[e] - px[s]
+        wy = self.ay[e] - py[s]
+        denom = rx * sy - ry * sx
+        parallel = denom == 0
+        denom = np.where(parallel, 1.0, denom)
+        t = (wx * sy - wy * sx) / denom
+        u = (wx * ry - wy * rx) / denom
+        hit = ~parallel & (t >= 0.0) & (t <= 1.0) & (u >= 0.0) & (u <= 1.0)
+        return s[hit].tolist(), t[hit].tolist()
+
+    def contains(self, x, y):
+        """
+        even-odd test of many points
+        :param x, y: sequences of coordinates
+        :return: list of booleans
+        """
+        if np is None:
+            return [bi.overlaps(bi.point_box(x[n], y[n]), self.box) and pr.point_in_ring(x[n], y[n], self.ring)
+                    for n in range(len(x))]
+
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        inside = np.zeros(len(x), dtype=bool)
+        near = np.nonzero((x >= self.box[0]) & (x <= self.box[2]) & (y >= self.box[1]) & (y <= self.box[3]))[0]
+        row = np.floor((y[near] - self.box[1]) / self.cell_size).astype(np.int64)
+        point, pos = join(self.row_keys, np.minimum(row, self.rows - 1))
+        e = self.row_edges[pos]
+        px = x[near][point]
+        py = y[near][point]
+        ay = self.ay[e]
+        by = self.by[e]
+        spans = (ay > py) != (by > py)
+        dy = np.where(spans, by - ay, 1.0)
+        crossed = spans & (px < self.ax[e] + (py - ay) * (self.bx[e] - self.ax[e]) / dy)
+        inside[near] = np.bincount(point[crossed], minlength=len(near)) % 2 == 1
+        return inside.tolist()
+
+
+def expand(lo, hi):
+    """
+    every index of the half open ranges lo..hi
+    :param lo, hi: integer arrays
+    :return: tuple of arrays (range number, index)
+    """
+    counts = np.maximum(hi - lo, 0)
+    owner = np.repeat(np.arange(len(lo)), counts)
+    offsets = np.cumsum(counts) - counts
+    return owner, lo[owner] + np.arange(len(owner)) - offsets[owner]
+
+
+def join(sorted_keys, keys):
+    """
+    all positions of every key in a sorted key array
+    :return: tuple of arrays (number of the key, position in sorted_keys)
+    """
+    lo = np.searchsorted(sorted_keys, keys, side="left")
+    hi = np.searchsorted(sorted_keys, keys, side="right")
+    return expand(lo, hi)
+
+
+def clip_polylines(polylines, ring, cell_size=None):
+    """
+    cut polylines at a boundary polygon and keep the pieces inside
+    :param polylines: list of vertex lists, [x, y] or [x, y, z], closed polylines repeat their first vertex
+    :param ring: closed vertex ring of the boundary
+    :param cell_size: edge length of the grid cells, see ClipBoundary
+    :return: list with None for every polyline that lies inside as a whole and the list of inside pieces for the
+        others, an empty list for polylines outside
+    """
+    boundary = ClipBoundary(ring, cell_size)
+
+    px, py, qx, qy = [], [], [], []
+    first = []  # number of the first segment of every polyline
+    for points in polylines:
+        first.append(len(px))
+        for k in range(len(points) - 1):
+            px.append(points[k][0])
+            py.append(points[k][1])
+            qx.append(points[k + 1][0])
+            qy.append(points[k + 1][1])
+    first.append(len(px))
+
+    # parameters of the cuts by polyline and segment
+    owner = []
+    n = 0
+    for s in range(len(px)):
+        while first[n + 1] <= s:
+            n += 1
+        owner.append(n)
+    cuts = {}
+    segments, params = boundary.crossings(px, py, qx, qy)
+    for s, t in zip(segments, params):
+        n = owner[s]
+        cuts.setdefault(n, {}).setdefault(s - first[n], []).append(t)
+
+    pieces = {}
+    tests = []  # (polyline number, piece number or None, test point)
+    for n, points in enumerate(polylines):
+        if len(points) < 2:
+            continue
+        if n not in cuts:
+            tests.append((n, None, points[0]))
+            continue
+        pieces[n] = cut(points, cuts[n])
+        for m, piece in enumerate(pieces[n]):
+            tests.append((n, m, pr.interior_point(piece)))
+
+    inside = boundary.contains([pt[0] for _, _, pt in tests], [pt[1] for _, _, pt in tests])
+    result = [None] * len(polylines)
+    for n in pieces:
+        result[n] = []
+    for (n, m, _), keep in zip(tests, inside):
+        if m is None:
+            if not keep:
+                result[n] = []
+        elif keep:
+            result[n].append(pieces[n][m])
+    return result
+
+
+def cut(points, cuts):
+    """
+    split a polyline at parameters along its segments
+    :param points: vertex list
+    :param cuts: dict segment number: list of parameters
+    :return: list of pieces, the runs of a closed polyline before the first and after the last cut are joined
+    """
+    pieces = [[points[0]]]
+    for k in range(len(points) - 1):
+        p = points[k]
+        q = points[k + 1]
+        for t in sorted(cuts.get(k, ())):
+            x = [p[i] + t * (q[i] - p[i]) for i in range(len(p))]
+            if pr.distance(x, pieces[-1][-1]) > 0:
+                pieces[-1].append(x)
+            pieces.append([x])
+        if pr.distance(q, pieces[-1][-1]) > 0:
+            pieces[-1].append(q)
+
+    closed = len(points) > 2 and points[0] == points[-1]
+    if closed and len(pieces) > 1:
+        pieces[0] = pieces.pop()[:-1] + pieces[0]
+    return [piece for piece in pieces if len(piece) > 1]
@@ -0,0 +1,170 @@
+import heapq
+import math
+
+try:
+    import numpy as np
+except ImportError:  # IronPython in Rhino 7 ships without NumPy
+    np = None
+
+"""
+Tolerance based polyline simplification
+
+Douglas-Peucker keeps every vertex needed to stay within an absolute distance of the input, Visvalingam-Whyatt
+drops the vertices with the smallest effective triangle area first. Polylines are lists of [x, y] vertices, closed
+rings repeat their first vertex at the end and stay closed. Needs no Rhino and runs in worker processes.
+"""
+
+DOUGLAS_PEUCKER = "dp"
+VISVALINGAM_WHYATT = "vw"
+
+
+def douglas_peucker(points, tolerance):
+    """
+    keep the vertices needed to stay within tolerance of the input, NumPy is used for the distances if available
+    :param points: list of [x, y] vertices
+    :param tolerance: float, maximum distance between input and result in model units
+    :return: list of [x, y] vertices
+    """
+    n = len(points)
+    if n < 3:
+        return [list(p) for p in points]
+    keep = [False] * n
+    keep[0] = keep[n - 1] = True
+    pts = np.asarray(points, dtype=float) if np is not None else points
+
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        if np is not None:
+            k, dist = farthest_vertex_np(pts, i, j)
+        else:
+            k, dist = farthest_vertex(pts, i, j)
+        if dist > tolerance:
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+
+    return [[float(points[k][0]), float(points[k][1])] for k in range(n) if keep[k]]
+
+
+def farthest_vertex_np(pts, i, j):
+    """
+    vertex between i and j farthest from the segment i-j
+    :return: tuple (index, distance)
+    """
+    a = pts[i]
+    d = pts[j] - a
+    v = pts[i + 1:j] - a
+    length_sq = d[0] * d[0] + d[1] * d[1]
+    if length_sq == 0:
+        dist = np.hypot(v[:, 0], v[:, 1])
+    else:
+        t = np.clip((v[:, 0] * d[0] + v[:, 1] * d[1]) / length_sq, 0.0, 1.0)
+        dist = np.hypot(v[:, 0] - t * d[0], v[:, 1] - t * d[1])
+    k = int(np.argmax(dist))
+    return i + 1 + k, float(dist[k])
+
+
+def farthest_vertex(pts, i, j):
+    ax, ay = pts[i][0], pts[i][1]
+    dx = pts[j][0] - ax
+    dy = pts[j][1] - ay
+    length_sq = dx * dx + dy * dy
+    best = i + 1
+    best_dist = -1.0
+    for k in range(i + 1, j):
+        vx = pts[k][0] - ax
+        vy = pts[k][1] - ay
+        t = 0.0 if length_sq == 0 else min(max((vx * dx + vy * dy) / length_sq, 0.0), 1.0)
+        dist = math.hypot(vx - t * dx, vy - t * dy)
+        if dist > best_dist:
+            best = k
+            best_dist = dist
+    return best, best_dist
+
+
+def visvalingam_whyatt(points, tolerance):
+    """
+    repeatedly drop the vertex with the smallest effective area until every remaining triangle is larger than
+    tolerance squared
+    :param points: list of [x, y] vertices
+    :param tolerance: float in model units, the area threshold is its square
+    :return: list of [x, y] vertices
+    """
+    n = len(points)
+    if n < 3:
+        return [list(p) for p in points]
+    threshold = tolerance * tolerance
+    prev = list(range(-1, n - 1))
+    following = list(range(1, n + 1))
+    area = [float("inf")] * n
+    heap = []
+    for k in range(1, n - 1):
+        area[k] = triangle_area(points[k - 1], points[k], points[k + 1])
+        heap.append((area[k], k))
+    heapq.heapify(heap)
+
+    removed = [False] * n
+    while heap:
+        a, k = heapq.heappop(heap)
+        if removed[k] or a != area[k]:
+            continue
+        if a > threshold:
+            break
+        removed[k] = True
+        p = prev[k]
+        q = following[k]
+        following[p] = q
+        prev[q] = p
+        # a neighbour never gets a smaller effective area than the vertex removed before it
+        for m in (p, q):
+            if 0 < m < n - 1:
+                area[m] = max(triangle_area(points[prev[m]], points[m], points[following[m]]), a)
+                heapq.heappush(heap, (area[m], m))
+
+    return [[float(points[k][0]), float(points[k][1])] for k in range(n) if not removed[k]]
+
+
+def triangle_area(a, b, c):
+    return abs((b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])) / 2.0
+
+
+def simplify(points, tolerance, method=DOUGLAS_PEUCKER):
+    """
+    simplify one polyline
+    :param points: list of [x, y] vertices
+    :param tolerance: float in model units
+    :param method: DOUGLAS_PEUCKER or VISVALINGAM_WHYATT
+    :return: list of [x, y] vertices
+    """
+    if method == VISVALINGAM_WHYATT:
+        return visvalingam_whyatt(points, tolerance)
+    return douglas_peucker(points, tolerance)
+
+
+def simplify_batch(polylines, tolerance, method=DOUGLAS_PEUCKER):
+    """
+    simplify a batch of polylines, one job of the worker pool
+    :return: list of polylines
+    """
+    return [simplify(p, tolerance, method) for p in polylines]
+
+
+def batches(polylines, count):
+    """
+    split a list into count batches of about the same number of vertices
+    :return: list of lists
+    """
+    total = sum(len(p) for p in polylines)
+    size = max(1, total // max(count, 1))
+    result = [[]]
+    vertices = 0
+    for p in polylines:
+        if vertices >= size:
+            result.append([])
+            vertices = 0
+        result[-1].append(p)
+        vertices += len(p)
+    return result
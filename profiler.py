@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+import timeit
+
+"""
+Stage timings and geometry call counters for the isohypsen commands
+
+Disabled by default, span() then returns a shared object that does nothing and count() returns right away, so the
+instrumented code pays one global lookup per call. A command enables it with start(), which reads the environment
+variable ISOHYPSEN_PROFILE: "1" prints a summary at the end of the command, any other value is taken as the path of
+a JSON file the results are written to as well.
+
+Spans of levels that run in parallel add up, the total of a stage can exceed the wall time of the command. Counters
+of work that runs in worker processes are not collected.
+"""
+
+ENV_VARIABLE = "ISOHYPSEN_PROFILE"
+
+enabled = False
+dump_path = None
+stages = {}  # stage: [calls, seconds]
+levels = {}  # stage: {level: seconds}
+counters = {}
+lock = threading.Lock()
+
+
+class Span:
+
+    def __init__(self, stage, level):
+        self.stage = stage
+        self.level = level
+        self.start = None
+
+    def __enter__(self):
+        self.start = timeit.default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        add_time(self.stage, self.level, timeit.default_timer() - self.start)
+        return False
+
+
+class NoSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NO_SPAN = NoSpan()
+
+
+def span(stage, level=None):
+    """
+    time a block, use as a with statement
+    :param stage: name of the stage
+    :param level: index of the level, None for stages that run once per command
+    :return: context manager
+    """
+    if not enabled:
+        return NO_SPAN
+    return Span(stage, level)
+
+
+def count(name, n=1):
+    """
+    add to a counter, e.g. the number of intersections of a split
+    """
+    if not enabled:
+        return
+    with lock:
+        counters[name] = counters.get(name, 0) + n
+
+
+def add_time(stage, level, seconds):
+    with lock:
+        entry = stages.setdefault(stage, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        if level is not None:
+            per_level = levels.setdefault(stage, {})
+            per_level[level] = per_level.get(level, 0.0) + seconds
+
+
+def start(path=None):
+    """
+    reset the results and enable the profiler if ISOHYPSEN_PROFILE is set or a path is given
+    :param path: JSON file for the results, overrides the environment variable
+    """
+    global enabled, dump_path
+    setting = path or os.environ.get(ENV_VARIABLE)
+    enabled = bool(setting) and setting != "0"
+    dump_path = setting if enabled and setting != "1" else None
+    stages.clear()
+    levels.clear()
+    counters.clear()
+
+
+def results():
+    """
+    :return: dict with the stages, the per level times and the counters
+    """
+    with lock:
+        return {"stages": dict((s, {"calls": c, "seconds": t}) for s, (c, t) in stages.items()),
+                "levels": dict((s, dict((str(k), v) for k, v in per_level.items()))
+                               for s, per_level in levels.items()),
+                "counters": dict(counters)}
+
+
+def summary(slowest=3):
+    """
+    readable table of the results
+    :param slowest: number of the slowest levels listed per stage
+    :return: string
+    """
+    lines = ["%-22s %8s %10s" % ("stage", "calls", "seconds")]
+    with lock:
+        for stage in sorted(stages, key=lambda s: -stages[s][1]):
+            calls, seconds = stages[stage]
+            lines.append("%-22s %8d %10.3f" % (stage, calls, seconds))
+            per_level = levels.get(stage)
+            if per_level:
+                worst = sorted(per_level.items(), key=lambda item: -item[1])[:slowest]
+                lines.append("    slowest levels: " + ", ".join("%s (%.3fs)" % item for item in worst))
+        for name in sorted(counters):
+            lines.append("%-22s %19d" % (name, counters[name]))
+    return "\n".join(lines)
+
+
+def finish():
+    """
+    disable the profiler and write the JSON file if one was requested
+    :return: summary string, None if the profiler was disabled
+    """
+    global enabled
+    if not enabled:
+        return None
+    enabled = False
+    if dump_path:
+        f = open(dump_path, "w")
+        try:
+            json.dump(results(), f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+    return summary()
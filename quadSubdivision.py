@@ -1,8 +1,20 @@
 import heapq
 import math
+import time
 
-import Rhino
-import rhinoscriptsyntax as rs
+import geometryBackend as gb
+import profiler as pf
+import segmentIndex as si
+
+try:
+    import rhinoscriptsyntax as rs
+except ImportError:  # headless, the curve engine runs on geometryBackend.PolylineBackend
+    rs = None
+
+try:
+    import numpy as np
+except ImportError:  # IronPython in Rhino 7 ships without NumPy
+    np = None
 
 """
 Pole of inaccessibility label script for Rhino 7
@@ -22,20 +34,64 @@ https://discourse.mcneel.com/t/confused-about-behavior-of-curve-closestpoint/799
 """
 
 
+class Budget:
+
+    def __init__(self, relative=None, cells=None, seconds=None):
+        """
+        limits for the search of one polygon, the search stops at the first limit it reaches and returns the best
+        cell so far
+        :param relative: tolerance as a fraction of the shorter side of the bounding box, replaces the absolute
+                         tolerance, so large polygons stop early and small islands are still refined
+        :param cells: maximum number of evaluated cells
+        :param seconds: wall clock time
+        """
+        self.relative = relative
+        self.cells = cells
+        self.seconds = seconds
+
+    def key(self):
+        """
+        the limits that make a result reproducible, the time limit depends on the machine and is left out
+        """
+        return "%r;%r" % (self.relative, self.cells)
+
+    def tolerance(self, tolerance, width, height):
+        if self.relative is None:
+            return tolerance
+        return self.relative * min(width, height)
+
+    def deadline(self):
+        if self.seconds is None:
+            return None
+        return time.time() + self.seconds
+
+    def exhausted(self, cells, deadline):
+        """
+        True if evaluating more cells would exceed the budget
+        :param cells: number of cells evaluated so far
+        :param deadline: result of deadline() at the start of the search
+        """
+        if self.cells is not None and cells >= self.cells:
+            return True
+        return deadline is not None and time.time() >= deadline
+
+
 class Cell:
 
-    def __init__(self, x, y, h, polygon):
+    def __init__(self, x, y, h, polygon, backend=None):
         """
         create object to store cell data
         :param x: 3d point
         :param y: 3d point
         :param h: height and with of the cell
-        :param polygon: polygon or curve to test
+        :param polygon: polygon or curve to test, or a segmentIndex.SegmentIndex built from it
+        :param backend: geometryBackend backend that evaluates the curve
         """
         self.x = x
         self.y = y
         self.h = h
         self.polygon = polygon
+        self.backend = backend
         self.centroid = [x + (h / 2.0), y + (h / 2.0), 0]
         self.radius_dist = (h * 1.4142135623730951) / 2.0  # "radius_dist" equals the diagonal times sqr(2) divided by 2
         self.distance = self.calc_cell_dist()
@@ -79,64 +135,346 @@ class Cell:
         calculate the weight of the quad and return positive number if the centroid falls inside the polygon
         :return: float
         """
-        param = rs.CurveClosestPoint(self.polygon, self.centroid)
-        crv_pt = rs.EvaluateCurve(self.polygon, param)
+        if isinstance(self.polygon, si.SegmentIndex):
+            return self.polygon.signed_distance(self.centroid[0], self.centroid[1])
 
-        quad_weight = rs.Distance(self.centroid, crv_pt)
+        crv_pt = self.backend.closest_point(self.polygon, self.centroid)
 
-        in_out_check = rs.PointInPlanarClosedCurve(self.centroid, self.polygon)
+        quad_weight = math.sqrt((self.centroid[0] - crv_pt[0]) ** 2 + (self.centroid[1] - crv_pt[1]) ** 2 +
+                                (self.centroid[2] - crv_pt[2]) ** 2)
 
-        if in_out_check == 0:
+        if not self.backend.point_in_curve(self.centroid, self.polygon):
             quad_weight = -quad_weight
         return quad_weight
 
 
-def circle_of_inaccessibility(polygon, tolerance=1.0):
+def circle_of_inaccessibility(polygon, tolerance=1.0, backend=None, budget=None):
     """
     find largest inscribed circle of any polygon or closed curve
-    :param polygon: polygon or curve object
+    :param polygon: polygon or curve object, or a segmentIndex.SegmentIndex built from it
     :param tolerance: float, default 1.0
+    :param backend: geometryBackend backend that evaluates the curve, the Rhino backend inside Rhino
+    :param budget: Budget or None to refine until the tolerance is reached
     :return: 3d point that defines the center of the largest inscribed circle of the polygon
     """
-    bbox = rs.BoundingBox(polygon)
-    bbox_width = rs.Distance(bbox[0], bbox[1])
-    bbox_height = rs.Distance(bbox[1], bbox[2])
+    return inscribed_circle(polygon, tolerance, backend, budget)[0]
+
+
+def inscribed_circle(polygon, tolerance=1.0, backend=None, budget=None):
+    """
+    largest inscribed circle found within the tolerance or the budget, see circle_of_inaccessibility
+    :return: tuple (3d center point, radius, upper bound of the radius of the largest inscribed circle)
+    """
+    if isinstance(polygon, si.SegmentIndex):
+        minX, minY, maxX, maxY = polygon.bounds
+        centroid_x, centroid_y = polygon.centroid
+    else:
+        backend = backend or gb.default_backend()
+        minX, minY, maxX, maxY = backend.bbox(polygon)
+        polygon_centroid = backend.centroid(polygon)
+        centroid_x = polygon_centroid[0]
+        centroid_y = polygon_centroid[1]
+    bbox_width = maxX - minX
+    bbox_height = maxY - minY
+
+    deadline = None
+    if budget is not None:
+        tolerance = budget.tolerance(tolerance, bbox_width, bbox_height)
+        deadline = budget.deadline()
 
     cell_size = min(bbox_width, bbox_height)
 
     cell_size = cell_size / 6
 
-    minX = bbox[0].X
-    minY = bbox[0].Y
-
     xcount = math.ceil(bbox_width / cell_size)
     ycount = math.ceil(bbox_height / cell_size)
 
     cell_queue = []
 
     # start with a comparison cell that is equal to the centroid of the polygon
-    polygon_centroid = rs.CurveAreaCentroid(polygon)
-    best_cell = Cell(polygon_centroid[0].X - (cell_size / 2), polygon_centroid[0].Y - (cell_size / 2), cell_size,
-                     polygon)
+    best_cell = Cell(centroid_x - (cell_size / 2), centroid_y - (cell_size / 2), cell_size, polygon, backend)
 
     for i in range(0, int(xcount)):
         for j in range(0, int(ycount)):
-            c = Cell(minX + (i * cell_size), minY + (j * cell_size), cell_size, polygon)
+            c = Cell(minX + (i * cell_size), minY + (j * cell_size), cell_size, polygon, backend)
             heapq.heappush(cell_queue, c)
+    cells = len(cell_queue) + 1
+
+    # largest possible distance inside the cells that were not split
+    bound = best_cell.distance
 
     while cell_queue:
+        if budget is not None and budget.exhausted(cells, deadline):
+            # the queue is ordered by max_distance, its head bounds every cell that is left
+            bound = max(bound, cell_queue[0].max_distance)
+            pf.count("polylabel budget stops")
+            break
+
         cell = heapq.heappop(cell_queue)
 
         if cell.distance > best_cell.distance:
             best_cell = cell
 
         if cell.max_distance - best_cell.distance <= tolerance:
+            bound = max(bound, cell.max_distance)
             continue
 
         h = cell.h / 2.0
-        heapq.heappush(cell_queue, Cell(cell.x, cell.y, h, polygon))
-        heapq.heappush(cell_queue, Cell(cell.x + h, cell.y, h, polygon))
-        heapq.heappush(cell_queue, Cell(cell.x, cell.y + h, h, polygon))
-        heapq.heappush(cell_queue, Cell(cell.x + h, cell.y + h, h, polygon))
+        heapq.heappush(cell_queue, Cell(cell.x, cell.y, h, polygon, backend))
+        heapq.heappush(cell_queue, Cell(cell.x + h, cell.y, h, polygon, backend))
+        heapq.heappush(cell_queue, Cell(cell.x, cell.y + h, h, polygon, backend))
+        heapq.heappush(cell_queue, Cell(cell.x + h, cell.y + h, h, polygon, backend))
+        cells += 4
+
+    pf.count("polylabel cells", cells)
+    return best_cell.centroid, best_cell.distance, max(bound, best_cell.distance)
+
+
+# Vectorized engine
+# The curve is discretized once into vertex rings, every generation of cells is scored at once with batched
+# point-to-segment distances and an even-odd inside test. Requires NumPy.
+
+SQRT2_HALF = 0.7071067811865476
 
-    return best_cell.centroid
+# upper bound for the number of point/segment pairs evaluated in one batch, keeps the memory footprint flat
+BATCH_SIZE = 2 ** 21
+
+
+def curve_to_vertices(polygon, tolerance=0.1, closed=True, backend=None):
+    """
+    discretize a closed curve into a ring of 2d vertices
+    :param polygon: polygon or curve object
+    :param tolerance: float, maximum deviation of the polyline from the curve
+    :param closed: True = repeat the first vertex at the end, False = keep open curves open
+    :param backend: geometryBackend backend that evaluates the curve
+    :return: list of [x, y] vertices, first vertex equals the last
+    """
+    return (backend or gb.default_backend()).vertices(polygon, tolerance, closed)
+
+
+def ring_segments(rings):
+    """
+    collect the edges of a set of rings into coordinate arrays
+    :param rings: list of vertex rings, holes are handled by the even-odd rule
+    :return: tuple of arrays (ax, ay, bx, by)
+    """
+    ax, ay, bx, by = [], [], [], []
+    for ring in rings:
+        r = np.asarray(ring, dtype=float)
+        ax.append(r[:-1, 0])
+        ay.append(r[:-1, 1])
+        bx.append(r[1:, 0])
+        by.append(r[1:, 1])
+    return np.concatenate(ax), np.concatenate(ay), np.concatenate(bx), np.concatenate(by)
+
+
+def signed_distances(px, py, segments):
+    """
+    distance of every point to the closest segment, negative if the point lies outside
+    :param px: array of x coordinates
+    :param py: array of y coordinates
+    :param segments: tuple of arrays (ax, ay, bx, by)
+    :return: array of floats
+    """
+    ax, ay, bx, by = segments
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx * dx + dy * dy
+    length_sq[length_sq == 0] = 1.0
+
+    result = np.empty(len(px))
+    step = max(1, BATCH_SIZE // len(ax))
+    for start in range(0, len(px), step):
+        x = px[start:start + step, None]
+        y = py[start:start + step, None]
+
+        # closest point on each segment
+        t = np.clip(((x - ax) * dx + (y - ay) * dy) / length_sq, 0.0, 1.0)
+        ex = ax + t * dx - x
+        ey = ay + t * dy - y
+        dist = np.sqrt((ex * ex + ey * ey).min(axis=1))
+
+        # even-odd rule, count the edges crossed by a ray in +X
+        straddle = (ay > y) != (by > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = ax + (y - ay) * dx / (by - ay)
+        inside = (np.count_nonzero(straddle & (x < x_cross), axis=1) % 2) == 1
+
+        result[start:start + step] = np.where(inside, dist, -dist)
+    return result
+
+
+def rings_centroid(rings):
+    """
+    area centroid of a set of rings
+    :param rings: list of vertex rings
+    :return: tuple (x, y)
+    """
+    area = cx = cy = 0.0
+    for ring in rings:
+        r = np.asarray(ring, dtype=float)
+        x0, y0, x1, y1 = r[:-1, 0], r[:-1, 1], r[1:, 0], r[1:, 1]
+        cross = x0 * y1 - x1 * y0
+        area += cross.sum()
+        cx += ((x0 + x1) * cross).sum()
+        cy += ((y0 + y1) * cross).sum()
+    if area == 0:
+        r = np.asarray(rings[0], dtype=float)
+        return r[:, 0].mean(), r[:, 1].mean()
+    return cx / (3.0 * area), cy / (3.0 * area)
+
+
+def polylabel_rings(rings, tolerance=1.0, budget=None):
+    """
+    find the pole of inaccessibility of a set of vertex rings
+    :param rings: list of vertex rings, the first one is the outline, further rings are holes
+    :param tolerance: float, default 1.0
+    :param budget: Budget or None to refine until the tolerance is reached
+    :return: 3d point that defines the center of the largest inscribed circle of the polygon
+    """
+    return inscribed_circle_rings(rings, tolerance, budget)[0]
+
+
+def inscribed_circle_rings(rings, tolerance=1.0, budget=None):
+    """
+    largest inscribed circle of a set of vertex rings found within the tolerance or the budget, the budget is
+    checked before every generation of cells after the first one, see polylabel_rings
+    :return: tuple (3d center point, radius, upper bound of the radius of the largest inscribed circle)
+    """
+    segments = ring_segments(rings)
+    vertices = np.concatenate([np.asarray(r, dtype=float) for r in rings])
+    minX, minY = vertices.min(axis=0)
+    maxX, maxY = vertices.max(axis=0)
+    bbox_width = maxX - minX
+    bbox_height = maxY - minY
+
+    cell_size = min(bbox_width, bbox_height) / 6
+    if cell_size == 0:
+        return [minX, minY, 0], 0.0, 0.0
+
+    deadline = None
+    if budget is not None:
+        tolerance = budget.tolerance(tolerance, bbox_width, bbox_height)
+        deadline = budget.deadline()
+
+    # start with a comparison cell that is equal to the centroid of the polygon
+    best_x, best_y = rings_centroid(rings)
+    best_distance = signed_distances(np.array([best_x]), np.array([best_y]), segments)[0]
+    bound = best_distance
+
+    xcount = int(math.ceil(bbox_width / cell_size))
+    ycount = int(math.ceil(bbox_height / cell_size))
+    gx, gy = np.meshgrid(np.arange(xcount), np.arange(ycount), indexing="ij")
+    x = minX + gx.ravel() * cell_size
+    y = minY + gy.ravel() * cell_size
+    upper = None  # max_distance of the parent of every cell, None for the first generation
+    h = cell_size
+    cells = 1
+    stopped = False
+
+    while len(x):
+        if upper is not None and budget is not None:
+            if budget.exhausted(cells, deadline):
+                bound = max(bound, upper.max())
+                stopped = True
+                break
+            if budget.cells is not None and cells + len(x) > budget.cells:
+                # evaluate the most promising cells that fit into the budget, the others only bound the result
+                order = np.argsort(-upper, kind="mergesort")
+                rest = order[budget.cells - cells:]
+                bound = max(bound, upper[rest].max())
+                stopped = True
+                keep = order[:budget.cells - cells]
+                x, y, upper = x[keep], y[keep], upper[keep]
+        cells += len(x)
+        cx = x + h / 2.0
+        cy = y + h / 2.0
+        distance = signed_distances(cx, cy, segments)
+
+        k = np.argmax(distance)
+        if distance[k] > best_distance:
+            best_distance = distance[k]
+            best_x, best_y = cx[k], cy[k]
+
+        # keep only the cells that may still contain a better centroid and split them into four
+        max_distance = distance + h * SQRT2_HALF
+        refine = max_distance - best_distance > tolerance
+        if not refine.all():
+            bound = max(bound, max_distance[~refine].max())
+        x = x[refine]
+        y = y[refine]
+        upper = np.tile(max_distance[refine], 4)
+        h = h / 2.0
+        x = np.concatenate((x, x + h, x, x + h))
+        y = np.concatenate((y, y, y + h, y + h))
+
+    if stopped:
+        pf.count("polylabel budget stops")
+    pf.count("polylabel cells", cells)
+    return [float(best_x), float(best_y), 0], float(best_distance), float(max(bound, best_distance))
+
+
+def circle_of_inaccessibility_vectorized(polygon, tolerance=1.0, backend=None, budget=None):
+    """
+    find largest inscribed circle of any polygon or closed curve, NumPy engine
+    :param polygon: polygon or curve object
+    :param tolerance: float, default 1.0
+    :param backend: geometryBackend backend that evaluates the curve
+    :param budget: Budget or None to refine until the tolerance is reached
+    :return: 3d point that defines the center of the largest inscribed circle of the polygon
+    """
+    if np is None:
+        raise ImportError("the vectorized engine requires NumPy")
+    # discretize well below the label tolerance so the result matches the curve based algorithm
+    rings = [curve_to_vertices(polygon, tolerance / 10.0, True, backend)]
+    return polylabel_rings(rings, tolerance, budget)
+
+
+# vertex count from which the segment index outperforms the brute force NumPy engine
+INDEX_THRESHOLD = 2000
+
+
+def circle_of_inaccessibility_indexed(polygon, tolerance=1.0, backend=None, budget=None):
+    """
+    find largest inscribed circle of any polygon or closed curve, distance queries go through a segment index
+    :param polygon: polygon or curve object
+    :param tolerance: float, default 1.0
+    :param backend: geometryBackend backend that evaluates the curve
+    :param budget: Budget or None to refine until the tolerance is reached
+    :return: 3d point that defines the center of the largest inscribed circle of the polygon
+    """
+    index = si.SegmentIndex([curve_to_vertices(polygon, tolerance / 10.0, True, backend)])
+    return circle_of_inaccessibility(index, tolerance, None, budget)
+
+
+def label_point(polygon, tolerance=1.0, backend=None, budget=None):
+    """
+    pick the fastest available engine for the vertex count of the polygon
+    :param polygon: polygon or curve object
+    :param tolerance: float, default 1.0
+    :param backend: geometryBackend backend that evaluates the curve
+    :param budget: Budget or None to refine until the tolerance is reached
+    :return: 3d point that defines the center of the largest inscribed circle of the polygon
+    """
+    return label_point_rings([curve_to_vertices(polygon, tolerance / 10.0, True, backend)], tolerance, budget)
+
+
+def label_point_rings(rings, tolerance=1.0, budget=None):
+    """
+    pick the fastest available engine for a discretized polygon, needs no Rhino and runs in worker processes
+    :param rings: list of vertex rings
+    :param tolerance: float, default 1.0
+    :param budget: Budget or None to refine until the tolerance is reached
+    :return: 3d point that defines the center of the largest inscribed circle of the polygon
+    """
+    return label_circle_rings(rings, tolerance, budget)[0]
+
+
+def label_circle_rings(rings, tolerance=1.0, budget=None):
+    """
+    see label_point_rings
+    :return: tuple (3d center point, radius, upper bound of the radius of the largest inscribed circle)
+    """
+    if np is not None and sum(len(r) for r in rings) < INDEX_THRESHOLD:
+        return inscribed_circle_rings(rings, tolerance, budget)
+    return inscribed_circle(si.SegmentIndex(rings), tolerance, None, budget)
@@ -0,0 +1,111 @@
+import sys
+import time
+import traceback
+
+import jobRunner as jr
+
+"""
+Headless self-check of jobRunner
+
+Drives jobRunner.run with a RecordingDocument: ordered commits in batches, progress after every batch, one undo
+record per run, cancel between levels and errors of the background thread re-raised on the calling thread. Runs on
+Python 2.7, IronPython and Python 3:
+
+    python runnerCheck.py
+"""
+
+
+def levels(count, delay=0.0, produced=None):
+    """
+    stand-in for the level computation
+    :param produced: list that receives every level once it is computed
+    """
+    for i in range(count):
+        time.sleep(delay)
+        if produced is not None:
+            produced.append(i)
+        yield i
+
+
+def check_batches():
+    committed = []
+    batches = []
+    document = jr.RecordingDocument()
+
+    def commit(batch):
+        batches.append(len(batch))
+        committed.extend(batch)
+
+    done, cancelled = jr.run(levels(10), commit, document, 10, batch_size=3)
+    progress = [e[1] for e in document.events if e[0] == "progress"]
+    assert (done, cancelled) == (10, False), (done, cancelled)
+    assert committed == list(range(10)), committed
+    assert max(batches) <= 3, batches
+    assert progress == sorted(progress) and progress[-1] == 10, progress
+    # begin and end enclose the whole run, inside Rhino they open and close the one undo record
+    assert document.events[0] == ("begin", 10) and document.events[-1] == ("end", 10), document.events
+    assert len([e for e in document.events if e[0] in ("begin", "end")]) == 2, document.events
+
+
+def check_cancel():
+    produced = []
+    committed = []
+    document = jr.RecordingDocument(cancel_after=2)
+    done, cancelled = jr.run(levels(50, 0.01, produced), committed.extend, document, 50, batch_size=1)
+    assert cancelled and done == 2, (done, cancelled)
+    assert committed == [0, 1], committed
+    # the background thread stops before its next level, at most the queue and one level in flight are lost
+    assert len(produced) <= done + jr.QUEUE_SIZE + 1, len(produced)
+
+
+def check_stop():
+    produced = []
+
+    def results(stopped):
+        # a producer that only hands out results at the end, like the sheet nesting
+        for i in levels(50, 0.01):
+            if stopped():
+                break
+            produced.append(i)
+        return produced
+
+    start = time.time()
+    done, cancelled = jr.run(results, lambda batch: None, jr.RecordingDocument(cancel_after=0))
+    assert cancelled and done == 0, (done, cancelled)
+    assert len(produced) < 50 and time.time() - start < 0.4, (len(produced), time.time() - start)
+
+
+def failing():
+    yield 0
+    raise KeyError("level 1")
+
+
+def check_error():
+    committed = []
+    try:
+        jr.run(failing(), committed.extend, jr.RecordingDocument())
+    except KeyError:
+        frames = [frame[2] for frame in traceback.extract_tb(sys.exc_info()[2])]
+        assert "failing" in frames, frames
+    else:
+        raise AssertionError("the error of the background thread was lost")
+    assert committed in ([], [0]), committed
+
+
+CHECKS = [check_batches, check_cancel, check_stop, check_error]
+
+
+def main():
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+            print("ok     " + check.__name__)
+        except AssertionError as e:
+            failed += 1
+            print("FAILED " + check.__name__ + ": " + str(e))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+import bisect
+import math
+
+"""
+Spatial segment index for distance and inside queries against polygon edges
+
+Built once per polygon. A distance query descends a bounding volume tree over the edges and prunes every box that
+is farther away than the closest edge found so far. For the inside test the edges are bucketed into a uniform grid,
+the test starts from the precomputed even-odd parity of the cell center and only counts the edges of the cell the
+point falls in.
+"""
+
+# number of consecutive edges in a leaf of the box tree
+LEAF_SIZE = 8
+
+
+class SegmentIndex:
+
+    def __init__(self, rings, cell_size=None):
+        """
+        index the edges of a set of rings
+        :param rings: list of vertex rings [[x, y], ...], first vertex equals the last, holes by the even-odd rule
+        :param cell_size: float, edge length of a grid cell, estimated from the segment lengths if None
+        """
+        self.segments = []
+        for ring in rings:
+            for k in range(len(ring) - 1):
+                a = ring[k]
+                b = ring[k + 1]
+                if a[0] != b[0] or a[1] != b[1]:
+                    self.segments.append((float(a[0]), float(a[1]), float(b[0]), float(b[1])))
+
+        xs = [s[0] for s in self.segments]
+        ys = [s[1] for s in self.segments]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+        self.centroid = self.calc_centroid()
+
+        width = self.bounds[2] - self.bounds[0]
+        height = self.bounds[3] - self.bounds[1]
+        if cell_size is None:
+            # a couple of segments per occupied cell, but never more cells than about four times the segments
+            total_length = 0.0
+            for ax, ay, bx, by in self.segments:
+                total_length += math.hypot(bx - ax, by - ay)
+            avg_length = total_length / len(self.segments)
+            cell_size = max(2.0 * avg_length, math.sqrt(width * height / (4.0 * len(self.segments))))
+        self.cell_size = cell_size
+        self.cols = int(width / cell_size) + 1
+        self.rows = int(height / cell_size) + 1
+
+        self.cells = {}
+        for n, (ax, ay, bx, by) in enumerate(self.segments):
+            i0, j0 = self.cell_index(min(ax, bx), min(ay, by))
+            i1, j1 = self.cell_index(max(ax, bx), max(ay, by))
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    self.cells.setdefault((i, j), []).append(n)
+
+        self.center_parity = {}
+        self.row_crossings = {}
+        self.tree = self.build_tree()
+
+    def __len__(self):
+        return len(self.segments)
+
+    def calc_centroid(self):
+        """
+        area centroid of the indexed rings
+        :return: tuple (x, y)
+        """
+        area = cx = cy = 0.0
+        for ax, ay, bx, by in self.segments:
+            cross = ax * by - bx * ay
+            area += cross
+            cx += (ax + bx) * cross
+            cy += (ay + by) * cross
+        if area == 0:
+            return (self.bounds[0] + self.bounds[2]) / 2.0, (self.bounds[1] + self.bounds[3]) / 2.0
+        return cx / (3.0 * area), cy / (3.0 * area)
+
+    def cell_index(self, x, y):
+        """
+        grid cell of a point, clamped to the grid
+        :return: tuple (i, j)
+        """
+        i = int((x - self.bounds[0]) / self.cell_size)
+        j = int((y - self.bounds[1]) / self.cell_size)
+        return min(max(i, 0), self.cols - 1), min(max(j, 0), self.rows - 1)
+
+    def cell_center(self, i, j):
+        return self.bounds[0] + (i + 0.5) * self.cell_size, self.bounds[1] + (j + 0.5) * self.cell_size
+
+    def distance(self, x, y):
+        """
+        distance of a point to the closest edge, branch and bound search through the box tree
+        :param x: float
+        :param y: float
+        :return: float
+        """
+        best_sq = float("inf")
+        stack = [(len(self.tree) - 1, 0)]
+        while stack:
+            level, n = stack.pop()
+            if box_distance_sq(x, y, self.tree[level][n]) >= best_sq:
+                continue
+            if level == 0:
+                for k in range(n * LEAF_SIZE, min((n + 1) * LEAF_SIZE, len(self.segments))):
+                    d = point_segment_distance_sq(x, y, self.segments[k])
+                    if d < best_sq:
+                        best_sq = d
+                continue
+            # visit the closer child first so the farther one is more likely to be pruned
+            children = [c for c in (2 * n, 2 * n + 1) if c < len(self.tree[level - 1])]
+            children.sort(key=lambda c: -box_distance_sq(x, y, self.tree[level - 1][c]))
+            for c in children:
+                stack.append((level - 1, c))
+        return math.sqrt(best_sq)
+
+    def build_tree(self):
+        """
+        bounding volume tree over the edges, leaves hold runs of consecutive edges which are close to each other
+        along a ring, every level above merges pairs of boxes
+        :return: list of levels, each a list of boxes (min_x, min_y, max_x, max_y)
+        """
+        leaves = []
+        for start in range(0, len(self.segments), LEAF_SIZE):
+            run = self.segments[start:start + LEAF_SIZE]
+            leaves.append((min(min(s[0], s[2]) for s in run), min(min(s[1], s[3]) for s in run),
+                           max(max(s[0], s[2]) for s in run), max(max(s[1], s[3]) for s in run)))
+        tree = [leaves]
+        while len(tree[-1]) > 1:
+            below = tree[-1]
+            level = []
+            for k in range(0, len(below), 2):
+                if k + 1 < len(below):
+                    a = below[k]
+                    b = below[k + 1]
+                    level.append((min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])))
+                else:
+                    level.append(below[k])
+            tree.append(level)
+        return tree
+
+    def crossings(self, j):
+        """
+        sorted X values where the horizontal line through the cell centers of row j crosses an edge
+        """
+        if j not in self.row_crossings:
+            y = self.cell_center(0, j)[1]
+            seen = set()
+            xs = []
+            for i in range(self.cols):
+                for n in self.cells.get((i, j), ()):
+                    if n in seen:
+                        continue
+                    seen.add(n)
+                    ax, ay, bx, by = self.segments[n]
+                    if (ay > y) != (by > y):
+                        xs.append(ax + (y - ay) * (bx - ax) / (by - ay))
+            xs.sort()
+            self.row_crossings[j] = xs
+        return self.row_crossings[j]
+
+    def cell_center_inside(self, i, j):
+        """
+        even-odd parity of a cell center, computed once per cell
+        """
+        if (i, j) not in self.center_parity:
+            cx = self.cell_center(i, j)[0]
+            xs = self.crossings(j)
+            # count crossings right of the center
+            right = len(xs) - bisect.bisect_right(xs, cx)
+            self.center_parity[(i, j)] = right % 2 == 1
+        return self.center_parity[(i, j)]
+
+    def inside(self, x, y):
+        """
+        even-odd point in polygon test
+        :param x: float
+        :param y: float
+        :return: True if the point lies inside
+        """
+        if not (self.bounds[0] <= x <= self.bounds[2] and self.bounds[1] <= y <= self.bounds[3]):
+            return False
+        i, j = self.cell_index(x, y)
+        cx, cy = self.cell_center(i, j)
+        inside = self.cell_center_inside(i, j)
+
+        # walk from the point horizontally to the center column and vertically to the center, both paths stay
+        # inside the cell, so only its edges can be crossed
+        x0, x1 = min(x, cx), max(x, cx)
+        y0, y1 = min(y, cy), max(y, cy)
+        for n in self.cells.get((i, j), ()):
+            ax, ay, bx, by = self.segments[n]
+            if (ay > y) != (by > y):
+                x_cross = ax + (y - ay) * (bx - ax) / (by - ay)
+                if x0 < x_cross <= x1:
+                    inside = not inside
+            if (ax > cx) != (bx > cx):
+                y_cross = ay + (cx - ax) * (by - ay) / (bx - ax)
+                if y0 < y_cross <= y1:
+                    inside = not inside
+        return inside
+
+    def signed_distance(self, x, y):
+        """
+        distance to the closest edge, negative if the point lies outside
+        :param x: float
+        :param y: float
+        :return: float
+        """
+        d = self.distance(x, y)
+        if self.inside(x, y):
+            return d
+        return -d
+
+
+def point_segment_distance_sq(x, y, segment):
+    """
+    squared distance between a point and a segment
+    :param segment: tuple (ax, ay, bx, by)
+    :return: float
+    """
+    ax, ay, bx, by = segment
+    dx = bx - ax
+    dy = by - ay
+    t = ((x - ax) * dx + (y - ay) * dy) / (dx * dx + dy * dy)
+    if t < 0.0:
+        t = 0.0
+    elif t > 1.0:
+        t = 1.0
+    ex = ax + t * dx - x
+    ey = ay + t * dy - y
+    return ex * ex + ey * ey
+
+
+def box_distance_sq(x, y, box):
+    """
+    squared distance between a point and an axis aligned box, 0 if the point lies inside
+    :param box: tuple (min_x, min_y, max_x, max_y)
+    :return: float
+    """
+    dx = max(box[0] - x, 0.0, x - box[2])
+    dy = max(box[1] - y, 0.0, y - box[3])
+    return dx * dx + dy * dy
@@ -0,0 +1,235 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:  # IronPython in Rhino 7 ships without NumPy
+    np = None
+
+"""
+Skyline packing of pieces onto sheets
+
+Pieces are packed as their bounding boxes. Every sheet keeps a skyline, the upper contour of what has been placed
+so far, and a piece goes where its top edge ends up lowest, turned by 90 degrees if that fits better. Pieces are
+placed largest first and a new sheet is only started when a piece fits on none of the open ones. Before packing,
+min_area_angle can turn a piece so that its bounding box is as small as possible.
+"""
+
+
+class Placement:
+
+    def __init__(self, sheet, x, y, rotated):
+        """
+        position of one packed box
+        :param sheet: index of the sheet
+        :param x: x of the lower left corner on the sheet
+        :param y: y of the lower left corner on the sheet
+        :param rotated: True if the box was turned by 90 degrees
+        """
+        self.sheet = sheet
+        self.x = x
+        self.y = y
+        self.rotated = rotated
+
+
+class Skyline:
+
+    def __init__(self, width, height):
+        """
+        empty sheet
+        :param width: usable width
+        :param height: usable height
+        """
+        self.width = width
+        self.height = height
+        self.nodes = [[0.0, 0.0, width]]  # [x, y, width] segments of the skyline, left to right
+        self.free = width * height  # area above the skyline, no box larger than this fits
+
+    def fit(self, w, h):
+        """
+        lowest position for a box of w by h
+        :return: tuple (top edge, x, y, node index) or None if the box does not fit
+        """
+        best = None
+        nodes = self.nodes
+        for i in range(len(nodes)):
+            x = nodes[i][0]
+            if x + w > self.width + 1e-9:
+                break
+            # the box rests on the highest segment below it
+            y = 0.0
+            covered = 0.0
+            j = i
+            while covered < w - 1e-9:
+                y = max(y, nodes[j][1])
+                covered += nodes[j][2] if j > i else nodes[j][0] + nodes[j][2] - x
+                j += 1
+            if y + h > self.height + 1e-9:
+                continue
+            if best is None or (y + h, x) < (best[0], best[1]):
+                best = (y + h, x, y, i)
+        return best
+
+    def place(self, i, x, y, w, h):
+        """
+        add a box at a position found by fit
+        """
+        nodes = self.nodes
+        nodes.insert(i, [x, y + h, w])
+        # shrink or drop the segments now covered by the box
+        k = i + 1
+        while k < len(nodes):
+            node = nodes[k]
+            overlap = x + w - node[0]
+            if overlap <= 0:
+                break
+            if overlap < node[2]:
+                node[0] += overlap
+                node[2] -= overlap
+                break
+            del nodes[k]
+        # merge neighbours of the same height
+        k = 0
+        while k < len(nodes) - 1:
+            if nodes[k][1] == nodes[k + 1][1]:
+                nodes[k][2] += nodes[k + 1][2]
+                del nodes[k + 1]
+            else:
+                k += 1
+        self.free = self.width * self.height - sum(node[1] * node[2] for node in nodes)
+
+
+def pack(sizes, width, height, spacing=0.0, margin=0.0, rotate=True):
+    """
+    pack boxes onto as few sheets as possible
+    :param sizes: list of (w, h)
+    :param width: sheet width
+    :param height: sheet height
+    :param spacing: gap between two boxes
+    :param margin: gap between the boxes and the sheet edge
+    :param rotate: allow turning boxes by 90 degrees
+    :return: tuple (list of Placement in the order of sizes, number of sheets)
+    """
+    # every box claims its size plus the spacing to its right and top, the sheet gets the same allowance
+    usable_w = width - 2 * margin + spacing
+    usable_h = height - 2 * margin + spacing
+    order = sorted(range(len(sizes)), key=lambda n: -max(sizes[n]))
+    sheets = []
+    placements = [None] * len(sizes)
+
+    for n in order:
+        w = sizes[n][0] + spacing
+        h = sizes[n][1] + spacing
+        options = [(w, h, False)]
+        if rotate and w != h:
+            options.append((h, w, True))
+        if not any(ow <= usable_w + 1e-9 and oh <= usable_h + 1e-9 for ow, oh, r in options):
+            raise ValueError("piece of %g x %g does not fit on a sheet of %g x %g" %
+                             (sizes[n][0], sizes[n][1], width, height))
+
+        found = None
+        for s, sheet in enumerate(sheets):
+            if sheet.free < w * h:
+                continue
+            for ow, oh, r in options:
+                fit = sheet.fit(ow, oh)
+                if fit is not None and (found is None or fit[:2] < found[1][:2]):
+                    found = (s, fit, ow, oh, r)
+            if found is not None:
+                # first sheet with room, later sheets stay free for the large pieces still to come
+                break
+        if found is None:
+            sheets.append(Skyline(usable_w, usable_h))
+            for ow, oh, r in options:
+                fit = sheets[-1].fit(ow, oh)
+                if fit is not None and (found is None or fit[:2] < found[1][:2]):
+                    found = (len(sheets) - 1, fit, ow, oh, r)
+
+        s, (top, x, y, i), ow, oh, r = found
+        sheets[s].place(i, x, y, ow, oh)
+        placements[n] = Placement(s, margin + x, margin + y, r)
+    return placements, len(sheets)
+
+
+def convex_hull(points):
+    """
+    convex hull of 2d points, monotone chain
+    :return: list of [x, y] vertices counterclockwise, not closed
+    """
+    pts = sorted(set((p[0], p[1]) for p in points))
+    if len(pts) < 3:
+        return [list(p) for p in pts]
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower = []
+    for p in pts:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = []
+    for p in reversed(pts):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return [list(p) for p in lower[:-1] + upper[:-1]]
+
+
+def min_area_angle(points):
+    """
+    rotation that gives the points the smallest axis aligned bounding box, one of the hull edges ends up
+    horizontal, NumPy evaluates all edges at once if available
+    :param points: list of [x, y]
+    :return: angle in radians between -pi/2 and pi/2
+    """
+    hull = convex_hull(points)
+    if len(hull) < 3:
+        return 0.0
+    edges = [(hull[(k + 1) % len(hull)][0] - hull[k][0], hull[(k + 1) % len(hull)][1] - hull[k][1])
+             for k in range(len(hull))]
+    angles = [-math.atan2(dy, dx) for dx, dy in edges]
+
+    if np is not None:
+        a = np.array(angles)
+        h = np.array(hull, dtype=float)
+        c = np.cos(a)[:, None]
+        s = np.sin(a)[:, None]
+        x = c * h[:, 0] - s * h[:, 1]
+        y = s * h[:, 0] + c * h[:, 1]
+        areas = (x.max(axis=1) - x.min(axis=1)) * (y.max(axis=1) - y.min(axis=1))
+        best = angles[int(np.argmin(areas))]
+    else:
+        best = 0.0
+        best_area = None
+        for angle in angles:
+            min_x, min_y, max_x, max_y = rotated_box(hull, angle)
+            area = (max_x - min_x) * (max_y - min_y)
+            if best_area is None or area < best_area:
+                best = angle
+                best_area = area
+    # keep the turn small, a quarter turn more or less gives the same box
+    while best > math.pi / 2:
+        best -= math.pi
+    while best < -math.pi / 2:
+        best += math.pi
+    return best
+
+
+def rotated_box(points, angle, center=(0.0, 0.0)):
+    """
+    bounding box of points turned by angle around center
+    :return: tuple (min_x, min_y, max_x, max_y)
+    """
+    c = math.cos(angle)
+    s = math.sin(angle)
+    xs = [center[0] + c * (p[0] - center[0]) - s * (p[1] - center[1]) for p in points]
+    ys = [center[1] + s * (p[0] - center[0]) + c * (p[1] - center[1]) for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def rotate_point(point, angle, center):
+    c = math.cos(angle)
+    s = math.sin(angle)
+    dx = point[0] - center[0]
+    dy = point[1] - center[1]
+    return [center[0] + c * dx - s * dy, center[1] + s * dx + c * dy] + list(point[2:])
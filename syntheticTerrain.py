@@ -0,0 +1,216 @@
+import math
+import random
+
+"""
+Reproducible synthetic inputs for benchmarks
+
+The terrain is the maximum of a set of analytic features placed on a grid far enough apart that their contours
+never touch. Every feature is a Gaussian profile along a wobbly radius, so its contours are known in closed form:
+hills give one ring per level, ridges stretched rings and islands a ring with a lake in the middle that turns into
+a hole once the level drops below the rim. The same seed always gives the same terrain.
+
+Rings are lists of [x, y] vertices with the first vertex repeated at the end.
+"""
+
+HILL = "hill"
+RIDGE = "ridge"
+ISLAND = "island"
+
+# lowest level as a fraction of the feature height, fixes how far the outermost contour reaches
+LOWEST_LEVEL = 0.05
+
+
+class Feature:
+
+    def __init__(self, kind, x, y, height, radius, aspect=1.0, angle=0.0, harmonics=None):
+        """
+        one analytic terrain feature
+        :param kind: HILL, RIDGE or ISLAND
+        :param x: center x
+        :param y: center y
+        :param height: peak height
+        :param radius: standard deviation of the Gaussian profile
+        :param aspect: stretch along the feature axis, 1 for round features
+        :param angle: direction of the feature axis in radians
+        :param harmonics: list of (order, amplitude, phase) that modulate the radius with the direction
+        """
+        self.kind = kind
+        self.x = x
+        self.y = y
+        self.height = height
+        self.radius = radius
+        self.aspect = aspect
+        self.angle = angle
+        self.harmonics = harmonics or []
+        # an island is a ring shaped rim around a lake
+        self.rim = 2.0 * radius if kind == ISLAND else 0.0
+
+    def wobble(self, theta):
+        return 1.0 + sum(a * math.cos(k * theta + p) for k, a, p in self.harmonics)
+
+    def local(self, x, y):
+        """
+        polar coordinates of a point in the frame of the feature, the axis is compressed by the aspect
+        """
+        dx = x - self.x
+        dy = y - self.y
+        c = math.cos(self.angle)
+        s = math.sin(self.angle)
+        u = (dx * c + dy * s) / self.aspect
+        v = -dx * s + dy * c
+        return math.hypot(u, v), math.atan2(v, u)
+
+    def elevation(self, x, y):
+        rho, theta = self.local(x, y)
+        d = (rho - self.rim) / (self.radius * self.wobble(theta))
+        return self.height * math.exp(-0.5 * d * d)
+
+    def offsets(self, z):
+        """
+        distance of the contour at height z from the rim in units of the wobbled radius
+        :return: float or None above the peak
+        """
+        if z >= self.height:
+            return None
+        return math.sqrt(2.0 * math.log(self.height / z))
+
+    def rings(self, z, vertices):
+        """
+        contours of the feature at height z
+        :param z: height
+        :param vertices: vertex count of a ring
+        :return: list of rings
+        """
+        d = self.offsets(z)
+        if d is None:
+            return []
+        result = [self.ring(self.rim, d, vertices)]
+        if self.rim > 0:
+            # the lake inside the rim, gone once the contour reaches the center
+            inner = self.ring(self.rim, -d, vertices)
+            if inner is not None:
+                result.append(inner)
+        return result
+
+    def ring(self, rim, d, vertices):
+        c = math.cos(self.angle)
+        s = math.sin(self.angle)
+        ring = []
+        for n in range(vertices):
+            theta = 2.0 * math.pi * n / vertices
+            rho = rim + d * self.radius * self.wobble(theta)
+            if rho <= 0:
+                return None
+            u = rho * math.cos(theta) * self.aspect
+            v = rho * math.sin(theta)
+            ring.append([self.x + u * c - v * s, self.y + u * s + v * c])
+        ring.append(ring[0])
+        return ring
+
+    def reach(self):
+        """
+        radius of a circle around the center that holds the lowest contour
+        """
+        amplitude = sum(abs(a) for k, a, p in self.harmonics)
+        return (self.rim + self.offsets(self.height * LOWEST_LEVEL) * self.radius * (1.0 + amplitude)) * self.aspect
+
+
+def features(count, kinds=(HILL, RIDGE, ISLAND), radius=10.0, height=100.0, seed=0):
+    """
+    random features on a grid, no two features overlap
+    :param count: number of features
+    :param kinds: feature kinds to pick from
+    :param radius: mean radius of a feature
+    :param height: mean height of a feature
+    :param seed: random seed
+    :return: list of Feature
+    """
+    rnd = random.Random(seed)
+    result = []
+    for n in range(count):
+        kind = kinds[n % len(kinds)]
+        harmonics = [(k, rnd.uniform(0.0, 0.12 / k), rnd.uniform(0.0, 2.0 * math.pi)) for k in range(2, 7)]
+        aspect = rnd.uniform(2.0, 3.0) if kind == RIDGE else 1.0
+        result.append(Feature(kind, 0.0, 0.0, height * rnd.uniform(0.6, 1.0), radius * rnd.uniform(0.7, 1.3),
+                              aspect, rnd.uniform(0.0, math.pi), harmonics))
+
+    spacing = 2.0 * max(f.reach() for f in result) * 1.05 if result else 0.0
+    columns = max(1, int(math.ceil(math.sqrt(count))))
+    for n, f in enumerate(result):
+        f.x = (n % columns + 0.5) * spacing
+        f.y = (n // columns + 0.5) * spacing
+    return result
+
+
+def extent(terrain):
+    """
+    bounding box of the terrain
+    :return: tuple (min_x, min_y, max_x, max_y)
+    """
+    reach = max(f.reach() for f in terrain)
+    return (min(f.x for f in terrain) - reach, min(f.y for f in terrain) - reach,
+            max(f.x for f in terrain) + reach, max(f.y for f in terrain) + reach)
+
+
+def elevation(terrain, x, y):
+    """
+    height of the terrain at a point
+    """
+    return max(f.elevation(x, y) for f in terrain)
+
+
+def levels(terrain, count):
+    """
+    evenly spaced contour heights from the lowest level to just below the highest peak
+    :return: list of floats, bottom first
+    """
+    top = max(f.height for f in terrain)
+    bottom = top * LOWEST_LEVEL
+    step = (top - bottom) / count
+    return [bottom + n * step for n in range(count)]
+
+
+def contours(terrain, heights, vertices=200):
+    """
+    closed contour rings of the terrain
+    :param terrain: list of Feature
+    :param heights: list of contour heights
+    :param vertices: vertex count of a ring
+    :return: list of (z, list of rings), one entry per height
+    """
+    return [(z, [r for f in terrain for r in f.rings(z, vertices)]) for z in heights]
+
+
+def boundary(terrain):
+    """
+    rectangle around the terrain
+    :return: ring
+    """
+    min_x, min_y, max_x, max_y = extent(terrain)
+    return [[min_x, min_y], [max_x, min_y], [max_x, max_y], [min_x, max_y], [min_x, min_y]]
+
+
+def cadastre(box, count, seed=0):
+    """
+    random parcels, slightly rotated rectangles of mixed sizes
+    :param box: tuple (min_x, min_y, max_x, max_y) the parcels are spread over
+    :param count: number of parcels
+    :param seed: random seed
+    :return: list of rings
+    """
+    rnd = random.Random(seed)
+    min_x, min_y, max_x, max_y = box
+    size = math.sqrt((max_x - min_x) * (max_y - min_y) / max(count, 1))
+    parcels = []
+    for n in range(count):
+        cx = rnd.uniform(min_x, max_x)
+        cy = rnd.uniform(min_y, max_y)
+        w = size * rnd.uniform(0.3, 0.9) / 2.0
+        h = size * rnd.uniform(0.3, 0.9) / 2.0
+        a = rnd.uniform(-0.2, 0.2)
+        c = math.cos(a)
+        s = math.sin(a)
+        ring = [[cx + u * c - v * s, cy + u * s + v * c] for u, v in ((-w, -h), (w, -h), (w, h), (-w, h))]
+        ring.append(ring[0])
+        parcels.append(ring)
+    return parcels
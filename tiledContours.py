@@ -0,0 +1,239 @@
+import marchingSquares as ms
+
+try:
+    import numpy as np
+except ImportError:  # IronPython in Rhino 7 ships without NumPy
+    np = None
+
+"""
+Out-of-core contouring of large elevation rasters
+
+The raster stays memory-mapped, it is read one tile at a time and every tile shares one row and one column of
+samples with its neighbours, so every grid cell belongs to exactly one tile. Segments are keyed by their global grid
+edge, a contour that leaves a tile ends on the same key the piece in the next tile starts with. Pieces wait in a
+table until both ends are joined or lie on the edge of the raster, finished contours are handed on right away.
+
+The levels are processed in passes of a few levels each, a level is complete at the end of its pass. Peak memory
+depends on the tile size and on the contours crossing the tiles still to come, not on the size of the raster.
+Requires NumPy.
+"""
+
+TILE = 1024
+LEVELS_PER_PASS = 8
+
+
+def open_raster(path, shape=None, dtype="float32", offset=0):
+    """
+    memory-map an elevation raster
+    :param path: .npy file, or a raw file of row-major samples with row 0 at the southern edge
+    :param shape: tuple (rows, columns) of a raw file
+    :param dtype: sample type of a raw file
+    :param offset: header bytes of a raw file
+    :return: read-only 2d array backed by the file
+    """
+    if path.lower().endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape, offset=offset)
+
+
+def ascii_to_npy(path, npy_path, dtype="float32"):
+    """
+    convert an ESRI ASCII grid into a .npy raster that can be memory-mapped, one row is read at a time
+    :param path: ASCII grid
+    :param npy_path: output file
+    :return: tuple (origin, cell_size) of the raster
+    """
+    header = {}
+    f = open(path)
+    try:
+        line = f.readline()
+        while line and line.split() and line.split()[0][0].isalpha():
+            key, value = line.split()[:2]
+            header[key.lower()] = float(value)
+            line = f.readline()
+        rows = int(header["nrows"])
+        columns = int(header["ncols"])
+        raster = np.lib.format.open_memmap(npy_path, mode="w+", dtype=dtype, shape=(rows, columns))
+        nodata = header.get("nodata_value")
+        # the file starts with the northern row, rows may be wrapped over several lines
+        values = []
+        row = rows - 1
+        while line and row >= 0:
+            values.extend(float(v) for v in line.split())
+            while len(values) >= columns and row >= 0:
+                samples = np.array(values[:columns])
+                if nodata is not None:
+                    samples[samples == nodata] = np.nan
+                raster[row] = samples
+                values = values[columns:]
+                row -= 1
+            line = f.readline()
+        raster.flush()
+        del raster
+    finally:
+        f.close()
+
+    cell_size = header["cellsize"]
+    if "xllcenter" in header:
+        origin = (header["xllcenter"], header["yllcenter"])
+    else:
+        origin = (header["xllcorner"] + cell_size / 2.0, header["yllcorner"] + cell_size / 2.0)
+    return origin, cell_size
+
+
+def tile_ranges(raster, tile=TILE):
+    """
+    tiles of the raster with their height range, reads the raster once
+    :param raster: 2d array
+    :param tile: cells per tile edge
+    :return: list of ((first row, last row, first column, last column), low, high), the cell ranges exclude the
+             last row and column, low and high are NaN for tiles without data
+    """
+    rows, columns = raster.shape
+    result = []
+    for r0 in range(0, rows - 1, tile):
+        r1 = min(r0 + tile, rows - 1)
+        for c0 in range(0, columns - 1, tile):
+            c1 = min(c0 + tile, columns - 1)
+            block = np.asarray(raster[r0:r1 + 1, c0:c1 + 1], dtype=float)
+            if np.isfinite(block).any():
+                result.append(((r0, r1, c0, c1), float(np.nanmin(block)), float(np.nanmax(block))))
+            else:
+                result.append(((r0, r1, c0, c1), float("nan"), float("nan")))
+    return result
+
+
+class Chain:
+
+    def __init__(self, start, end, z, xy):
+        """
+        contour piece that waits for its neighbours in the next tiles
+        :param start: key of the first vertex
+        :param end: key of the last vertex
+        :param z: height
+        :param xy: float array (vertices, 2)
+        """
+        self.start = start
+        self.end = end
+        self.z = z
+        self.parts = [xy]
+
+    def append(self, other):
+        # the first vertex of the other chain is the last one of this chain
+        self.parts.append(other.parts[0][1:])
+        self.parts.extend(other.parts[1:])
+        self.end = other.end
+
+    def line(self, closed):
+        return ms.line_points(np.concatenate(self.parts), closed)
+
+
+def on_edge(key, shape):
+    """
+    True if the keyed grid edge lies on the outline of the raster
+    """
+    rows, columns = shape
+    horizontal = rows * (columns - 1)
+    edge = key % (horizontal + (rows - 1) * columns)
+    if edge < horizontal:
+        r = edge // (columns - 1)
+        return r == 0 or r == rows - 1
+    c = (edge - horizontal) % columns
+    return c == 0 or c == columns - 1
+
+
+def iter_contours(raster, interval, base, origin, cell_size, levels, tiles):
+    """
+    contour the raster tile by tile and yield every contour as soon as it is complete
+    :param raster: 2d array, usually memory-mapped
+    :param levels: tuple (lowest, highest) level index
+    :param tiles: tile_ranges() of the raster
+    :return: generator of (z, list of [x, y] vertices)
+    """
+    table = ms.segment_table()
+    first = levels[0]
+    low_level = base + levels[0] * interval
+    high_level = base + levels[1] * interval
+    by_start = {}
+    by_end = {}
+
+    for (r0, r1, c0, c1), low, high in tiles:
+        # skip tiles without data or outside the levels of this pass, the comparisons with NaN fail
+        if not (high >= low_level and low < high_level):
+            continue
+        block = np.asarray(raster[r0:r1 + 1, c0:c1 + 1], dtype=float)
+        start, end = ms.block_segments(block, r0, c0, raster.shape, interval, base, first, table, levels)
+        if not len(start):
+            continue
+        bounds, closed, keys, x, y, z = ms.chain_vertices(start, end, raster, interval, base, first, origin,
+                                                          cell_size)
+        xy = np.column_stack((x, y))
+
+        for n in range(len(bounds) - 1):
+            b = bounds[n]
+            e = bounds[n + 1]
+            if closed[n]:
+                line = ms.line_points(xy[b:e], True)
+                if line:
+                    yield float(z[b]), line
+                continue
+
+            chain = Chain(int(keys[b]), int(keys[e - 1]), float(z[b]), xy[b:e])
+            previous = by_end.pop(chain.start, None)
+            if previous is not None:
+                del by_start[previous.start]
+                previous.append(chain)
+                chain = previous
+            following = by_start.pop(chain.end, None)
+            if following is not None:
+                del by_end[following.end]
+                chain.append(following)
+
+            if chain.start == chain.end:
+                line = chain.line(True)
+            elif on_edge(chain.start, raster.shape) and on_edge(chain.end, raster.shape):
+                line = chain.line(False)
+            else:
+                by_start[chain.start] = chain
+                by_end[chain.end] = chain
+                continue
+            if line:
+                yield chain.z, line
+
+    # pieces that end at missing data never meet a neighbour
+    for chain in by_start.values():
+        line = chain.line(False)
+        if line:
+            yield chain.z, line
+
+
+def iter_levels(raster, interval, base=0.0, origin=(0.0, 0.0), cell_size=1.0, tile=TILE,
+                levels_per_pass=LEVELS_PER_PASS):
+    """
+    all contour lines of a raster, level by level
+    :param raster: 2d array of elevations, usually memory-mapped, row 0 is the southern edge, NaN for missing values
+    :param interval: float, height difference between two levels
+    :param base: float, height of one of the levels
+    :param origin: tuple (x, y) of raster[0, 0]
+    :param cell_size: float, distance between two samples
+    :param tile: cells per tile edge
+    :param levels_per_pass: levels contoured in one pass over the tiles
+    :return: generator of (z, list of contours), bottom level first
+    """
+    if np is None:
+        raise ImportError("tiled contouring requires NumPy")
+    tiles = tile_ranges(raster, tile)
+    lows = [low for window, low, high in tiles if low == low]
+    highs = [high for window, low, high in tiles if high == high]
+    if not lows:
+        return
+    first = int(np.floor((min(lows) - base) / interval)) + 1
+    last = int(np.floor((max(highs) - base) / interval))
+
+    for k0 in range(first, last + 1, levels_per_pass):
+        k1 = min(k0 + levels_per_pass - 1, last)
+        found = {}
+        for z, line in iter_contours(raster, interval, base, origin, cell_size, (k0, k1), tiles):
+            found.setdefault(z, []).append(line)
+        for z in sorted(found):
+            yield z, found[z]
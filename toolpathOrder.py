@@ -0,0 +1,353 @@
+import math
+
+"""
+Toolpath ordering for the laser
+
+The head travels from the end of one curve to the start of the next, open curves may be run in either direction.
+A greedy tour picks the nearest free curve end from a spatial grid, then windowed 2-opt (reverse a short run of the
+tour) and Or-opt (move one to three curves elsewhere in the window) shorten the travel until nothing improves or
+the passes are used up. Both only look a fixed number of positions ahead, a pass is linear in the number of curves.
+
+A curve can be held back until others are done, e.g. the outline of a piece until its holes are cut, otherwise the
+piece falls out of the sheet before the holes are cut. The moves that would break this order are skipped.
+"""
+
+WINDOW = 25
+OR_WINDOW = 8
+PASSES = 10
+
+
+class TravelReport:
+
+    def __init__(self):
+        """
+        rapid travel of all ordered layers, in model units
+        """
+        self.before = 0.0
+        self.after = 0.0
+        self.curves = 0
+
+    def add(self, before, after, curves):
+        self.before += before
+        self.after += after
+        self.curves += curves
+
+    def saved(self):
+        """
+        :return: share of the original travel that was saved, 0 to 1
+        """
+        if self.before <= 0:
+            return 0.0
+        return (self.before - self.after) / self.before
+
+
+def distance(a, b):
+    if a is None or b is None:
+        return 0.0
+    return math.hypot(b[0] - a[0], b[1] - a[1])
+
+
+class EndGrid:
+
+    def __init__(self, points, cell_size):
+        """
+        uniform grid over curve ends, finished curves are dropped lazily
+        :param points: list of (x, y), used for the extent of the grid
+        :param cell_size: edge length of a cell
+        """
+        self.cell_size = cell_size
+        self.cells = {}
+        self.min_i = min(int(math.floor(p[0] / cell_size)) for p in points)
+        self.min_j = min(int(math.floor(p[1] / cell_size)) for p in points)
+        self.max_i = max(int(math.floor(p[0] / cell_size)) for p in points)
+        self.max_j = max(int(math.floor(p[1] / cell_size)) for p in points)
+
+    def add(self, point, curve, reverse):
+        cell = (int(math.floor(point[0] / self.cell_size)), int(math.floor(point[1] / self.cell_size)))
+        self.cells.setdefault(cell, []).append((point[0], point[1], curve, reverse))
+
+    def nearest(self, point, done):
+        """
+        closest end of a curve that is not done yet, the rings of cells around the point are searched until no
+        closer end can follow
+        :return: tuple (curve, reverse) or None if no curve is left
+        """
+        ci = int(math.floor(point[0] / self.cell_size))
+        cj = int(math.floor(point[1] / self.cell_size))
+        reach = max(ci - self.min_i, self.max_i - ci, cj - self.min_j, self.max_j - cj)
+        best = None
+        best_d = None
+        r = 0
+        while r <= reach:
+            if best is not None and best_d <= (r - 1) * self.cell_size:
+                break
+            for cell in ring_cells(ci, cj, r):
+                entries = self.cells.get(cell)
+                if not entries:
+                    continue
+                live = [e for e in entries if not done[e[2]]]
+                if len(live) < len(entries):
+                    if live:
+                        self.cells[cell] = live
+                    else:
+                        del self.cells[cell]
+                for x, y, curve, reverse in live:
+                    d = math.hypot(x - point[0], y - point[1])
+                    if best is None or d < best_d:
+                        best = (curve, reverse)
+                        best_d = d
+            r += 1
+        return best
+
+
+def ring_cells(ci, cj, r):
+    if r == 0:
+        return [(ci, cj)]
+    cells = [(ci + d, cj - r) for d in range(-r, r + 1)] + [(ci + d, cj + r) for d in range(-r, r + 1)]
+    cells += [(ci - r, cj + d) for d in range(-r + 1, r)] + [(ci + r, cj + d) for d in range(-r + 1, r)]
+    return cells
+
+
+def travel(route, flips, starts, ends, origin):
+    """
+    rapid travel of a tour
+    :param route: list of curve indices
+    :param flips: list of bool, True = the curve runs from its end to its start
+    :return: float
+    """
+    total = 0.0
+    position = origin
+    for k, flip in zip(route, flips):
+        total += distance(position, ends[k] if flip else starts[k])
+        position = starts[k] if flip else ends[k]
+    return total
+
+
+def nearest_neighbour(starts, ends, parents, origin):
+    """
+    greedy tour, always continue with the closest end of a curve whose children are done
+    :return: tuple (route, flips)
+    """
+    n = len(starts)
+    waiting = [0] * n
+    for p in parents:
+        if p is not None:
+            waiting[p] += 1
+    extent = [origin] + starts + ends
+    min_x = min(p[0] for p in extent)
+    min_y = min(p[1] for p in extent)
+    max_x = max(p[0] for p in extent)
+    max_y = max(p[1] for p in extent)
+    cell_size = max(math.sqrt((max_x - min_x) * (max_y - min_y) / max(n, 1)), (max_x - min_x) / 1000.0,
+                    (max_y - min_y) / 1000.0, 1e-9)
+    grid = EndGrid(extent, cell_size)
+
+    def release(k):
+        grid.add(starts[k], k, False)
+        if ends[k] != starts[k]:
+            grid.add(ends[k], k, True)
+
+    for k in range(n):
+        if not waiting[k]:
+            release(k)
+
+    done = [False] * n
+    route = []
+    flips = []
+    position = origin
+    for step in range(n):
+        k, flip = grid.nearest(position, done)
+        done[k] = True
+        route.append(k)
+        flips.append(flip)
+        position = starts[k] if flip else ends[k]
+        p = parents[k]
+        if p is not None:
+            waiting[p] -= 1
+            if not waiting[p]:
+                release(p)
+    return route, flips
+
+
+class Tour:
+
+    def __init__(self, route, flips, starts, ends, parents, origin):
+        """
+        tour that is improved in place, entry and exit points are kept per position
+        """
+        self.route = route
+        self.flips = flips
+        self.starts = starts
+        self.ends = ends
+        self.parents = parents
+        self.origin = origin
+        self.entries = [None] * len(route)
+        self.exits = [None] * len(route)
+        self.where = [0] * len(starts)
+        # don't-look bits, a curve is skipped until a move changes its neighbourhood
+        self.look = [True] * len(starts)
+        self.changed(0, len(route) - 1)
+
+    def changed(self, i, j):
+        """
+        update the positions i..j after a move and look at them and their neighbours again
+        """
+        for t in range(i, j + 1):
+            k = self.route[t]
+            self.where[k] = t
+            if self.flips[t]:
+                self.entries[t] = self.ends[k]
+                self.exits[t] = self.starts[k]
+            else:
+                self.entries[t] = self.starts[k]
+                self.exits[t] = self.ends[k]
+        for t in range(max(0, i - 1), min(len(self.route), j + 2)):
+            self.look[self.route[t]] = True
+
+    def must_precede(self, a, b):
+        """
+        True if a curve of the positions a[0]..a[1] has its parent in b[0]..b[1]
+        """
+        for i in range(a[0], a[1] + 1):
+            p = self.parents[self.route[i]]
+            if p is not None and b[0] <= self.where[p] <= b[1]:
+                return True
+        return False
+
+    def improve(self, window, or_window):
+        """
+        one pass of 2-opt and Or-opt over the curves that are looked at
+        :return: True if the tour got shorter
+        """
+        improved = False
+        for i in range(len(self.route)):
+            k = self.route[i]
+            if not self.look[k]:
+                continue
+            if self.two_opt(i, window) or self.or_opt(i, or_window):
+                improved = True
+            else:
+                self.look[k] = False
+        return improved
+
+    def two_opt(self, i, window):
+        """
+        reverse the run from position i to one of the next window positions, a run of one curve just changes its
+        direction
+        :return: True if a run was reversed
+        """
+        hypot = math.hypot
+        entries = self.entries
+        exits = self.exits
+        n = len(entries)
+        a = exits[i - 1] if i > 0 else self.origin
+        s = entries[i]
+        d_as = hypot(s[0] - a[0], s[1] - a[1])
+        for j in range(i, min(n, i + window)):
+            e = exits[j]
+            gain = d_as - hypot(e[0] - a[0], e[1] - a[1])
+            if j + 1 < n:
+                b = entries[j + 1]
+                gain += hypot(b[0] - e[0], b[1] - e[1]) - hypot(b[0] - s[0], b[1] - s[1])
+            if gain > 1e-9 and not self.must_precede((i, j), (i, j)):
+                self.route[i:j + 1] = self.route[i:j + 1][::-1]
+                self.flips[i:j + 1] = [not f for f in self.flips[i:j + 1][::-1]]
+                self.changed(i, j)
+                return True
+        return False
+
+    def or_opt(self, i, window):
+        """
+        move the run of one to three curves starting at position i up to window positions forward or backward, in
+        either direction
+        :return: True if a run was moved
+        """
+        hypot = math.hypot
+        entries = self.entries
+        exits = self.exits
+        n = len(entries)
+        for length in (1, 2, 3):
+            j = i + length - 1
+            if j >= n:
+                break
+            a = exits[i - 1] if i > 0 else self.origin
+            s = entries[i]
+            e = exits[j]
+            removal = hypot(s[0] - a[0], s[1] - a[1])
+            if j + 1 < n:
+                b = entries[j + 1]
+                removal += hypot(b[0] - e[0], b[1] - e[1]) - hypot(b[0] - a[0], b[1] - a[1])
+            if removal <= 1e-9:
+                continue
+
+            best = None
+            for p in range(max(-1, i - 1 - window), min(n, j + 1 + window)):
+                if i - 1 <= p <= j:
+                    continue
+                # insert between the positions p and p + 1
+                c = exits[p] if p >= 0 else self.origin
+                d = entries[p + 1] if p + 1 < n else None
+                for first, last, flip in ((s, e, False), (e, s, True)):
+                    gain = removal - hypot(first[0] - c[0], first[1] - c[1])
+                    if d is not None:
+                        gain += hypot(d[0] - c[0], d[1] - c[1]) - hypot(d[0] - last[0], d[1] - last[1])
+                    if gain > 1e-9 and (best is None or gain > best[0]):
+                        best = (gain, p, flip)
+            if best is not None and self.move_allowed(i, j, best[1], best[2]):
+                self.move(i, j, best[1], best[2])
+                return True
+        return False
+
+    def move_allowed(self, i, j, p, flip):
+        if flip and self.must_precede((i, j), (i, j)):
+            return False
+        if p > j:
+            # the run moves behind p, none of its parents may lie in between
+            return not self.must_precede((i, j), (j + 1, p))
+        # the run moves in front of the curves p + 1 .. i - 1, none of them may have its parent in the run
+        return not self.must_precede((p + 1, i - 1), (i, j))
+
+    def move(self, i, j, p, flip):
+        run = self.route[i:j + 1]
+        run_flips = self.flips[i:j + 1]
+        if flip:
+            run = run[::-1]
+            run_flips = [not f for f in run_flips[::-1]]
+        if p > j:
+            self.route[i:p + 1] = self.route[j + 1:p + 1] + run
+            self.flips[i:p + 1] = self.flips[j + 1:p + 1] + run_flips
+            self.changed(i, p)
+        else:
+            self.route[p + 1:j + 1] = run + self.route[p + 1:i]
+            self.flips[p + 1:j + 1] = run_flips + self.flips[p + 1:i]
+            self.changed(p + 1, j)
+
+
+def order(starts, ends, parents=None, origin=(0.0, 0.0), window=WINDOW, or_window=OR_WINDOW, passes=PASSES):
+    """
+    order and orient curves for short rapid travel
+    :param starts: list of (x, y) start points
+    :param ends: list of (x, y) end points, equal to the start points for closed curves
+    :param parents: list with the index of the curve that has to wait for every curve or None, the parents must not
+                    form a cycle
+    :param origin: (x, y) of the head before the first curve
+    :param window: tour positions 2-opt looks ahead
+    :param or_window: tour positions Or-opt moves a run
+    :param passes: improvement passes at most
+    :return: tuple (list of (curve index, reverse) in cutting order, travel before, travel after)
+    """
+    n = len(starts)
+    if not n:
+        return [], 0.0, 0.0
+    starts = [(p[0], p[1]) for p in starts]
+    ends = [(p[0], p[1]) for p in ends]
+    parents = parents or [None] * n
+    before = travel(range(n), [False] * n, starts, ends, origin)
+
+    route, flips = nearest_neighbour(starts, ends, parents, origin)
+    tour = Tour(route, flips, starts, ends, parents, origin)
+    for step in range(passes):
+        if not tour.improve(window, or_window):
+            break
+    after = travel(tour.route, tour.flips, starts, ends, origin)
+    return list(zip(tour.route, tour.flips)), before, after
@@ -0,0 +1,153 @@
+import atexit
+import sys
+import threading
+
+"""
+Worker pools for the level-parallel parts of the isohypsen commands
+
+IronPython (Rhino 7) has no GIL, threads run truly parallel there and are the only pool available. On CPython the
+pure-geometry jobs go to a process pool, everything that touches RhinoCommon objects stays on threads. The process
+pool is started on the first process_map call and reused by the later ones until close_pool, so a command pays the
+start-up of the processes once and not once per batch of levels.
+"""
+
+IRONPYTHON = sys.platform == "cli"
+
+if IRONPYTHON:
+    multiprocessing = None
+else:
+    try:
+        import multiprocessing
+    except ImportError:
+        multiprocessing = None
+
+# process pool shared by the process_map calls of a command, see shared_pool and close_pool
+process_pool = None
+pool_workers = 0
+pool_lock = threading.Lock()
+
+
+def cpu_count():
+    """
+    number of logical cores
+    :return: int
+    """
+    if IRONPYTHON:
+        import System
+        return System.Environment.ProcessorCount
+    if multiprocessing is not None:
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            pass
+    return 1
+
+
+def thread_map(func, args_list, workers=None):
+    """
+    call func(*args) for every entry of args_list on a pool of threads
+    :param func: function
+    :param args_list: list of argument tuples
+    :param workers: number of threads, defaults to the number of cores
+    :return: list of results in the order of args_list
+    """
+    if workers is None:
+        workers = cpu_count()
+    workers = max(1, min(workers, len(args_list)))
+    if workers == 1:
+        return [func(*args) for args in args_list]
+
+    results = [None] * len(args_list)
+    errors = []
+    lock = threading.Lock()
+    pending = list(range(len(args_list)))
+    pending.reverse()
+
+    def work():
+        while True:
+            with lock:
+                if not pending or errors:
+                    return
+                n = pending.pop()
+            try:
+                results[n] = func(*args_list[n])
+            except Exception:
+                with lock:
+                    errors.append(sys.exc_info())
+                return
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0][1]
+    return results
+
+
+def call_star(job):
+    """
+    unpack a (func, args) job inside a worker process
+    """
+    func, args = job
+    return func(*args)
+
+
+def shared_pool(workers):
+    """
+    process pool with at least workers processes, started on first use and kept for the following calls
+    :param workers: number of processes
+    :return: multiprocessing.Pool
+    """
+    global process_pool, pool_workers
+    with pool_lock:
+        if process_pool is not None and pool_workers >= workers:
+            return process_pool
+        old = process_pool
+        process_pool = multiprocessing.Pool(workers)
+        pool_workers = workers
+    if old is not None:
+        old.close()
+        old.join()
+    return process_pool
+
+
+def close_pool():
+    """
+    stop the shared process pool, called when a command finishes, the next process_map starts a new one
+    """
+    global process_pool, pool_workers
+    with pool_lock:
+        pool = process_pool
+        process_pool = None
+        pool_workers = 0
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+# a headless caller that never closes the pool must not leave its processes behind
+atexit.register(close_pool)
+
+
+def process_map(func, args_list, workers=None):
+    """
+    call func(*args) for every entry of args_list on the shared pool of processes, falls back to threads where
+    processes are not available, func and args have to be picklable
+    :param func: module level function
+    :param args_list: list of argument tuples
+    :param workers: number of processes, defaults to the number of cores
+    :return: list of results in the order of args_list
+    """
+    if workers is None:
+        workers = cpu_count()
+    workers = max(1, workers)
+    if multiprocessing is None or min(workers, len(args_list)) == 1:
+        return thread_map(func, args_list, workers)
+    try:
+        # sized for the requested workers and not for this call, so a short last batch reuses the pool
+        pool = shared_pool(workers)
+    except (OSError, ImportError, NotImplementedError):
+        return thread_map(func, args_list, workers)
+    return pool.map(call_star, [(func, args) for args in args_list])